@@ -0,0 +1,77 @@
+from django import forms
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin import helpers
+from django.core.cache import caches
+from django.template.response import TemplateResponse
+
+from .models import CacheStatistics
+
+
+class BulkActionMixin:
+    """Страница подтверждения для массовых действий админки."""
+
+    def confirm_bulk_action(self, request, queryset, title,
+                            form_class=forms.Form):
+        """Проверенная форма действия или страница подтверждения.
+
+        Возвращает пару ``(form, response)``: пока действие не
+        подтверждено, ``form`` равна None, а ``response`` нужно вернуть
+        из действия.
+        """
+        if 'apply' in request.POST:
+            form = form_class(request.POST)
+            if form.is_valid():
+                return form, None
+        else:
+            form = form_class()
+        context = {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'opts': self.model._meta,
+            'form': form,
+            'action': request.POST['action'],
+            'select_across': request.POST.get('select_across', '0'),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'count': queryset.count(),
+        }
+        return None, TemplateResponse(
+            request, 'admin/bulk_action.html', context)
+
+
+class CacheStatisticsAdmin(admin.ModelAdmin):
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        backends = []
+        for alias in settings.CACHES:
+            cache = caches[alias]
+            if not hasattr(cache, 'get_stats'):
+                continue
+            stats = cache.get_stats()
+            for prefix, counters in stats['prefixes'].items():
+                requests = counters['hits'] + counters['misses']
+                counters['hit_ratio'] = (
+                    counters['hits'] / requests if requests else None)
+            stats['prefixes'] = sorted(stats['prefixes'].items())
+            backends.append((alias, stats))
+        context = {
+            **self.admin_site.each_context(request),
+            'title': self.model._meta.verbose_name_plural,
+            'opts': self.model._meta,
+            'backends': backends,
+            **(extra_context or {}),
+        }
+        return TemplateResponse(
+            request, 'admin/core/cache_statistics.html', context)
+
+
+admin.site.register(CacheStatistics, CacheStatisticsAdmin)
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .signals import connect_cached_models, connect_user_cache
+        connect_cached_models()
+        connect_user_cache()
@@ -0,0 +1,436 @@
+"""Кеши с ограничением по объёму в байтах и вытеснением по LRU.
+
+``LRUCache`` хранит записи в памяти процесса, ``SQLiteLRUCache`` —
+в файле SQLite, общем для всех процессов сервера. Оба считают попадания,
+промахи и вытеснения отдельно для каждого префикса ключа (часть ключа
+до первого ``:``), статистика видна в админке.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+STATS_EVENTS = ('hits', 'misses', 'evictions')
+OTHER_PREFIX = 'other'
+
+# Хранилища и статистика общие для всех экземпляров бэкенда с одним
+# LOCATION в процессе, как у LocMemCache.
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def key_prefix(key):
+    """Префикс исходного ключа, по которому группируется статистика."""
+    for separator in (':', '|'):
+        head, found, _ = key.partition(separator)
+        if found and head:
+            return head
+    return OTHER_PREFIX
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(Counter)
+
+    def record(self, prefix, event, count=1):
+        with self._lock:
+            self._counters[prefix][event] += count
+
+    def pop(self):
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(Counter)
+        return counters
+
+    def snapshot(self):
+        with self._lock:
+            return {prefix: {event: counter[event] for event in STATS_EVENTS}
+                    for prefix, counter in self._counters.items()}
+
+
+class _MemoryStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.stats = CacheStats()
+
+
+class LRUCache(BaseCache):
+    """Кеш в памяти процесса с бюджетом ``OPTIONS['MAX_BYTES']`` байт."""
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._max_bytes = int(options.get('MAX_BYTES', DEFAULT_MAX_BYTES))
+        with _stores_lock:
+            self._store = _stores.setdefault(name, _MemoryStore())
+
+    def _lookup(self, key):
+        """Запись по готовому ключу или None; вызывать под блокировкой."""
+        entry = self._store.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            self._delete(key)
+            return None
+        self._store.entries.move_to_end(key)
+        return entry
+
+    def _set(self, key, pickled, expires, prefix):
+        """Кладёт запись, вытесняя старые сверх бюджета; под блокировкой."""
+        self._delete(key)
+        size = len(key) + len(pickled)
+        if size > self._max_bytes:
+            return
+        entries = self._store.entries
+        while entries and self._store.size + size > self._max_bytes:
+            old_key, (old_pickled, _, old_prefix) = entries.popitem(
+                last=False)
+            self._store.size -= len(old_key) + len(old_pickled)
+            self._store.stats.record(old_prefix, 'evictions')
+        entries[key] = (pickled, expires, prefix)
+        self._store.size += size
+
+    def _delete(self, key):
+        entry = self._store.entries.pop(key, None)
+        if entry is None:
+            return False
+        self._store.size -= len(key) + len(entry[0])
+        return True
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        prefix, key = key_prefix(key), self.make_key(key, version=version)
+        self.validate_key(key)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._store.lock:
+            if self._lookup(key) is not None:
+                return False
+            self._set(key, pickled, self.get_backend_timeout(timeout), prefix)
+            return True
+
+    def get(self, key, default=None, version=None):
+        prefix, key = key_prefix(key), self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._store.lock:
+            entry = self._lookup(key)
+        if entry is None:
+            self._store.stats.record(prefix, 'misses')
+            return default
+        self._store.stats.record(prefix, 'hits')
+        return pickle.loads(entry[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        prefix, key = key_prefix(key), self.make_key(key, version=version)
+        self.validate_key(key)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._store.lock:
+            self._set(key, pickled, self.get_backend_timeout(timeout), prefix)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._store.lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return False
+            self._store.entries[key] = (
+                entry[0], self.get_backend_timeout(timeout), entry[2])
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        prefix, key = key_prefix(key), self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._store.lock:
+            entry = self._lookup(key)
+            if entry is None:
+                raise ValueError(f"Key '{key}' not found")
+            new_value = pickle.loads(entry[0]) + delta
+            pickled = pickle.dumps(new_value, self.pickle_protocol)
+            self._set(key, pickled, entry[1], prefix)
+        return new_value
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._store.lock:
+            return self._lookup(key) is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._store.lock:
+            self._delete(key)
+
+    def clear(self):
+        with self._store.lock:
+            self._store.entries.clear()
+            self._store.size = 0
+
+    def get_stats(self):
+        return {
+            'backend': 'LRU в памяти процесса',
+            'size': self._store.size,
+            'max_bytes': self._max_bytes,
+            'entries': len(self._store.entries),
+            'prefixes': self._store.stats.snapshot(),
+        }
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entry ('
+    ' key TEXT PRIMARY KEY, prefix TEXT NOT NULL, value BLOB NOT NULL,'
+    ' size INTEGER NOT NULL, expires REAL, accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_entry_accessed'
+    ' ON cache_entry (accessed)',
+    'CREATE TABLE IF NOT EXISTS cache_size (total INTEGER NOT NULL)',
+    'INSERT INTO cache_size (total)'
+    ' SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM cache_size)',
+    'CREATE TRIGGER IF NOT EXISTS cache_entry_insert'
+    ' AFTER INSERT ON cache_entry'
+    ' BEGIN UPDATE cache_size SET total = total + NEW.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_entry_update'
+    ' AFTER UPDATE OF size ON cache_entry'
+    ' BEGIN UPDATE cache_size SET total = total + NEW.size - OLD.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_entry_delete'
+    ' AFTER DELETE ON cache_entry'
+    ' BEGIN UPDATE cache_size SET total = total - OLD.size; END',
+    'CREATE TABLE IF NOT EXISTS cache_stats ('
+    ' prefix TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0,'
+    ' misses INTEGER NOT NULL DEFAULT 0,'
+    ' evictions INTEGER NOT NULL DEFAULT 0)',
+)
+# По умолчанию время последнего обращения обновляется не чаще раза
+# в секунду, чтобы чтения горячих ключей не превращались в постоянные
+# записи; ``OPTIONS['ACCESS_RESOLUTION'] = 0`` даёт точный LRU.
+ACCESS_RESOLUTION = 1
+STATS_FLUSH_INTERVAL = 5
+EVICTION_BATCH = 64
+
+
+class SQLiteLRUCache(BaseCache):
+    """Общий для процессов кеш в файле SQLite ``LOCATION``.
+
+    Объём записей ограничен ``OPTIONS['MAX_BYTES']``, при превышении
+    удаляются записи, к которым дольше всего не обращались.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_bytes = int(options.get('MAX_BYTES', DEFAULT_MAX_BYTES))
+        self._access_resolution = float(
+            options.get('ACCESS_RESOLUTION', ACCESS_RESOLUTION))
+        self._local = threading.local()
+        with _stores_lock:
+            self._stats = _stores.setdefault(
+                ('sqlite-stats', location), CacheStats())
+        self._stats_flushed = time.monotonic()
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
+
+    def _record(self, prefix, event, count=1):
+        self._stats.record(prefix, event, count)
+        if time.monotonic() - self._stats_flushed > STATS_FLUSH_INTERVAL:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        self._stats_flushed = time.monotonic()
+        rows = [(prefix, counter['hits'], counter['misses'],
+                 counter['evictions'])
+                for prefix, counter in self._stats.pop().items()]
+        self._connection.executemany(
+            'INSERT INTO cache_stats (prefix, hits, misses, evictions)'
+            ' VALUES (?, ?, ?, ?) ON CONFLICT (prefix) DO UPDATE SET'
+            ' hits = hits + excluded.hits,'
+            ' misses = misses + excluded.misses,'
+            ' evictions = evictions + excluded.evictions', rows)
+
+    def _fetch(self, key, now):
+        row = self._connection.execute(
+            'SELECT value, expires, accessed FROM cache_entry WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            self._connection.execute(
+                'DELETE FROM cache_entry WHERE key = ?', (key,))
+            return None
+        if now - accessed >= self._access_resolution:
+            self._connection.execute(
+                'UPDATE cache_entry SET accessed = ? WHERE key = ?',
+                (now, key))
+        return value
+
+    def _write(self, key, prefix, pickled, timeout, only_new=False):
+        size = len(key) + len(pickled)
+        if size > self._max_bytes:
+            return False
+        now = time.time()
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if only_new and self._fetch(key, now) is not None:
+                connection.execute('COMMIT')
+                return False
+            connection.execute(
+                'INSERT INTO cache_entry'
+                ' (key, prefix, value, size, expires, accessed)'
+                ' VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET'
+                ' prefix = excluded.prefix, value = excluded.value,'
+                ' size = excluded.size, expires = excluded.expires,'
+                ' accessed = excluded.accessed',
+                (key, prefix, pickled, size,
+                 self.get_backend_timeout(timeout), now))
+            self._evict()
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return True
+
+    def _evict(self):
+        connection = self._connection
+        total, = connection.execute('SELECT total FROM cache_size').fetchone()
+        while total > self._max_bytes:
+            victims = connection.execute(
+                'SELECT key, prefix, size FROM cache_entry'
+                ' ORDER BY accessed LIMIT ?', (EVICTION_BATCH,)).fetchall()
+            evicted = Counter()
+            for key, prefix, size in victims:
+                connection.execute(
+                    'DELETE FROM cache_entry WHERE key = ?', (key,))
+                evicted[prefix] += 1
+                total -= size
+                if total <= self._max_bytes:
+                    break
+            for prefix, count in evicted.items():
+                self._stats.record(prefix, 'evictions', count)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        prefix, key = key_prefix(key), self.make_key(key, version=version)
+        self.validate_key(key)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        return self._write(key, prefix, pickled, timeout, only_new=True)
+
+    def get(self, key, default=None, version=None):
+        prefix, key = key_prefix(key), self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self._fetch(key, time.time())
+        if value is None:
+            self._record(prefix, 'misses')
+            return default
+        self._record(prefix, 'hits')
+        return pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        made_keys = {self.make_key(key, version=version): key
+                     for key in keys}
+        for key in made_keys:
+            self.validate_key(key)
+        now = time.time()
+        rows = self._connection.execute(
+            'SELECT key, value FROM cache_entry WHERE key IN ({})'
+            ' AND (expires IS NULL OR expires > ?)'.format(
+                ', '.join('?' * len(made_keys))),
+            (*made_keys, now)).fetchall()
+        found = {made_keys[key]: pickle.loads(value) for key, value in rows}
+        for key in keys:
+            self._record(key_prefix(key),
+                         'hits' if key in found else 'misses')
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        prefix, key = key_prefix(key), self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(key, prefix,
+                    pickle.dumps(value, self.pickle_protocol), timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self._connection.execute(
+            'UPDATE cache_entry SET expires = ? WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()))
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            value = self._fetch(key, time.time())
+            if value is None:
+                raise ValueError(f"Key '{key}' not found")
+            new_value = pickle.loads(value) + delta
+            pickled = pickle.dumps(new_value, self.pickle_protocol)
+            connection.execute(
+                'UPDATE cache_entry SET value = ?, size = ? WHERE key = ?',
+                (pickled, len(key) + len(pickled), key))
+            self._evict()
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return new_value
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._connection.execute(
+            'SELECT 1 FROM cache_entry WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._connection.execute(
+            'DELETE FROM cache_entry WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache_entry')
+
+    def get_stats(self):
+        self._flush_stats()
+        connection = self._connection
+        total, = connection.execute('SELECT total FROM cache_size').fetchone()
+        entries, = connection.execute(
+            'SELECT count(*) FROM cache_entry').fetchone()
+        prefixes = {
+            prefix: dict(zip(STATS_EVENTS, counters))
+            for prefix, *counters in connection.execute(
+                'SELECT prefix, hits, misses, evictions FROM cache_stats')
+        }
+        return {
+            'backend': f'LRU в SQLite ({self._path})',
+            'size': total,
+            'max_bytes': self._max_bytes,
+            'entries': entries,
+            'prefixes': prefixes,
+        }
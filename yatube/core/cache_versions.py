@@ -0,0 +1,59 @@
+"""Версии для сброса групп записей в кеше.
+
+Ключи зависимых записей включают текущие версии своих имён (тегов
+страниц, таблиц БД). Смена версии делает все такие записи
+недостижимыми, их не нужно искать и удалять по одной.
+"""
+import hashlib
+import threading
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+_deferred = threading.local()
+
+
+def _version_key(prefix, name):
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return f'{prefix}:version:{digest}'
+
+
+def get_versions(prefix, names):
+    """Текущие версии ``names``; недостающие создаются."""
+    keys = [_version_key(prefix, name) for name in names]
+    versions = cache.get_many(keys) if keys else {}
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(prefix, names):
+    """Меняет версии ``names``, сбрасывая зависящие от них записи."""
+    keys = {_version_key(prefix, name) for name in names}
+    pending = getattr(_deferred, 'keys', None)
+    if pending is not None:
+        pending.update(keys)
+    elif keys:
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+
+@contextmanager
+def deferred_invalidation():
+    """Копит смены версий и выполняет их одним вызовом на выходе.
+
+    Для массовых операций, где сигналы каждого объекта меняли бы одни
+    и те же версии снова и снова.
+    """
+    if getattr(_deferred, 'keys', None) is not None:
+        yield
+        return
+    _deferred.keys = set()
+    try:
+        yield
+    finally:
+        keys, _deferred.keys = _deferred.keys, None
+        if keys:
+            cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
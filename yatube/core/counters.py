@@ -0,0 +1,91 @@
+"""Счётчики в памяти процесса с отложенной записью в БД.
+
+``add`` только увеличивает число в словаре под блокировкой. Фоновый
+поток раз в ``interval`` секунд (или раньше, если накопилось
+``max_pending`` событий) передаёт накопленное функции записи, сгруппировав
+ключи по приращению: одно ``UPDATE ... WHERE pk IN (...)`` на группу
+вместо запроса на каждое событие. Процессы считают независимо, их
+приращения складываются в БД.
+
+При остановке процесса накопленное записывается, при падении теряется
+не больше ``interval`` секунд и не больше ``max_pending`` событий.
+Неудачная запись тоже теряет свою пачку: повтор мог бы посчитать дважды
+уже записанное. Тесты отбрасывают накопленное через ``discard_all``
+(см. ``core.test_runner``), чтобы при выходе оно не ушло в рабочую БД.
+"""
+import atexit
+import logging
+import threading
+import weakref
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 5
+MAX_PENDING = 10000
+
+_counters = weakref.WeakSet()
+
+
+class BufferedCounter:
+    def __init__(self, write, interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.write = write
+        self.interval = interval
+        self.max_pending = max_pending
+        self._counts = Counter()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        _counters.add(self)
+        atexit.register(self.flush)
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self._counts[key] += amount
+            self._pending += amount
+            if self._pending >= self.max_pending:
+                self._wakeup.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='buffered-counter', daemon=True)
+                self._thread.start()
+
+    def pending(self, key):
+        """Ещё не записанное приращение ``key``."""
+        with self._lock:
+            return self._counts.get(key, 0)
+
+    def clear(self):
+        """Отбрасывает накопленное, не записывая."""
+        with self._lock:
+            self._counts.clear()
+            self._pending = 0
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать счётчики')
+
+    def flush(self):
+        """Передаёт накопленное ``write({приращение: [ключи]})``."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._pending = 0
+        if not counts:
+            return
+        groups = {}
+        for key, amount in counts.items():
+            groups.setdefault(amount, []).append(key)
+        self.write(groups)
+
+
+def discard_all():
+    """Отбрасывает накопленное во всех счётчиках процесса."""
+    for counter in list(_counters):
+        counter.clear()
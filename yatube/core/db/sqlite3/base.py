@@ -0,0 +1,89 @@
+"""SQLite, настроенный на одновременные чтение и запись.
+
+Журнал WAL позволяет читать во время записи, ``busy_timeout`` заставляет
+ждать освобождения базы вместо немедленной ошибки, а транзакции сразу
+берут блокировку на запись (``BEGIN IMMEDIATE``) и не падают, когда
+после чтения нужно что-то записать. Если база занята дольше таймаута,
+запрос повторяется с растущей паузой.
+
+Параметры в ``OPTIONS``: ``pragmas`` дополняет ``DEFAULT_PRAGMAS``,
+``retries`` — число повторов, ``timeout`` — сколько секунд ждать
+блокировку. ``pragmas = {'foreign_keys': 'OFF'}`` выключает проверку
+внешних ключей для баз, ссылающихся на строки других баз.
+"""
+import sqlite3
+import time
+
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # Отрицательное значение — размер в КиБ, а не в страницах.
+    'cache_size': -16 * 1024,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+DEFAULT_TIMEOUT = 20
+DEFAULT_RETRIES = 3
+RETRY_DELAY = 0.1
+
+
+def is_locked_error(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_locked(func, retries=DEFAULT_RETRIES):
+    """Вызывает ``func``, повторяя его, пока база заблокирована."""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except sqlite3.OperationalError as error:
+            if attempt == retries or not is_locked_error(error):
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    retries = DEFAULT_RETRIES
+
+    def execute(self, query, params=None):
+        execute = super().execute
+        return retry_locked(lambda: execute(query, params), self.retries)
+
+    def executemany(self, query, param_list):
+        executemany = super().executemany
+        param_list = list(param_list)
+        return retry_locked(
+            lambda: executemany(query, param_list), self.retries)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **kwargs.pop('pragmas', {})}
+        self.retries = kwargs.pop('retries', DEFAULT_RETRIES)
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        self.pragmas['busy_timeout'] = int(kwargs['timeout'] * 1000)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def enable_constraint_checking(self):
+        # Миграции включают проверку внешних ключей обратно, даже если
+        # она выключена в ``pragmas``, как на шардах.
+        if str(self.pragmas.get('foreign_keys', 'ON')).upper() != 'OFF':
+            super().enable_constraint_checking()
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SQLiteCursorWrapper)
+        cursor.retries = self.retries
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
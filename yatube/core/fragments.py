@@ -0,0 +1,78 @@
+"""Персональные фрагменты внутри общей закешированной страницы.
+
+Страница рендерится один раз для всех пользователей («оболочка»), а
+зависящие от пользователя куски (шапка, кнопка подписки, управление
+постом) вместо HTML оставляют в ней метки. После выдачи оболочки из кеша
+метки заменяются фрагментами, отрендеренными для текущего запроса.
+
+Фрагмент, который повторяется на странице (например, в каждой карточке
+поста), может загружать данные для всех своих копий сразу: функция
+``prefetch`` получает аргументы всех меток с его именем, а её результат
+передаётся каждой копии как ``prefetched``.
+"""
+import base64
+import json
+import re
+
+from django.template.loader import render_to_string
+
+PLACEHOLDER = '<!--fragment:{name}:{args}-->'
+PLACEHOLDER_RE = re.compile(rb'<!--fragment:([\w-]+):([\w=-]*)-->')
+
+_registry = {}
+
+
+def register(name, template_name, prefetch=None):
+    """Регистрирует фрагмент.
+
+    Декорируемая функция получает запрос и аргументы из шаблона
+    и возвращает контекст для ``template_name``. С ``prefetch`` она
+    получает ещё и ``prefetched`` — результат
+    ``prefetch(request, [аргументы каждой копии])``.
+    """
+    def decorator(get_context):
+        _registry[name] = (template_name, get_context, prefetch)
+        return get_context
+    return decorator
+
+
+def placeholder(name, kwargs):
+    args = base64.urlsafe_b64encode(json.dumps(kwargs).encode()).decode()
+    return PLACEHOLDER.format(name=name, args=args)
+
+
+def render_fragment(request, name, kwargs, prefetched=None):
+    template_name, get_context, prefetch = _registry[name]
+    if prefetch is not None:
+        if prefetched is None:
+            prefetched = prefetch(request, [kwargs])
+        kwargs = {**kwargs, 'prefetched': prefetched}
+    return render_to_string(
+        template_name, get_context(request, **kwargs), request=request)
+
+
+def fill_fragments(request, content):
+    """Заменяет метки в ``content`` фрагментами для ``request``."""
+    calls = [
+        (match.group(1).decode(),
+         json.loads(base64.urlsafe_b64decode(match.group(2))))
+        for match in PLACEHOLDER_RE.finditer(content)
+    ]
+    if not calls:
+        return content
+    prefetched = {}
+    for name in {name for name, _ in calls}:
+        prefetch = _registry[name][2]
+        if prefetch is not None:
+            prefetched[name] = prefetch(
+                request, [kwargs for other, kwargs in calls if other == name])
+    rendered = iter([
+        render_fragment(request, name, kwargs, prefetched.get(name)).encode()
+        for name, kwargs in calls
+    ])
+    return PLACEHOLDER_RE.sub(lambda match: next(rendered), content)
+
+
+@register('header', 'includes/header.html')
+def header(request):
+    return {}
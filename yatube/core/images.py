@@ -0,0 +1,142 @@
+"""Картинки любого размера по подписанной ссылке.
+
+Ссылка (тег ``resized_url``) содержит имя исходника, размеры, обрезку
+и формат и подписана ``SECRET_KEY``: без подписи новый размер не
+заказать. Вариант один раз делает sorl в пуле потоков, дальше он лежит
+на диске среди миниатюр, имя варианта запоминается в кеше. Исходники
+названы по содержимому (см. ``core.storage``), поэтому вариант по
+ссылке не меняется никогда и отдаётся с ``immutable`` и ETag.
+
+Исходник открывается через то же хранилище, что у картинок постов:
+sorl запоминает варианты по имени и классу хранилища, и только так
+``core.storage.delete_unreferenced`` и ``gc_media`` их находят. Когда
+исходник удаляется, ``forget`` сбрасывает запомненные имена вариантов.
+
+Готовятся одновременно не больше ``RESIZE_PENDING`` новых вариантов,
+на остальные запросы, как и на не готовый за ``RESIZE_TIMEOUT`` секунд
+вариант, выбрасывается ``ResizeBusy``. Исходник, который не читается
+как картинка, даёт ``NotAnImage``.
+"""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.signing import Signer
+from django.db import connection
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.http import urlencode
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from core.cache_versions import bump_versions, get_versions
+from core.storage import ContentAddressedStorage
+
+RESIZE_WORKERS = 2
+RESIZE_PENDING = 8
+RESIZE_TIMEOUT = 30
+RESIZE_MAX_SIDE = 2000
+RESIZE_CACHE_PREFIX = 'resized'
+RESIZE_FORMATS = {'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+RESIZE_CROPS = ('', 'center', 'top', 'bottom', 'left', 'right')
+
+_signer = Signer(salt='core.images')
+_sources = ContentAddressedStorage()
+_pool = ThreadPoolExecutor(max_workers=RESIZE_WORKERS)
+_slots = threading.BoundedSemaphore(RESIZE_PENDING)
+_pending = {}
+_lock = threading.RLock()
+
+
+class ResizeBusy(Exception):
+    """Слишком много вариантов готовится одновременно."""
+
+
+class NotAnImage(Exception):
+    """Исходник не удалось прочитать как картинку."""
+
+
+def variant_key(name, width, height, crop, fmt):
+    return f'{name}:{width}x{height}:{crop}:{fmt}'
+
+
+def variant_etag(key):
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def is_valid(width, height, crop, fmt):
+    return (0 < width <= RESIZE_MAX_SIDE and 0 < height <= RESIZE_MAX_SIDE
+            and crop in RESIZE_CROPS and fmt in RESIZE_FORMATS)
+
+
+def check_signature(key, signature):
+    return constant_time_compare(signature, _signer.signature(key))
+
+
+def resized_url(name, width, height, crop='', fmt='jpeg'):
+    """Подписанная ссылка на вариант картинки ``name``."""
+    key = variant_key(name, width, height, crop, fmt)
+    url = reverse('resized_image', kwargs={
+        'signature': _signer.signature(key),
+        'width': width, 'height': height, 'name': name,
+    })
+    return f'{url}?{urlencode({"crop": crop, "format": fmt})}'
+
+
+def _make(name, width, height, crop, fmt):
+    try:
+        if not _sources.exists(name):
+            raise FileNotFoundError(name)
+        try:
+            thumbnail = get_thumbnail(
+                ImageFile(name, _sources), f'{width}x{height}',
+                crop=crop or None, upscale=True, format=RESIZE_FORMATS[fmt])
+        except OSError as error:
+            raise NotAnImage(name) from error
+        # Нечитаемый исходник sorl не создаёт и возвращает пустое имя.
+        if not thumbnail.exists():
+            raise NotAnImage(name)
+        return thumbnail.name
+    finally:
+        connection.close()
+
+
+def _done(key):
+    with _lock:
+        del _pending[key]
+        _slots.release()
+
+
+def resize(name, width, height, crop, fmt):
+    """Имя готового варианта; новый вариант делается в пуле потоков.
+
+    Одинаковые запросы ждут один и тот же вариант.
+    """
+    key = variant_key(name, width, height, crop, fmt)
+    version, = get_versions(RESIZE_CACHE_PREFIX, [name])
+    cache_key = f'{RESIZE_CACHE_PREFIX}:{version}:{variant_etag(key)}'
+    thumbnail = cache.get(cache_key)
+    if thumbnail is not None and default_storage.exists(thumbnail):
+        return thumbnail
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            if not _slots.acquire(blocking=False):
+                raise ResizeBusy(key)
+            future = _pending[key] = _pool.submit(
+                _make, name, width, height, crop, fmt)
+            future.add_done_callback(lambda future: _done(key))
+    try:
+        thumbnail = future.result(timeout=RESIZE_TIMEOUT)
+    except TimeoutError:
+        # Вариант доделается в пуле, повторный запрос его дождётся.
+        raise ResizeBusy(key) from None
+    cache.set(cache_key, thumbnail, None)
+    return thumbnail
+
+
+def forget(names):
+    """Сбрасывает запомненные варианты исходников ``names``."""
+    bump_versions(RESIZE_CACHE_PREFIX, names)
@@ -0,0 +1,108 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+
+BENCHMARK_ALIAS = 'sqlite_benchmark'
+CONFIGURATIONS = (
+    ('стандартный', 'django.db.backends.sqlite3', {}),
+    ('настроенный', 'core.db.sqlite3',
+     settings.DATABASES['default'].get('OPTIONS', {})),
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость чтения во время записи в стандартном и '
+            'настроенном бэкенде SQLite на временной базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        for label, engine, engine_options in CONFIGURATIONS:
+            # У каждой конфигурации свой псевдоним: соединения
+            # кешируются по псевдониму.
+            self.alias = f'{BENCHMARK_ALIAS}_{engine}'
+            with tempfile.TemporaryDirectory() as directory:
+                connections.databases[self.alias] = {
+                    'ENGINE': engine,
+                    'NAME': os.path.join(directory, 'benchmark.sqlite3'),
+                    'OPTIONS': dict(engine_options),
+                }
+                try:
+                    results = self.run_benchmark(options)
+                finally:
+                    connections[self.alias].close()
+                    del connections.databases[self.alias]
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{label}: чтений {results["reads"] / seconds:.0f}/с, '
+                f'записей {results["writes"] / seconds:.0f}/с, '
+                f'ошибок блокировки {results["errors"]}')
+
+    def run_benchmark(self, options):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('CREATE TABLE benchmark '
+                           '(id INTEGER PRIMARY KEY, value INTEGER)')
+            cursor.executemany(
+                'INSERT INTO benchmark (value) VALUES (%s)',
+                [(number,) for number in range(options['rows'])])
+        results = Counter()
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+        workers = (
+            [self.read] * options['readers']
+            + [self.write] * options['writers'])
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(worker, deadline, options['rows'], results, lock))
+            for worker in workers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def work(self, worker, deadline, rows, results, lock):
+        local = Counter()
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    local[worker(rows)] += 1
+                except DatabaseError:
+                    local['errors'] += 1
+        finally:
+            connections[self.alias].close()
+        with lock:
+            results.update(local)
+
+    def read(self, rows):
+        start = random.randrange(rows)
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(
+                'SELECT count(*), sum(value) FROM benchmark '
+                'WHERE id BETWEEN %s AND %s', [start, start + 100])
+            cursor.fetchone()
+        return 'reads'
+
+    def write(self, rows):
+        # Чтение перед записью в одной транзакции, как при сохранении
+        # комментария.
+        with transaction.atomic(using=self.alias):
+            with connections[self.alias].cursor() as cursor:
+                cursor.execute('SELECT max(id) FROM benchmark')
+                cursor.execute(
+                    'INSERT INTO benchmark (value) VALUES (%s)',
+                    [cursor.fetchone()[0]])
+        return 'writes'
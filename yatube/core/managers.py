@@ -0,0 +1,140 @@
+"""Кеширование результатов запросов ORM.
+
+Запрос, помеченный ``.cached()``, берёт строки из кеша по ключу из
+текста SQL с параметрами и версий всех упомянутых в нём таблиц. Версия
+таблицы меняется при save/delete её моделей, при ``update()`` и
+``delete()`` через ``CachingQuerySet`` и ещё раз после коммита
+транзакции, поэтому устаревшие строки не отдаются. Внутри транзакции
+кеш не используется: она может видеть ещё не закоммиченные данные.
+"""
+import hashlib
+import re
+from functools import lru_cache
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import models, transaction
+
+from core.cache_versions import bump_versions, get_versions
+
+ORM_CACHE_PREFIX = 'orm'
+ORM_CACHE_TIMEOUT = 60 * 5
+QUOTED_NAME_RE = re.compile(r'"([^"]+)"')
+
+
+@lru_cache(maxsize=None)
+def _known_tables():
+    return {model._meta.db_table for model in apps.get_models()}
+
+
+def invalidate_tables(tables, using=None):
+    """Сбрасывает закешированные запросы к ``tables``."""
+    tables = list(tables)
+    bump_versions(ORM_CACHE_PREFIX, tables)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(
+            lambda: bump_versions(ORM_CACHE_PREFIX, tables), using=using)
+
+
+def related_tables(model):
+    """Таблица модели и таблицы ссылающихся на неё моделей.
+
+    Удаление объекта меняет и их строки: каскад или SET_NULL.
+    """
+    tables = {model._meta.db_table}
+    for relation in model._meta.related_objects:
+        tables.add(relation.related_model._meta.db_table)
+    return tables
+
+
+class CachingQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache_timeout = None
+
+    def cached(self, timeout=ORM_CACHE_TIMEOUT):
+        """Включает кеширование результатов этого запроса."""
+        clone = self._chain()
+        clone._cache_timeout = timeout
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_timeout = self._cache_timeout
+        return clone
+
+    def _cache_key(self, kind):
+        if self._cache_timeout is None:
+            return None
+        if transaction.get_connection(self.db).in_atomic_block:
+            return None
+        sql, params = self.query.sql_with_params()
+        tables = sorted(
+            set(QUOTED_NAME_RE.findall(sql)) & _known_tables())
+        # Один и тот же SQL отдаёт модели, словари или кортежи: форма
+        # строк задаётся классом итератора и списком полей.
+        shape = f'{self._iterable_class.__qualname__}:{self._fields!r}'
+        digest = hashlib.md5(
+            f'{self.db}:{kind}:{shape}:{sql}:{params!r}'.encode()
+        ).hexdigest()
+        versions = get_versions(ORM_CACHE_PREFIX, tables)
+        return ':'.join([ORM_CACHE_PREFIX, digest, *versions])
+
+    def _fetch_all(self):
+        if self._result_cache is not None:
+            return super()._fetch_all()
+        try:
+            key = self._cache_key('rows')
+        except EmptyResultSet:
+            key = None
+        if key is None:
+            return super()._fetch_all()
+        results = cache.get(key)
+        if results is None:
+            super()._fetch_all()
+            cache.set(key, self._result_cache, self._cache_timeout)
+        else:
+            self._result_cache = results
+            self._prefetch_done = True
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        try:
+            key = self._cache_key('count')
+        except EmptyResultSet:
+            key = None
+        if key is None:
+            return super().count()
+        count = cache.get(key)
+        if count is None:
+            count = super().count()
+            cache.set(key, count, self._cache_timeout)
+        return count
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        invalidate_tables([self.model._meta.db_table], using=self.db)
+        return rows
+    update.alters_data = True
+
+    def delete(self):
+        result = super().delete()
+        invalidate_tables(related_tables(self.model), using=self.db)
+        return result
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        invalidate_tables([self.model._meta.db_table], using=self.db)
+        return objs
+
+
+CachingManager = models.Manager.from_queryset(CachingQuerySet)
+
+
+def cached_queryset(model):
+    """Кешируемый запрос к модели без ``CachingManager``."""
+    return CachingQuerySet(model).cached()
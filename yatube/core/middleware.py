@@ -0,0 +1,106 @@
+import time
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from core import routers
+from core.cache_versions import bump_versions, get_versions
+
+PRIMARY_PIN_COOKIE = 'primary_until'
+DEFAULT_STICKY_SECONDS = 5
+USER_CACHE_PREFIX = 'session_user'
+USER_CACHE_TIMEOUT = 60 * 5
+USER_CACHE_EXCLUDE = ('password',)
+
+
+class PrimaryPinMiddleware:
+    """Читает из основной БД в течение нескольких секунд после записи.
+
+    Срок хранится в cookie, поэтому действует для всех процессов
+    сервера.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PRIMARY_PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        routers.begin_request(pinned=time.time() < pinned_until)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end_request()
+        if wrote:
+            seconds = getattr(settings, 'REPLICA_STICKY_SECONDS',
+                              DEFAULT_STICKY_SECONDS)
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, str(time.time() + seconds),
+                max_age=seconds, httponly=True)
+        return response
+
+
+def _user_cache_key(request, user_id):
+    version, = get_versions(USER_CACHE_PREFIX, [str(user_id)])
+    return (f'{USER_CACHE_PREFIX}:{request.session.session_key}:'
+            f'{user_id}:{version}')
+
+
+def invalidate_users(user_ids):
+    """Сбрасывает закешированных для сессий пользователей ``user_ids``.
+
+    Сохранение, удаление и выход сбрасывают кеш сами (см.
+    ``core.signals``); после ``update()`` пользователей, например
+    ``is_active`` или пароля, эту функцию нужно вызвать явно.
+    """
+    bump_versions(USER_CACHE_PREFIX, [str(pk) for pk in user_ids])
+
+
+def get_cached_user(request):
+    """Пользователь сессии; строка из БД кешируется по ключу сессии.
+
+    Проверки те же, что в ``django.contrib.auth.get_user``: бэкенд из
+    настроек и хеш пароля в сессии. При любом расхождении пользователь
+    загружается штатно, а сессия при необходимости сбрасывается.
+    Хеш пароля в кеш не попадает: вместо него хранится хеш для сессии,
+    а поле ``password`` у пользователя из кеша отложено.
+    """
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    backend = session.get(auth.BACKEND_SESSION_KEY)
+    if (user_id is None or session.session_key is None
+            or backend not in settings.AUTHENTICATION_BACKENDS):
+        return auth.get_user(request)
+    key = _user_cache_key(request, user_id)
+    record = cache.get(key)
+    if record is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            fields = {field.attname: getattr(user, field.attname)
+                      for field in user._meta.concrete_fields
+                      if field.attname not in USER_CACHE_EXCLUDE}
+            cache.set(key, (fields, user.get_session_auth_hash()),
+                      USER_CACHE_TIMEOUT)
+        return user
+    fields, auth_hash = record
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(session_hash, auth_hash)):
+        return auth.get_user(request)
+    user = auth.get_user_model().from_db(
+        DEFAULT_DB_ALIAS, list(fields), list(fields.values()))
+    user.backend = backend
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """``AuthenticationMiddleware``, берущий пользователя из кеша."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-18 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Статистика кеша',
+                'verbose_name_plural': 'Статистика кешей',
+                'managed': False,
+            },
+        ),
+    ]
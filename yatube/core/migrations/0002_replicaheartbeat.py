@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-18 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicaHeartbeat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('beat', models.FloatField(verbose_name='Время отметки')),
+            ],
+            options={
+                'verbose_name': 'Пульс реплик',
+                'verbose_name_plural': 'Пульс реплик',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-19 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_replicaheartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Модель')),
+                ('value', models.BigIntegerField(verbose_name='Последний ключ')),
+            ],
+            options={
+                'verbose_name': 'Счётчик ключей шардов',
+                'verbose_name_plural': 'Счётчики ключей шардов',
+            },
+        ),
+    ]
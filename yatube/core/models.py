@@ -11,3 +11,41 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class CacheStatistics(models.Model):
+    """Модель без таблицы: страница статистики кешей в админке."""
+
+    class Meta:
+        managed = False
+        verbose_name = 'Статистика кеша'
+        verbose_name_plural = 'Статистика кешей'
+
+
+class ReplicaHeartbeat(models.Model):
+    """Метка времени из основной БД для измерения отставания реплик."""
+    beat = models.FloatField('Время отметки')
+
+    class Meta:
+        verbose_name = 'Пульс реплик'
+        verbose_name_plural = 'Пульс реплик'
+
+
+class ShardSequence(models.Model):
+    """Счётчик первичных ключей шардированной модели."""
+    name = models.CharField('Модель', max_length=100, unique=True)
+    value = models.BigIntegerField('Последний ключ')
+
+    class Meta:
+        verbose_name = 'Счётчик ключей шардов'
+        verbose_name_plural = 'Счётчики ключей шардов'
+
+
+class StoredFile(models.Model):
+    """Число ссылок на файл хранилища с именами по содержимому."""
+    name = models.CharField('Имя файла', max_length=255, unique=True)
+    references = models.PositiveIntegerField('Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
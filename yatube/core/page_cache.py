@@ -0,0 +1,160 @@
+"""Кеширование страниц с отдачей устаревшей копии на время обновления.
+
+Пока одна копия страницы обновляется (запрос держит блокировку в кеше),
+остальные запросы получают устаревшую копию, а не рендерят страницу
+заново. Одновременные промахи по одному адресу ждут первый рендер.
+Если обновить страницу не удалось, устаревшая копия отдаётся ещё
+``stale_timeout`` секунд.
+
+В кеше хранится общая для всех пользователей оболочка страницы,
+персональные фрагменты подставляются в неё при каждой выдаче
+(см. ``core.fragments``). Теги позволяют сбросить копии страниц,
+зависящих от изменённых объектов, не дожидаясь ``timeout``.
+"""
+import hashlib
+import logging
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.utils.cache import (patch_cache_control, patch_response_headers,
+                                patch_vary_headers)
+
+from core.cache_versions import bump_versions, get_versions
+from core.fragments import fill_fragments
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_PREFIX = 'page'
+STALE_TIMEOUT = 60 * 5
+LOCK_TIMEOUT = 10
+MISS_WAIT_TIMEOUT = 2
+MISS_POLL_INTERVAL = 0.05
+
+
+def invalidate_page_tags(*tags):
+    """Сбрасывает закешированные страницы, помеченные ``tags``."""
+    bump_versions(PAGE_CACHE_PREFIX, tags)
+
+
+def page_cache_key(request, tags=()):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    versions = get_versions(PAGE_CACHE_PREFIX, tags)
+    return ':'.join([PAGE_CACHE_PREFIX, url, *versions])
+
+
+def _render_shell(view, request, args, kwargs):
+    request.page_shell = True
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+    finally:
+        request.page_shell = False
+    return response
+
+
+def _store(key, response, timeout, stale_timeout):
+    patch_response_headers(response, timeout)
+    entry = {
+        'content': response.content,
+        'status': response.status_code,
+        'headers': list(response.items()),
+        'fresh_until': time.time() + timeout,
+    }
+    cache.set(key, entry, timeout + stale_timeout)
+    return entry
+
+
+def _private(response):
+    # Фрагменты у каждого пользователя свои (CSRF-токен, кнопки), такую
+    # страницу нельзя отдавать из общего кеша прокси другому.
+    patch_cache_control(response, private=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def _from_entry(request, entry):
+    response = HttpResponse(
+        fill_fragments(request, entry['content']), status=entry['status'])
+    for header, value in entry['headers']:
+        response[header] = value
+    return _private(response)
+
+
+def _fill(request, response):
+    if not getattr(response, 'streaming', False):
+        response.content = fill_fragments(request, response.content)
+    return _private(response)
+
+
+def _wait_for_entry(key):
+    deadline = time.time() + MISS_WAIT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(MISS_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def cache_page_swr(timeout, stale_timeout=STALE_TIMEOUT,
+                   lock_timeout=LOCK_TIMEOUT, tags=None):
+    """Кеширует оболочку страницы на ``timeout`` секунд.
+
+    Устаревшая копия хранится ещё ``stale_timeout`` секунд и отдаётся,
+    пока страницу обновляет другой запрос или если обновление упало.
+    ``tags`` получает аргументы представления и возвращает теги
+    страницы для ``invalidate_page_tags``.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            page_tags = tags(request, *args, **kwargs) if tags else ()
+            key = page_cache_key(request, page_tags)
+            entry = cache.get(key)
+            if entry is not None and time.time() < entry['fresh_until']:
+                return _from_entry(request, entry)
+            lock_key = f'{key}:lock'
+            if not cache.add(lock_key, True, lock_timeout):
+                if entry is None:
+                    entry = _wait_for_entry(key)
+                if entry is not None:
+                    return _from_entry(request, entry)
+                return _fill(
+                    request, _render_shell(view, request, args, kwargs))
+            try:
+                response = _render_shell(view, request, args, kwargs)
+                if response.status_code == 200 and not response.cookies:
+                    entry = _store(key, response, timeout, stale_timeout)
+            except (Http404, PermissionDenied):
+                raise
+            except Exception:
+                if entry is None:
+                    raise
+                logger.exception('Не удалось обновить страницу %s, '
+                                 'отдаём устаревшую копию', request.path)
+                return _from_entry(request, entry)
+            finally:
+                cache.delete(lock_key)
+            if response.status_code >= 500 and entry is not None:
+                return _from_entry(request, entry)
+            return _fill(request, response)
+        return wrapper
+    return decorator
+
+
+def deferred_fragments(view):
+    """Рендерит фрагменты некешируемой страницы после неё самой.
+
+    Фрагменты с ``prefetch`` тогда загружают данные один раз на
+    страницу, как и в закешированных страницах.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return _fill(request, _render_shell(view, request, args, kwargs))
+    return wrapper
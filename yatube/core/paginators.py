@@ -0,0 +1,131 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Ниже этого числа строк точный COUNT(*) дешёв и оценка не нужна.
+ESTIMATE_THRESHOLD = 100000
+
+
+def estimate_row_count(model, using):
+    """Приблизительное число строк в таблице модели без COUNT(*)."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [table])
+        elif connection.vendor == 'sqlite':
+            # Ключ растёт монотонно, максимум по индексу — верхняя оценка.
+            cursor.execute('SELECT max({}) FROM {}'.format(
+                connection.ops.quote_name(model._meta.pk.column),
+                connection.ops.quote_name(table)))
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, оценивающий размер большой нефильтрованной таблицы.
+
+    Для запросов с условиями и для небольших таблиц считает точно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class CursorPage(Sequence):
+    cursor_pagination = True
+
+    def __init__(self, object_list, cursor, next_cursor):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Постраничный вывод по курсору без OFFSET и COUNT(*).
+
+    Курсор — значения полей сортировки последней строки страницы.
+    Следующая страница — строки после курсора, поэтому каждый шард
+    отдаёт не больше ``per_page + 1`` строк при любой глубине.
+    Поля сортировки должны однозначно упорядочивать строки.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-pub_date', '-pk')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        meta = queryset.model._meta
+        self.fields = [
+            (meta.pk if name.lstrip('-') == 'pk'
+             else meta.get_field(name.lstrip('-')), name.startswith('-'))
+            for name in ordering
+        ]
+
+    def encode(self, obj):
+        values = [field.value_to_string(obj) for field, _ in self.fields]
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode()).decode()
+
+    def decode(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return [field.to_python(value)
+                    for (field, _), value in zip(self.fields, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+
+    def _after(self, values):
+        condition = Q()
+        equal = Q()
+        for (field, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{field.attname}__{lookup}': value})
+            equal &= Q(**{field.attname: value})
+        return condition
+
+    def get_page(self, cursor):
+        """Страница после ``cursor``; неверный курсор — первая страница."""
+        values = self.decode(cursor) if cursor else None
+        queryset = self.queryset.order_by(*self.ordering)
+        if values is None:
+            cursor = None
+        else:
+            queryset = queryset.filter(self._after(values))
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode(rows[-1])
+        return CursorPage(rows, cursor, next_cursor)
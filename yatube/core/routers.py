@@ -0,0 +1,159 @@
+"""Маршрутизация запросов по репликам и шардам БД.
+
+Чтения представлений, помеченных ``replica_reads``, идут на реплики из
+``REPLICA_DATABASES``, запись — всегда в основную БД. После записи
+сессия ``REPLICA_STICKY_SECONDS`` секунд читает из основной БД, чтобы
+видеть свои изменения (см. ``core.middleware.PrimaryPinMiddleware``).
+
+Строки шардированных моделей (см. ``core.sharding``) читаются и
+пишутся на шарде автора, реплики для них не используются.
+
+Отставание реплики измеряется по строке ``ReplicaHeartbeat``: основная
+БД обновляет её не чаще раза в ``HEARTBEAT_INTERVAL`` секунд, реплика
+с отметкой старше ``REPLICA_MAX_LAG`` секунд не используется.
+"""
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, transaction
+
+from core.sharding import is_sharded, shard_aliases, shard_of
+
+HEARTBEAT_INTERVAL = 1
+HEALTH_CHECK_INTERVAL = 5
+DEFAULT_MAX_LAG = 2
+
+_state = threading.local()
+_health = {}
+_health_lock = threading.Lock()
+
+
+def replica_reads(view):
+    """Отправляет чтения представления на реплики."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_state, 'replica_reads', False)
+        _state.replica_reads = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _state.replica_reads = previous
+    return wrapper
+
+
+def pin_to_primary():
+    """Оставляет чтения текущего запроса и сессии на основной БД."""
+    _state.wrote = True
+
+
+def begin_request(pinned):
+    """Сбрасывает состояние маршрутизации в начале запроса."""
+    _state.pinned = pinned
+    _state.wrote = False
+
+
+def end_request():
+    """Завершает запрос; возвращает, писал ли он в БД."""
+    wrote = getattr(_state, 'wrote', False)
+    _state.pinned = _state.wrote = False
+    return wrote
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def record_heartbeat():
+    """Обновляет отметку в основной БД, если она устарела."""
+    from core.models import ReplicaHeartbeat
+
+    beats = ReplicaHeartbeat.objects.using(DEFAULT_DB_ALIAS)
+    now = time.time()
+    beat = beats.filter(pk=1).values_list('beat', flat=True).first()
+    if beat is None or now - beat >= HEARTBEAT_INTERVAL:
+        beats.update_or_create(pk=1, defaults={'beat': now})
+        beat = now
+    return beat
+
+
+def replica_lag(alias):
+    """Отставание реплики ``alias`` от основной БД в секундах."""
+    from core.models import ReplicaHeartbeat
+
+    primary = record_heartbeat()
+    replica = ReplicaHeartbeat.objects.using(alias).filter(
+        pk=1).values_list('beat', flat=True).first()
+    if replica is None:
+        return float('inf')
+    return max(primary - replica, 0)
+
+
+def _is_healthy(alias):
+    now = time.monotonic()
+    with _health_lock:
+        checked_at, healthy = _health.get(alias, (None, False))
+    if checked_at is not None and now - checked_at < HEALTH_CHECK_INTERVAL:
+        return healthy
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG', DEFAULT_MAX_LAG)
+    try:
+        healthy = replica_lag(alias) <= max_lag
+    except DatabaseError:
+        healthy = False
+    with _health_lock:
+        _health[alias] = (now, healthy)
+    return healthy
+
+
+def reset_replica_health():
+    """Забывает результаты проверок реплик."""
+    with _health_lock:
+        _health.clear()
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        if is_sharded(model):
+            return shard_of(hints.get('instance'))
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        shards = shard_aliases()
+        if obj1._state.db in shards or obj2._state.db in shards:
+            return True
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Связанные объекты шардированных строк читаются из основной БД,
+        # а не с шарда, откуда пришёл объект.
+        if (not getattr(_state, 'replica_reads', False)
+                or getattr(_state, 'pinned', False)
+                or getattr(_state, 'wrote', False)):
+            return DEFAULT_DB_ALIAS
+        # Транзакция может видеть ещё не закоммиченные изменения.
+        if transaction.get_connection().in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in replica_aliases()
+                    if _is_healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        return None
@@ -0,0 +1,148 @@
+"""Сессии в кеше с отложенной записью в БД.
+
+Сессия читается из кеша, из БД — только при промахе. Изменённая сессия
+сразу кладётся в кеш, а в БД попадает позже: фоновый поток раз в
+``SESSION_FLUSH_INTERVAL`` секунд обновляет все накопившиеся сессии
+одной транзакцией, повторные записи одной сессии схлопываются. Если
+данные сессии не изменились по сравнению с загруженными, она не
+сохраняется вовсе. Новые сессии (вход) и удаление (выход) пишутся в
+БД сразу; отложенная запись только обновляет строки, поэтому удалённая
+сессия не воскресает. Тот же поток раз в ``SESSION_CLEANUP_INTERVAL``
+секунд пачками удаляет истёкшие сессии.
+
+Кеш ``LRUCache`` у каждого процесса свой: при нескольких процессах
+нужен общий кеш сессий (``SESSION_CACHE_ALIAS``). При падении процесса
+теряются изменения сессий за последние секунды.
+"""
+import atexit
+import copy
+import logging
+import threading
+import time
+
+from django.contrib.sessions.backends.cached_db import (
+    SessionStore as CachedDBStore)
+from django.db import close_old_connections, router, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SESSION_FLUSH_INTERVAL = 2
+SESSION_CLEANUP_INTERVAL = 60 * 60
+SESSION_CLEANUP_BATCH_SIZE = 500
+
+
+class SessionWriter:
+    """Копит изменения сессий и пишет их в БД фоновым потоком."""
+
+    def __init__(self, interval=SESSION_FLUSH_INTERVAL,
+                 cleanup_interval=SESSION_CLEANUP_INTERVAL):
+        self.interval = interval
+        self.cleanup_interval = cleanup_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._next_cleanup = time.monotonic() + cleanup_interval
+
+    def schedule(self, model, session_key, session_data, expire_date):
+        with self._lock:
+            self._pending[session_key] = (model, session_data, expire_date)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='session-writer', daemon=True)
+                self._thread.start()
+
+    def pending(self, session_key):
+        """Ещё не записанные данные сессии или None."""
+        with self._lock:
+            entry = self._pending.get(session_key)
+        return entry and entry[1]
+
+    def discard(self, session_key):
+        with self._lock:
+            self._pending.pop(session_key, None)
+
+    def clear(self):
+        """Отбрасывает все ещё не записанные сессии."""
+        with self._lock:
+            self._pending.clear()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            try:
+                self.flush()
+                if time.monotonic() >= self._next_cleanup:
+                    self._next_cleanup = (
+                        time.monotonic() + self.cleanup_interval)
+                    SessionStore.clear_expired()
+            except Exception:
+                logger.exception('Не удалось записать сессии в БД')
+
+    def flush(self):
+        """Записывает накопившиеся сессии одной транзакцией."""
+        with self._lock:
+            pending = dict(self._pending)
+        by_db = {}
+        for session_key, (model, data, expire_date) in pending.items():
+            using = router.db_for_write(model)
+            by_db.setdefault(using, []).append(
+                (model, session_key, data, expire_date))
+        for using, rows in by_db.items():
+            with transaction.atomic(using=using):
+                for model, session_key, data, expire_date in rows:
+                    model.objects.using(using).filter(
+                        session_key=session_key).update(
+                            session_data=data, expire_date=expire_date)
+        # До записи в БД сессия остаётся в очереди и читается из неё.
+        with self._lock:
+            for session_key, entry in pending.items():
+                if self._pending.get(session_key) is entry:
+                    del self._pending[session_key]
+
+
+writer = SessionWriter()
+atexit.register(writer.flush)
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'core.sessions'
+
+    def load(self):
+        data = self._cache.get(self.cache_key)
+        if data is None:
+            # Кеш мог вытеснить сессию, которая ещё не записана в БД.
+            pending = writer.pending(self.session_key)
+            data = (self.decode(pending) if pending is not None
+                    else super().load())
+        self._loaded = copy.deepcopy(data)
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        if must_create:
+            super().save(must_create=True)
+        elif data != getattr(self, '_loaded', None):
+            self._cache.set(self.cache_key, data, self.get_expiry_age())
+            writer.schedule(self.model, self.session_key, self.encode(data),
+                            self.get_expiry_date())
+        self._loaded = copy.deepcopy(data)
+
+    def delete(self, session_key=None):
+        writer.discard(session_key or self.session_key)
+        super().delete(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        """Удаляет истёкшие сессии пачками, не держа долгую блокировку."""
+        model = cls.get_model_class()
+        expired = model.objects.filter(expire_date__lt=timezone.now())
+        while True:
+            keys = list(expired.values_list(
+                'session_key', flat=True)[:SESSION_CLEANUP_BATCH_SIZE])
+            if not keys:
+                return
+            model.objects.filter(session_key__in=keys).delete()
@@ -0,0 +1,238 @@
+"""Шардирование строк по автору.
+
+Строки зарегистрированных моделей лежат на базах из ``POST_SHARDS``;
+база выбирается по id автора рандеву-хешированием, поэтому при
+добавлении шарда переезжает лишь часть авторов (см. команду
+``rebalance_shards``). Пока ``POST_SHARDS`` пуст, всё хранится в
+``default`` и запросы работают как обычно.
+
+Запрос ``ShardedQuerySet``, для которого шард не следует из подсказок
+(объекта-владельца связанного менеджера), выполняется на всех шардах:
+строки сливаются по сортировке запроса, счётчики складываются.
+``select_related`` к моделям основной БД на шардах заменяется
+подгрузкой через ``prefetch_related``: таблицы пользователей и групп
+на шардах пусты. Связи шардов с основной БД не проверяются базой
+(``foreign_keys = OFF`` в настройках шардов), каскадное удаление
+пользователя не удаляет его строки на шардах.
+
+Первичные ключи выдаёт счётчик ``ShardSequence`` в основной БД, они
+уникальны между шардами.
+"""
+import functools
+import hashlib
+import heapq
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import F, Max, prefetch_related_objects
+from django.db.models.query import ModelIterable
+from django.db.models.signals import pre_save
+
+from core.managers import CachingQuerySet
+
+_author_ids = {}
+
+
+def shard_aliases():
+    return getattr(settings, 'POST_SHARDS', [])
+
+
+def shard_for_author(author_id):
+    """Шард, на котором лежат строки автора ``author_id``."""
+    shards = shard_aliases()
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    return max(shards, key=lambda alias: hashlib.md5(
+        f'{alias}:{author_id}'.encode()).hexdigest())
+
+
+def register(model, author_id):
+    """Шардирует строки ``model`` по автору ``author_id(obj)``."""
+    _author_ids[model] = author_id
+    pre_save.connect(assign_id, sender=model)
+
+
+def is_sharded(model):
+    return bool(shard_aliases()) and model in _author_ids
+
+
+def shard_of(instance):
+    """Шард объекта или None, если он не определяется."""
+    shards = shard_aliases()
+    if not shards or instance is None:
+        return None
+    if instance._state.db in shards:
+        return instance._state.db
+    if isinstance(instance, get_user_model()):
+        return shard_for_author(instance.pk)
+    author_id = _author_ids.get(type(instance))
+    if author_id is None:
+        return None
+    return shard_for_author(author_id(instance))
+
+
+def next_id(model):
+    """Следующий первичный ключ ``model``, общий для всех шардов."""
+    from core.models import ShardSequence
+
+    sequences = ShardSequence.objects.using(DEFAULT_DB_ALIAS)
+    name = model._meta.label
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if not sequences.filter(name=name).update(value=F('value') + 1):
+            start = max(
+                model._base_manager.using(alias).aggregate(
+                    Max('pk'))['pk__max'] or 0
+                for alias in (DEFAULT_DB_ALIAS, *shard_aliases()))
+            sequences.create(name=name, value=start + 1)
+        return sequences.get(name=name).value
+
+
+def assign_id(sender, instance, **kwargs):
+    if instance.pk is None and shard_aliases():
+        instance.pk = next_id(sender)
+
+
+@functools.total_ordering
+class _Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _merge_key(queryset):
+    """Ключ слияния строк шардов по сортировке запроса или None."""
+    query = queryset.query
+    ordering = list(query.order_by or (
+        query.get_meta().ordering if query.default_ordering else ()))
+    if not ordering:
+        return None
+    getters = []
+    for name in ordering:
+        if not isinstance(name, str) or name == '?':
+            return None
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        if name == 'pk':
+            name = query.get_meta().pk.name
+        if '__' in name:
+            return None
+        attname = query.get_meta().get_field(name).attname
+        getters.append((attname, descending))
+
+    def key(obj):
+        parts = []
+        for attname, descending in getters:
+            value = getattr(obj, attname)
+            # NULL в SQLite меньше любого значения.
+            part = (value is not None, value)
+            parts.append(_Descending(part) if descending else part)
+        return parts
+    return key
+
+
+class ShardedQuerySet(CachingQuerySet):
+    def _shards(self):
+        """Шарды, на которых выполняется запрос, или None без шардов."""
+        if not is_sharded(self.model):
+            return None
+        if self._db is not None:
+            return [self._db] if self._db in shard_aliases() else None
+        shard = shard_of(self._hints.get('instance'))
+        return [shard] if shard else shard_aliases()
+
+    def _on_shard(self, alias, limits=True):
+        clone = self.using(alias)
+        clone.query.clear_limits()
+        if limits and self.query.high_mark is not None:
+            clone.query.set_limits(high=self.query.high_mark)
+        if clone.query.select_related:
+            clone = clone.select_related(None)
+        # Связанные объекты подгружаются один раз для итоговых строк.
+        clone._prefetch_related_lookups = ()
+        return clone
+
+    def _fetch_all(self):
+        shards = self._shards()
+        if self._result_cache is not None or shards is None:
+            return super()._fetch_all()
+        results = []
+        for alias in shards:
+            clone = self._on_shard(alias)
+            super(ShardedQuerySet, clone)._fetch_all()
+            results.append(clone._result_cache)
+        key = _merge_key(self) if self._iterable_class is ModelIterable \
+            else None
+        if key is None:
+            rows = [row for shard_rows in results for row in shard_rows]
+        else:
+            rows = heapq.merge(*results, key=key)
+        low, high = self.query.low_mark, self.query.high_mark
+        self._result_cache = list(islice(rows, low, high))
+        if self._iterable_class is ModelIterable:
+            lookups = self._prefetch_related_lookups + tuple(
+                self.query.select_related
+                if isinstance(self.query.select_related, dict) else ())
+            prefetch_related_objects(self._result_cache, *lookups)
+        self._prefetch_done = True
+
+    def count(self):
+        shards = self._shards()
+        if shards is None or self._result_cache is not None:
+            return super().count()
+        total = sum(
+            super(ShardedQuerySet, self._on_shard(alias, limits=False))
+            .count() for alias in shards)
+        low, high = self.query.low_mark, self.query.high_mark
+        if high is not None:
+            total = min(total, high)
+        return max(total - low, 0)
+
+    def exists(self):
+        shards = self._shards()
+        if shards is None or self._result_cache is not None:
+            return super().exists()
+        return any(super(ShardedQuerySet, self._on_shard(alias)).exists()
+                   for alias in shards)
+
+    def update(self, **kwargs):
+        shards = self._shards()
+        if shards is None:
+            return super().update(**kwargs)
+        return sum(super(ShardedQuerySet, self.using(alias)).update(**kwargs)
+                   for alias in shards)
+    update.alters_data = True
+
+    def delete(self):
+        shards = self._shards()
+        if shards is None:
+            return super().delete()
+        total, counts = 0, Counter()
+        for alias in shards:
+            deleted, per_model = super(
+                ShardedQuerySet, self.using(alias)).delete()
+            total += deleted
+            counts.update(per_model)
+        return total, dict(counts)
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def create(self, **kwargs):
+        if self._db is not None or not is_sharded(self.model):
+            return super().create(**kwargs)
+        # Шард выбирает роутер по самому объекту.
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+ShardedManager = models.Manager.from_queryset(ShardedQuerySet)
@@ -0,0 +1,41 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+
+from core.managers import CachingQuerySet, invalidate_tables, related_tables
+from core.middleware import invalidate_users
+
+
+def invalidate_saved(sender, instance, using, **kwargs):
+    invalidate_tables([sender._meta.db_table], using=using)
+
+
+def invalidate_deleted(sender, instance, using, **kwargs):
+    invalidate_tables(related_tables(sender), using=using)
+
+
+def connect_cached_models():
+    """Подключает сброс кеша запросов к моделям с ``CachingManager``."""
+    models = {get_user_model()}
+    for model in apps.get_models():
+        if isinstance(model._default_manager.get_queryset(),
+                      CachingQuerySet):
+            models.add(model)
+    for model in models:
+        post_save.connect(invalidate_saved, sender=model)
+        post_delete.connect(invalidate_deleted, sender=model)
+
+
+def invalidate_user(sender, instance=None, user=None, **kwargs):
+    """Сбрасывает закешированного для сессий пользователя."""
+    user = instance or user
+    if user is not None and user.pk is not None:
+        invalidate_users([user.pk])
+
+
+def connect_user_cache():
+    model = get_user_model()
+    post_save.connect(invalidate_user, sender=model)
+    post_delete.connect(invalidate_user, sender=model)
+    user_logged_out.connect(invalidate_user)
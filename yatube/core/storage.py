@@ -0,0 +1,118 @@
+"""Хранилище файлов с именами по содержимому.
+
+Имя файла — sha256 содержимого, который считается, пока загрузка
+пишется во временный файл. Одинаковые загрузки получают одно имя, один
+файл и одни миниатюры (sorl привязывает их к имени). Число ссылок на
+файл хранится в ``StoredFile``: ссылку на загруженный файл берёт сам
+``_save``, владельцы уже сохранённых имён вызывают ``retain``, и все —
+``release``. Файл с миниатюрами удаляется в фоне после коммита, когда
+ссылок не осталось.
+"""
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+from sorl.thumbnail import delete as delete_image
+from sorl.thumbnail.images import ImageFile
+
+_cleanup = ThreadPoolExecutor(max_workers=1)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Кладёт файл в ``<каталог>/ab/cd/<sha256><расширение>``.
+
+    Каталог — первая часть имени, предложенного ``upload_to``.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save, одинаковые файлы — один.
+        return name
+
+    def _save(self, name, content):
+        directory = name.split('/', 1)[0] if '/' in name else ''
+        extension = os.path.splitext(name)[1].lower()
+        os.makedirs(self.location, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=self.location, prefix='.upload-')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(descriptor, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            digest = digest.hexdigest()
+            name = '/'.join(filter(None, (
+                directory, digest[:2], digest[2:4], digest + extension)))
+            # Ссылка берётся до проверки: иначе фоновая очистка может
+            # удалить найденный файл до того, как владелец сохранится.
+            retain(name)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(temp_path)
+                return name
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+
+def retain(name):
+    """Добавляет ссылку на файл ``name``."""
+    from core.models import StoredFile
+
+    files = StoredFile.objects.filter(name=name)
+    if files.update(references=F('references') + 1):
+        return
+    try:
+        with transaction.atomic():
+            StoredFile.objects.create(name=name, references=1)
+    except IntegrityError:
+        files.update(references=F('references') + 1)
+
+
+def release(name, storage):
+    """Убирает ссылку на файл; последняя удаляет файл после коммита."""
+    from core.models import StoredFile
+
+    files = StoredFile.objects.filter(name=name)
+    with transaction.atomic():
+        files.filter(references__gt=0).update(
+            references=F('references') - 1)
+        deleted, _ = files.filter(references__lte=0).delete()
+    if deleted:
+        transaction.on_commit(
+            lambda: _cleanup.submit(_cleanup_in_background, [name], storage))
+
+
+def delete_unreferenced(names, storage):
+    """Удаляет файлы ``names`` с миниатюрами, если на них нет ссылок."""
+    from core.images import forget
+    from core.models import StoredFile
+
+    # Проверка и удаление — одна транзакция на запись: ``retain`` из
+    # ``_save`` ждёт её конца и потом видит, что файл нужно записать.
+    with transaction.atomic():
+        referenced = set(StoredFile.objects.filter(
+            name__in=names, references__gt=0).values_list('name', flat=True))
+        unreferenced = set(names) - referenced
+        for name in unreferenced:
+            delete_image(ImageFile(name, storage))
+    forget(unreferenced)
+
+
+def _cleanup_in_background(names, storage):
+    try:
+        delete_unreferenced(names, storage)
+    finally:
+        connection.close()
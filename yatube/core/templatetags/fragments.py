@@ -0,0 +1,14 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.fragments import placeholder, render_fragment
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def fragment(context, name, **kwargs):
+    request = context.get('request')
+    if getattr(request, 'page_shell', False):
+        return mark_safe(placeholder(name, kwargs))
+    return mark_safe(render_fragment(request, name, kwargs))
@@ -0,0 +1,13 @@
+from django import template
+
+from core.images import resized_url as build_resized_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def resized_url(image, width, height, crop='', format='jpeg'):
+    """Ссылка на картинку ``image`` нужного размера, см. core.images."""
+    if not image:
+        return ''
+    return build_resized_url(image.name, width, height, crop, format)
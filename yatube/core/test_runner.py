@@ -0,0 +1,16 @@
+from django.test.runner import DiscoverRunner
+
+from core import counters, sessions
+
+
+class TestRunner(DiscoverRunner):
+    """Отбрасывает отложенные записи до удаления тестовых БД.
+
+    Иначе счётчики и сессии, записываемые при выходе (``atexit``), ушли
+    бы в рабочую БД: к тому времени настройки снова указывают на неё.
+    """
+
+    def teardown_databases(self, old_config, **kwargs):
+        counters.discard_all()
+        sessions.writer.clear()
+        super().teardown_databases(old_config, **kwargs)
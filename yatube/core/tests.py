@@ -1,4 +1,47 @@
-from django.test import Client, TestCase
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.signals import user_logged_out
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core import storage
+from core.cache_backends import LRUCache, SQLiteLRUCache
+from core.db.sqlite3.base import retry_locked
+from core.images import resized_url
+from core.middleware import (PRIMARY_PIN_COOKIE, PrimaryPinMiddleware,
+                             get_cached_user, invalidate_users)
+from core.models import ReplicaHeartbeat
+from core.routers import (record_heartbeat, replica_reads,
+                          reset_replica_health)
+from core.page_cache import cache_page_swr, page_cache_key
+from core.sessions import SessionStore
+from core.sessions import writer as session_writer
+from core.write_queue import WriteCoordinator, WriteTimeout
+from posts.models import Group, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class PostViewsTests(TestCase):
@@ -8,3 +51,573 @@ class PostViewsTests(TestCase):
     def test_404_use_custom_template(self):
         response = self.client.get('/nonexist-page/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class StaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.fail = False
+        self.factory = RequestFactory()
+
+        @cache_page_swr(10, stale_timeout=60)
+        def view(request):
+            self.calls += 1
+            if self.fail:
+                raise ValueError('render failed')
+            return HttpResponse(f'render {self.calls}')
+
+        self.view = view
+        self.key = page_cache_key(self.factory.get('/'))
+
+    def get(self):
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        return self.view(request)
+
+    def expire(self):
+        entry = cache.get(self.key)
+        entry['fresh_until'] = 0
+        cache.set(self.key, entry)
+
+    def test_fresh_page_served_from_cache(self):
+        """Свежая копия отдаётся без повторного рендера."""
+        self.get()
+        response = self.get()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(response.content, b'render 1')
+
+    def test_stale_page_served_while_locked(self):
+        """Пока страницу обновляет другой запрос, отдаётся старая копия."""
+        self.get()
+        self.expire()
+        cache.add(f'{self.key}:lock', True)
+        response = self.get()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(response.content, b'render 1')
+
+    def test_stale_page_regenerated_after_timeout(self):
+        """Устаревшая копия обновляется запросом, получившим блокировку."""
+        self.get()
+        self.expire()
+        response = self.get()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(response.content, b'render 2')
+
+    def test_stale_page_served_on_failure(self):
+        """Если рендер упал, отдаётся устаревшая копия."""
+        self.get()
+        self.expire()
+        self.fail = True
+        with self.assertLogs('core.page_cache', level='ERROR'):
+            response = self.get()
+        self.assertEqual(response.content, b'render 1')
+
+    def test_page_not_cached_publicly(self):
+        """Страница с личными фрагментами не попадает в общие кеши."""
+        for response in (self.get(), self.get()):
+            with self.subTest(calls=self.calls):
+                self.assertIn('private', response['Cache-Control'])
+                self.assertNotIn('public', response['Cache-Control'])
+                self.assertIn('Cookie', response['Vary'])
+
+
+class LRUCacheTests(TestCase):
+    backend = LRUCache
+
+    def make_cache(self, max_bytes):
+        return self.backend(
+            f'test-{self.id()}', {'OPTIONS': {'MAX_BYTES': max_bytes}})
+
+    def test_evicts_least_recently_used_by_size(self):
+        """При превышении объёма вытесняется давно не читанная запись."""
+        test_cache = self.make_cache(600)
+        test_cache.set('page:a', 'a' * 150)
+        test_cache.set('page:b', 'b' * 150)
+        test_cache.get('page:a')
+        test_cache.set('page:c', 'c' * 150)
+        test_cache.set('page:d', 'd' * 150)
+        self.assertIsNone(test_cache.get('page:b'))
+        self.assertEqual(test_cache.get('page:a'), 'a' * 150)
+        self.assertEqual(test_cache.get('page:d'), 'd' * 150)
+
+    def test_incr_keeps_size_budget(self):
+        """Выросшее после incr значение вытесняет старые записи."""
+        test_cache = self.make_cache(600)
+        test_cache.set('page:a', 'a' * 150)
+        test_cache.set('page:b', 'b' * 150)
+        test_cache.set('page:n', 1)
+        test_cache.incr('page:n', 10 ** 1000)
+        self.assertLessEqual(test_cache.get_stats()['size'], 600)
+        self.assertIsNone(test_cache.get('page:a'))
+        self.assertEqual(test_cache.get('page:n'), 10 ** 1000 + 1)
+
+    def test_stats_grouped_by_key_prefix(self):
+        """Статистика считается по префиксам ключей."""
+        test_cache = self.make_cache(10 ** 6)
+        test_cache.set('page:a', 1)
+        test_cache.get('page:a')
+        test_cache.get('page:b')
+        test_cache.get('orm:a')
+        prefixes = test_cache.get_stats()['prefixes']
+        self.assertEqual(prefixes['page']['hits'], 1)
+        self.assertEqual(prefixes['page']['misses'], 1)
+        self.assertEqual(prefixes['orm']['misses'], 1)
+
+
+class SQLiteLRUCacheTests(LRUCacheTests):
+    backend = SQLiteLRUCache
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, max_bytes):
+        return self.backend(
+            f'{self.directory}/cache.sqlite3',
+            {'OPTIONS': {'MAX_BYTES': max_bytes, 'ACCESS_RESOLUTION': 0}})
+
+    def test_entries_shared_between_instances(self):
+        """Записи видны другим экземплярам с тем же файлом."""
+        self.make_cache(10 ** 6).set('page:a', 'shared')
+        self.assertEqual(self.make_cache(10 ** 6).get('page:a'), 'shared')
+
+
+class CacheStatisticsAdminTests(TestCase):
+    def test_admin_shows_cache_statistics(self):
+        """Статистика кешей доступна в админке."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        client = Client()
+        client.force_login(admin)
+        cache.get('page:missing')
+        response = client.get(
+            reverse('admin:core_cachestatistics_changelist'))
+        self.assertContains(response, 'page')
+
+
+class CachingQuerySetTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='')
+
+    def get_group(self):
+        return Group.objects.cached().get(slug='test-slug')
+
+    def test_repeated_query_served_from_cache(self):
+        """Повторный запрос не обращается к БД."""
+        self.get_group()
+        with self.assertNumQueries(0):
+            self.get_group()
+
+    def test_save_invalidates_cached_query(self):
+        """Сохранение объекта сбрасывает кеш запросов к его таблице."""
+        self.get_group()
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertEqual(self.get_group().title, 'Новое название')
+
+    def test_update_invalidates_cached_query(self):
+        """update() сбрасывает кеш запросов к таблице."""
+        self.get_group()
+        Group.objects.filter(pk=self.group.pk).update(title='Обновлено')
+        self.assertEqual(self.get_group().title, 'Обновлено')
+
+    def test_delete_invalidates_related_tables(self):
+        """Удаление объекта сбрасывает кеш запросов к связанным таблицам."""
+        author = User.objects.create(username='Tester')
+        Post.objects.create(author=author, text='Текст', group=self.group)
+        posts = Post.objects.select_related('group').cached()
+        self.assertEqual(list(posts)[0].group, self.group)
+        self.group.delete()
+        self.assertIsNone(list(posts.all())[0].group)
+
+    def test_row_shapes_cached_separately(self):
+        """Модели, словари и кортежи одного запроса не смешиваются."""
+        groups = Group.objects.cached().only('pk')
+        self.assertEqual(list(groups), [self.group])
+        self.assertEqual(list(groups.values('pk')), [{'pk': self.group.pk}])
+        self.assertEqual(list(groups.values('id')), [{'id': self.group.pk}])
+        self.assertEqual(list(groups.values_list('pk', flat=True)),
+                         [self.group.pk])
+        self.assertEqual(list(groups.values_list('pk')), [(self.group.pk,)])
+
+    def test_cache_skipped_inside_transaction(self):
+        """Внутри транзакции запросы идут в БД."""
+        self.get_group()
+        with transaction.atomic(), self.assertNumQueries(1):
+            self.get_group()
+
+
+class SQLiteBackendTests(TestCase):
+    def test_pragmas_applied(self):
+        """Соединение ждёт блокировку и не синхронизирует каждую запись."""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    @mock.patch('core.db.sqlite3.base.time.sleep')
+    def test_retry_locked(self, sleep):
+        """Запрос повторяется, пока база заблокирована."""
+        func = mock.Mock(side_effect=[
+            sqlite3.OperationalError('database is locked'), 'result'])
+        self.assertEqual(retry_locked(func), 'result')
+        self.assertEqual(func.call_count, 2)
+        func = mock.Mock(side_effect=sqlite3.OperationalError('no table'))
+        with self.assertRaises(sqlite3.OperationalError):
+            retry_locked(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_benchmark_command(self):
+        """Бенчмарк выводит результаты обеих конфигураций."""
+        out = StringIO()
+        call_command('sqlite_benchmark', seconds=0.2, readers=1, writers=1,
+                     rows=100, stdout=out)
+        self.assertIn('стандартный', out.getvalue())
+        self.assertIn('настроенный', out.getvalue())
+
+
+class WriteCoordinatorTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.coordinator = WriteCoordinator()
+
+    def test_concurrent_writes_acknowledged(self):
+        """Одновременные записи выполняются и подтверждаются."""
+        results = []
+
+        def create(number):
+            results.append(self.coordinator.submit(
+                Group.objects.create, title=f'Группа {number}',
+                slug=f'group-{number}'))
+
+        threads = [threading.Thread(target=create, args=(number,))
+                   for number in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 10)
+        self.assertEqual(Group.objects.count(), 10)
+
+    def test_failed_write_does_not_affect_batch(self):
+        """Ошибка записи отдаётся вызывающему и не отменяет остальные."""
+        Group.objects.create(title='Группа', slug='group')
+        with self.assertRaises(Exception):
+            self.coordinator.submit(
+                Group.objects.create, title='Дубль', slug='group')
+        self.coordinator.submit(
+            Group.objects.create, title='Другая', slug='other')
+        self.assertEqual(Group.objects.count(), 2)
+
+    def test_write_timeout(self):
+        """Вызывающий ждёт подтверждения не дольше таймаута."""
+        release = threading.Event()
+        blocker = threading.Thread(
+            target=self.coordinator.submit, args=(release.wait,))
+        blocker.start()
+        try:
+            with self.assertRaises(WriteTimeout):
+                self.coordinator.submit(
+                    Group.objects.create, title='Группа', slug='group',
+                    timeout=0.1)
+        finally:
+            release.set()
+            blocker.join()
+        self.assertFalse(Group.objects.exists())
+
+    def test_started_write_awaited_after_timeout(self):
+        """Начатая запись не отменяется, вызывающий получает её итог."""
+        started = threading.Event()
+
+        def slow_create():
+            started.set()
+            threading.Event().wait(0.3)
+            return Group.objects.create(title='Группа', slug='group')
+
+        group = self.coordinator.submit(slow_create, timeout=0.1)
+        self.assertTrue(started.is_set())
+        self.assertEqual(Group.objects.get(), group)
+
+    def test_batch_failure_resolves_all_writes(self):
+        """Если пачка упала до выполнения, ошибку получают все записи."""
+        with mock.patch('core.write_queue.close_old_connections',
+                        side_effect=RuntimeError('нет соединения')):
+            with self.assertRaises(RuntimeError):
+                self.coordinator.submit(
+                    Group.objects.create, title='Группа', slug='group',
+                    timeout=1)
+
+    def test_view_answers_503_on_timeout(self):
+        """Неподтверждённая запись в представлении — ответ 503."""
+        user = User.objects.create(username='Tester')
+        author = User.objects.create(username='Author')
+        client = Client()
+        client.force_login(user)
+        with mock.patch('posts.views.run_write', side_effect=WriteTimeout):
+            response = client.get(
+                reverse('posts:profile_follow', args=[author.username]))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRouterTests(TransactionTestCase):
+    def setUp(self):
+        reset_replica_health()
+        record_heartbeat()
+        self.directory = tempfile.mkdtemp()
+        self.replica_path = f'{self.directory}/replica.sqlite3'
+        self.copy_to_replica()
+        connections.databases['replica'] = {
+            'ENGINE': 'core.db.sqlite3',
+            'NAME': self.replica_path,
+        }
+        self.factory = RequestFactory()
+        self.middleware = PrimaryPinMiddleware(self.view)
+        self.write = False
+
+    def tearDown(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def copy_to_replica(self):
+        connection.ensure_connection()
+        replica = sqlite3.connect(self.replica_path)
+        connection.connection.backup(replica)
+        replica.close()
+
+    @replica_reads
+    def view(self, request):
+        if self.write:
+            Group.objects.create(title='Группа', slug='group')
+        return HttpResponse(Group.objects.all().db)
+
+    def get(self, **cookies):
+        request = self.factory.get('/')
+        request.COOKIES.update(cookies)
+        return self.middleware(request)
+
+    def test_reads_go_to_replica(self):
+        """Чтения помеченных представлений идут на реплику."""
+        self.assertEqual(self.get().content, b'replica')
+        self.assertEqual(Group.objects.all().db, 'default')
+
+    def test_session_reads_primary_after_write(self):
+        """После записи сессия какое-то время читает из основной БД."""
+        self.write = True
+        response = self.get()
+        self.assertEqual(response.content, b'default')
+        self.write = False
+        cookie = response.cookies[PRIMARY_PIN_COOKIE].value
+        self.assertEqual(
+            self.get(**{PRIMARY_PIN_COOKIE: cookie}).content, b'default')
+        self.assertEqual(self.get().content, b'replica')
+
+    def test_lagging_replica_not_used(self):
+        """Отстающая реплика не используется."""
+        ReplicaHeartbeat.objects.filter(pk=1).update(beat=0)
+        self.copy_to_replica()
+        self.assertEqual(self.get().content, b'default')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ResizedImageTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.name = default_storage.save('posts/pic.gif', ContentFile(
+            b'GIF89a\x02\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff'
+            b'!\xf9\x04\x00\x00\x00\x00\x00,\x00\x00\x00\x00\x02\x00\x01'
+            b'\x00\x00\x02\x02\x0c\n\x00;'))
+        self.url = resized_url(self.name, 40, 20, 'center', 'png')
+
+    def test_variant_served_with_immutable_caching(self):
+        """Вариант отдаётся с ETag и кешируется навсегда."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unsigned_size_rejected(self):
+        """Размер, которого нет в подписи, не делается."""
+        url = self.url.replace('40x20', '41x20')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_busy_when_too_many_pending(self):
+        """Сверх лимита новые варианты не делаются, ответ 503."""
+        with mock.patch('core.images._slots', threading.Semaphore(0)):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+
+    def test_busy_when_resize_times_out(self):
+        """Вариант, не готовый вовремя, даёт 503, а не ошибку."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_make(*args):
+            started.set()
+            release.wait(5)
+            return self.name
+
+        with mock.patch('core.images._make', slow_make), \
+                mock.patch('core.images.RESIZE_TIMEOUT', 0):
+            response = self.client.get(self.url)
+        release.set()
+        self.assertTrue(started.wait(5))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_variant_gone_with_deleted_post(self):
+        """Вариант картинки удалённого поста удаляется вместе с ней."""
+        post = Post.objects.create(
+            author=User.objects.create(username='Tester'), text='Пост',
+            image=SimpleUploadedFile('pic.gif', default_storage.open(
+                self.name).read()))
+        url = resized_url(post.image.name, 40, 20, 'center', 'png')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        post.delete()
+        # Очистка идёт в фоне одним потоком: ждём её очереди.
+        storage._cleanup.submit(lambda: None).result()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_not_an_image_not_found(self):
+        """Файл, который не картинка, даёт 404."""
+        name = default_storage.save(
+            'posts/broken.gif', ContentFile(b'not an image'))
+        response = self.client.get(resized_url(name, 40, 20))
+        self.assertEqual(response.status_code, 404)
+
+
+class SessionStoreTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.session = SessionStore()
+        self.session['answer'] = 42
+        self.session.create()
+        self.key = self.session.session_key
+
+    def tearDown(self):
+        session_writer.discard(self.key)
+
+    def db_data(self):
+        row = Session.objects.get(session_key=self.key)
+        return self.session.decode(row.session_data)
+
+    def test_unchanged_session_not_saved(self):
+        """Сессия без изменений не сохраняется."""
+        session = SessionStore(self.key)
+        session['answer'] = 42
+        session.save()
+        self.assertIsNone(session_writer.pending(self.key))
+
+    def test_changes_written_behind(self):
+        """Изменения сразу видны из кеша, в БД — после сброса очереди."""
+        session = SessionStore(self.key)
+        session['answer'] = 43
+        session.save()
+        self.assertEqual(SessionStore(self.key)['answer'], 43)
+        self.assertEqual(self.db_data()['answer'], 42)
+        session_writer.flush()
+        self.assertEqual(self.db_data()['answer'], 43)
+
+    def test_deleted_session_not_resurrected(self):
+        """Отложенная запись не возвращает удалённую сессию."""
+        session = SessionStore(self.key)
+        session['answer'] = 43
+        session.save()
+        session_writer.schedule(
+            Session, self.key, session.encode({'answer': 43}),
+            session.get_expiry_date())
+        SessionStore(self.key).delete()
+        session_writer.flush()
+        self.assertFalse(Session.objects.filter(
+            session_key=self.key).exists())
+
+    @mock.patch('core.sessions.SESSION_CLEANUP_BATCH_SIZE', 2)
+    def test_clear_expired_in_batches(self):
+        """Истёкшие сессии удаляются пачками, живые остаются."""
+        Session.objects.bulk_create(
+            Session(session_key=f'expired{number}', session_data='',
+                    expire_date=timezone.now() - timedelta(days=1))
+            for number in range(5))
+        SessionStore.clear_expired()
+        self.assertEqual(list(Session.objects.values_list(
+            'session_key', flat=True)), [self.key])
+
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('Tester', password='secret')
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+
+    def get_user(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore(self.session_key)
+        return get_cached_user(request)
+
+    def test_user_loaded_once_per_session(self):
+        """Повторные запросы сессии не читают пользователя из БД."""
+        self.assertEqual(self.get_user(), self.user)
+        with self.assertNumQueries(0):
+            user = self.get_user()
+        self.assertEqual(user, self.user)
+        self.assertTrue(user.is_authenticated)
+
+    def test_user_save_resets_cache(self):
+        """Сохранение пользователя сбрасывает закешированную запись."""
+        self.get_user()
+        self.user.first_name = 'Имя'
+        self.user.save()
+        self.assertEqual(self.get_user().get_full_name(), 'Имя')
+
+    def test_password_change_logs_out(self):
+        """После смены пароля старая сессия больше не действует."""
+        self.get_user()
+        self.user.set_password('other')
+        self.user.save()
+        self.assertFalse(self.get_user().is_authenticated)
+
+    def test_password_hash_not_cached(self):
+        """Хеш пароля в кеш не попадает, сохранение его не стирает."""
+        self.get_user()
+        user = self.get_user()
+        self.assertNotIn('password', user.__dict__)
+        user.first_name = 'Имя'
+        user.save()
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password(
+            'secret'))
+
+    def test_logout_resets_cache(self):
+        """Выход сбрасывает закешированную запись."""
+        self.get_user()
+        user_logged_out.send(sender=User, request=None, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.get_user()
+        self.assertTrue(queries)
+
+    def test_deactivated_user_logged_out(self):
+        """После ``update()`` и ``invalidate_users`` выключенный
+        пользователь не авторизован."""
+        self.get_user()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        invalidate_users([self.user.pk])
+        self.assertFalse(self.get_user().is_authenticated)
@@ -1,4 +1,14 @@
+import mimetypes
+
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from core import images
+
+RESIZED_IMAGE_MAX_AGE = 60 * 60 * 24 * 365
 
 
 def page_not_found(request, exception):
@@ -15,3 +25,42 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def _resize_params(request, signature, width, height, name):
+    crop = request.GET.get('crop', '')
+    fmt = request.GET.get('format', 'jpeg')
+    if not images.is_valid(width, height, crop, fmt):
+        return None
+    key = images.variant_key(name, width, height, crop, fmt)
+    if not images.check_signature(key, signature):
+        return None
+    return crop, fmt, key
+
+
+def _resized_etag(request, **kwargs):
+    params = _resize_params(request, **kwargs)
+    return images.variant_etag(params[2]) if params else None
+
+
+@require_GET
+@condition(etag_func=_resized_etag)
+def resized_image(request, signature, width, height, name):
+    params = _resize_params(request, signature, width, height, name)
+    if params is None:
+        raise Http404
+    crop, fmt, key = params
+    try:
+        thumbnail = images.resize(name, width, height, crop, fmt)
+    except images.ResizeBusy:
+        response = HttpResponse(status=503)
+        response['Retry-After'] = '1'
+        return response
+    except (FileNotFoundError, images.NotAnImage):
+        raise Http404
+    response = FileResponse(
+        default_storage.open(thumbnail),
+        content_type=mimetypes.guess_type(thumbnail)[0])
+    patch_cache_control(response, public=True,
+                        max_age=RESIZED_IMAGE_MAX_AGE, immutable=True)
+    return response
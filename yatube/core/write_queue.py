@@ -0,0 +1,143 @@
+"""Очередь записей в БД с одним писателем.
+
+SQLite пропускает одного писателя за раз, и при всплесках запросы ждут
+блокировку друг за другом. Мелкие записи (комментарии, подписки)
+передаются потоку-писателю: он собирает их в пачки и выполняет каждую
+пачку одной короткой транзакцией, каждую запись — в своей точке
+сохранения, так что ошибка одной записи не отменяет остальные.
+Вызывающий ждёт подтверждения коммита не дольше ``WRITE_TIMEOUT`` секунд.
+
+Внутри транзакции вызывающего запись выполняется сразу, чтобы стать её
+частью. Записи разных процессов упорядочивает сама БД
+(``BEGIN IMMEDIATE`` и ``busy_timeout``, см. ``core.db.sqlite3``).
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from functools import wraps
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.http import HttpResponse
+
+from core.cache_versions import deferred_invalidation
+from core.routers import pin_to_primary
+
+BATCH_SIZE = 50
+BATCH_WINDOW = 0.005
+QUEUE_SIZE = 1000
+WRITE_TIMEOUT = 10
+RETRY_AFTER = 5
+
+
+class WriteTimeout(Exception):
+    """Запись не подтверждена за отведённое время."""
+
+
+class WriteCoordinator:
+    def __init__(self, batch_size=BATCH_SIZE, batch_window=BATCH_WINDOW,
+                 queue_size=QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, timeout=WRITE_TIMEOUT, **kwargs):
+        """Выполняет ``func`` в потоке-писателе и возвращает её результат.
+
+        Если за ``timeout`` секунд запись не дошла до выполнения, она
+        отменяется и выбрасывается ``WriteTimeout``. Уже начатую запись
+        отменить нельзя, её результат дожидается.
+        """
+        deadline = time.monotonic() + timeout
+        future = Future()
+        self._start()
+        try:
+            self._queue.put((func, args, kwargs, future), timeout=timeout)
+        except queue.Full:
+            raise WriteTimeout('Очередь записей переполнена') from None
+        try:
+            return future.result(max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            if future.cancel():
+                raise WriteTimeout('Запись не подтверждена вовремя') from None
+        # Писатель уже выполняет запись: она закоммитится, ждём итог.
+        return future.result()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='write-coordinator', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(
+                        timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self._execute(batch)
+
+    def _execute(self, batch):
+        results = []
+        try:
+            close_old_connections()
+            with deferred_invalidation(), transaction.atomic():
+                for func, args, kwargs, future in batch:
+                    # Отменённые по таймауту записи пропускаются.
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic():
+                            results.append(
+                                (future, func(*args, **kwargs), None))
+                    except Exception as error:
+                        results.append((future, None, error))
+        except Exception as error:
+            # Пачка не закоммитилась: ошибку получают все её записи.
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+coordinator = WriteCoordinator()
+
+
+def run_write(func, *args, **kwargs):
+    """Выполняет запись ``func`` через очередь записей.
+
+    Без очереди (``WRITE_QUEUE_ENABLED = False``) и внутри транзакции
+    ``func`` вызывается сразу.
+    """
+    pin_to_primary()
+    if (not getattr(settings, 'WRITE_QUEUE_ENABLED', True)
+            or transaction.get_connection().in_atomic_block):
+        return func(*args, **kwargs)
+    return coordinator.submit(func, *args, **kwargs)
+
+
+def unavailable_on_timeout(view):
+    """Отвечает 503, если запись представления не подтверждена вовремя."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except WriteTimeout:
+            response = HttpResponse(
+                'Сервер перегружен, повторите позже.', status=503)
+            response['Retry-After'] = str(RETRY_AFTER)
+            return response
+    return wrapper
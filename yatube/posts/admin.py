@@ -1,20 +1,135 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 
-from .models import Group, Post
+from core.admin import BulkActionMixin
+from core.paginators import EstimatedCountPaginator
 
+from .models import Group, Post, User
+from .moderation import delete_posts, move_posts_to_group, reassign_posts
 
-class PostAdmin(admin.ModelAdmin):
+
+class LoadedGroupAutocomplete(AutocompleteSelect):
+    """Автокомплит группы, берущий выбранную группу из загруженного поста.
+
+    Стандартный виджет запрашивает выбранную группу отдельно для каждой
+    строки списка.
+    """
+    group = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = [str(choice) for choice in value if choice]
+        if self.group is None or selected != [str(self.group.pk)]:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name, self.group.pk, str(self.group), True, len(options)))
+        return [(None, options, 0)]
+
+
+class PostChangeListForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        widget = self.fields['group'].widget
+        widget = getattr(widget, 'widget', widget)
+        if isinstance(widget, LoadedGroupAutocomplete):
+            widget.group = self.instance.group
+
+
+class MoveToGroupForm(forms.Form):
+    group = forms.ModelChoiceField(
+        Group.objects.all(),
+        required=False,
+        label='Группа',
+        help_text='Пустое значение уберёт посты из групп',
+    )
+
+
+class ReassignAuthorForm(forms.Form):
+    username = forms.CharField(label='Имя пользователя нового автора')
+
+    def clean_username(self):
+        username = self.cleaned_data['username']
+        try:
+            self.cleaned_data['author'] = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise forms.ValidationError('Такого пользователя нет')
+        return username
+
+
+class PostAdmin(BulkActionMixin, admin.ModelAdmin):
     list_display = ('pk',
                     'text',
                     'pub_date',
                     'author',
-                    'group'
+                    'group',
+                    'views'
                     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('group',)
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
+    actions = ('move_to_group', 'reassign_author', 'delete_with_media')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'group':
+            kwargs['widget'] = LoadedGroupAutocomplete(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', PostChangeListForm)
+        return super().get_changelist_form(request, **kwargs)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Стандартное удаление строит дерево всех связанных объектов.
+        actions.pop('delete_selected', None)
+        return actions
+
+    def move_to_group(self, request, queryset):
+        form, response = self.confirm_bulk_action(
+            request, queryset, 'Перенос постов в группу', MoveToGroupForm)
+        if response:
+            return response
+        moved = move_posts_to_group(queryset, form.cleaned_data['group'])
+        self.message_user(request, f'Перенесено постов: {moved}')
+    move_to_group.short_description = 'Перенести в группу'
+    move_to_group.allowed_permissions = ('change',)
+
+    def reassign_author(self, request, queryset):
+        form, response = self.confirm_bulk_action(
+            request, queryset, 'Смена автора постов', ReassignAuthorForm)
+        if response:
+            return response
+        changed = reassign_posts(queryset, form.cleaned_data['author'])
+        self.message_user(request, f'Передано постов: {changed}')
+    reassign_author.short_description = 'Сменить автора'
+    reassign_author.allowed_permissions = ('change',)
+
+    def delete_with_media(self, request, queryset):
+        _, response = self.confirm_bulk_action(
+            request, queryset, 'Удаление постов с картинками')
+        if response:
+            return response
+        deleted = delete_posts(queryset)
+        self.message_user(request, f'Удалено постов: {deleted}')
+    delete_with_media.short_description = 'Удалить вместе с картинками'
+    delete_with_media.allowed_permissions = ('delete',)
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug')
+    search_fields = ('title', 'slug')
+    prepopulated_fields = {'slug': ('title',)}
 
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
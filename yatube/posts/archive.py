@@ -0,0 +1,125 @@
+"""Архив постов по месяцам.
+
+``ArchiveMonth`` хранит число постов за месяц для всего сайта, каждой
+группы и каждого автора, раздел задаёт строка ``scope``: ``site``,
+``group:<id>`` или ``author:<id>``. Сигналы поправляют счётчики при
+создании, переносе и удалении поста, массовые операции пересчитывают
+затронутые разделы через ``rebuild``. Страница месяца читает посты
+запросом по диапазону индексированного ``pub_date``, поэтому старый
+месяц стоит столько же, сколько свежий.
+"""
+from collections import Counter
+from datetime import date, datetime
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, DateField, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from core.sharding import shard_aliases
+
+from .models import ArchiveMonth, Post
+
+SITE_SCOPE = 'site'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scopes(group_id, author_id):
+    """Разделы архива, в которые попадает пост."""
+    scopes = [SITE_SCOPE, author_scope(author_id)]
+    if group_id is not None:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def month_of(moment):
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def month_range(month):
+    """Начало месяца и начало следующего в текущем часовом поясе."""
+    start = datetime(month.year, month.month, 1)
+    end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return timezone.make_aware(start), timezone.make_aware(end)
+
+
+def post_added(scopes, pub_date):
+    month = month_of(pub_date)
+    for scope in scopes:
+        months = ArchiveMonth.objects.filter(scope=scope, month=month)
+        if months.update(posts_count=F('posts_count') + 1):
+            continue
+        try:
+            with transaction.atomic():
+                ArchiveMonth.objects.create(
+                    scope=scope, month=month, posts_count=1)
+        except IntegrityError:
+            months.update(posts_count=F('posts_count') + 1)
+
+
+def post_removed(scopes, pub_date):
+    months = ArchiveMonth.objects.filter(
+        scope__in=scopes, month=month_of(pub_date))
+    months.filter(posts_count__lte=1).delete()
+    months.update(posts_count=F('posts_count') - 1)
+
+
+def _aggregate(fields, **filters):
+    """Число постов по месяцам со всех баз, где лежат посты."""
+    for alias in shard_aliases() or [DEFAULT_DB_ALIAS]:
+        posts = Post._base_manager.using(alias).filter(**filters)
+        yield from posts.order_by().annotate(
+            month=TruncMonth('pub_date', output_field=DateField())
+        ).values(*fields, 'month').annotate(posts_count=Count('pk'))
+
+
+def rebuild(group_ids=(), author_ids=(), site_months=()):
+    """Пересчитывает месяцы разделов по таблице постов.
+
+    Для всего сайта пересчитываются только месяцы ``site_months``.
+    """
+    group_ids, author_ids = list(group_ids), list(author_ids)
+    site_months = set(site_months)
+    scopes = ([group_scope(pk) for pk in group_ids]
+              + [author_scope(pk) for pk in author_ids])
+    counts = Counter()
+    if group_ids:
+        for row in _aggregate(['group_id'], group_id__in=group_ids):
+            counts[group_scope(row['group_id']), row['month']] += (
+                row['posts_count'])
+    if author_ids:
+        for row in _aggregate(['author_id'], author_id__in=author_ids):
+            counts[author_scope(row['author_id']), row['month']] += (
+                row['posts_count'])
+    if site_months:
+        start = month_range(min(site_months))[0]
+        end = month_range(max(site_months))[1]
+        for row in _aggregate([], pub_date__gte=start, pub_date__lt=end):
+            if row['month'] in site_months:
+                counts[SITE_SCOPE, row['month']] += row['posts_count']
+    with transaction.atomic():
+        ArchiveMonth.objects.filter(scope__in=scopes).delete()
+        ArchiveMonth.objects.filter(
+            scope=SITE_SCOPE, month__in=site_months).delete()
+        ArchiveMonth.objects.bulk_create(
+            ArchiveMonth(scope=scope, month=month, posts_count=posts_count)
+            for (scope, month), posts_count in counts.items())
+
+
+def months(scope):
+    """Месяцы раздела с постами, от новых к старым."""
+    return list(ArchiveMonth.objects.filter(scope=scope).cached())
+
+
+def month_or_none(year, month):
+    try:
+        return date(year, month, 1)
+    except ValueError:
+        return None
@@ -1,2 +1,21 @@
 POSTS_LIMITER = 10
 MODEL_STR_TEXT = 15
+PAGE_CACHE_TIMEOUT = 20
+# Картинка поста в шаблонах posts/includes/post.html и post_detail.html.
+POST_IMAGE_SIZE = (960, 339)
+POST_IMAGE_CROP = 'center'
+MODERATION_BATCH_SIZE = 500
+IMAGE_UPLOAD_DIR = 'posts'
+VIEWS_BATCH_SIZE = 500
+LIKE_COUNTER_SLOTS = 8
+LIKES_CACHE_TIMEOUT = 60
+TRENDING_SIZE = 50
+TRENDING_HALF_LIFE = 60 * 60 * 6
+TRENDING_MIN_SCORE = 0.01
+TRENDING_VIEW_WEIGHT = 1
+TRENDING_LIKE_WEIGHT = 3
+TRENDING_COMMENT_WEIGHT = 5
+GROUPS_PER_PAGE = 20
+GROUP_TOP_AUTHORS = 3
+POPULAR_TAGS = 50
+EXCERPT_LENGTH = 500
@@ -0,0 +1,41 @@
+"""Счётчик просмотров постов, см. ``core.counters``."""
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, transaction
+from django.db.models import F
+
+from core.counters import BufferedCounter
+from core.sharding import shard_aliases
+from posts.const import TRENDING_VIEW_WEIGHT, VIEWS_BATCH_SIZE
+
+from .models import Post
+from .trending import trending_events
+
+
+def save_post_views(groups):
+    close_old_connections()
+    # Шард поста по ключу не узнать, обновление идёт на всех: строка
+    # поста есть только на одном.
+    for alias in shard_aliases() or [DEFAULT_DB_ALIAS]:
+        posts = Post._base_manager.using(alias)
+        with transaction.atomic(using=alias):
+            for amount, pks in groups.items():
+                for start in range(0, len(pks), VIEWS_BATCH_SIZE):
+                    posts.filter(
+                        pk__in=pks[start:start + VIEWS_BATCH_SIZE]
+                    ).update(views=F('views') + amount)
+
+
+post_views = BufferedCounter(save_post_views)
+
+
+def count_views(view):
+    """Считает успешные просмотры поста, в том числе из кеша страниц."""
+    @wraps(view)
+    def wrapper(request, post_id, *args, **kwargs):
+        response = view(request, post_id, *args, **kwargs)
+        if request.method == 'GET' and response.status_code == 200:
+            post_views.add(post_id)
+            trending_events.add(post_id, TRENDING_VIEW_WEIGHT)
+        return response
+    return wrapper
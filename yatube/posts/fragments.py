@@ -0,0 +1,62 @@
+from core.fragments import register
+
+from .forms import CommentForm
+from .likes import like_counts, liked_posts
+from .models import Follow
+
+
+@register('switcher', 'posts/includes/switcher.html')
+def switcher(request):
+    url_name = request.resolver_match.url_name
+    return {
+        'index': url_name == 'index',
+        'trending': url_name == 'trending',
+        'follow': url_name == 'follow_index',
+    }
+
+
+@register('follow_button', 'posts/includes/follow_button.html')
+def follow_button(request, username):
+    following = (
+        request.user.is_authenticated
+        and Follow.objects.filter(
+            user=request.user, author__username=username).exists()
+    )
+    return {
+        'username': username,
+        'following': following,
+    }
+
+
+@register('post_controls', 'posts/includes/post_controls.html')
+def post_controls(request, post_id, author_id):
+    return {
+        'post_id': post_id,
+        'author_id': author_id,
+    }
+
+
+@register('comment_form', 'posts/includes/comment_form.html')
+def comment_form(request, post_id):
+    return {
+        'post_id': post_id,
+        'form': CommentForm(),
+    }
+
+
+def like_states(request, kwargs_list):
+    post_ids = [kwargs['post_id'] for kwargs in kwargs_list]
+    return {
+        'counts': like_counts(post_ids),
+        'liked': liked_posts(request.user, post_ids),
+    }
+
+
+@register('like_button', 'posts/includes/like_button.html',
+          prefetch=like_states)
+def like_button(request, post_id, prefetched):
+    return {
+        'post_id': post_id,
+        'likes': prefetched['counts'][post_id],
+        'liked': post_id in prefetched['liked'],
+    }
@@ -0,0 +1,93 @@
+"""Сводки по группам для каталога групп.
+
+``GroupStats`` хранит число постов и время последнего поста группы,
+``GroupAuthorStats`` — число постов каждого автора в группе. Сигналы
+поправляют их при создании, удалении и переносе отдельного поста, так
+что каталогу не нужно агрегировать таблицу постов. Массовые операции
+(``bulk_changes``) пересчитывают затронутые группы через ``rebuild``.
+"""
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F, Max, Q
+
+from core.sharding import shard_aliases
+
+from .models import GroupAuthorStats, GroupStats, Post
+
+
+def _increment(queryset, create):
+    if queryset.update(posts_count=F('posts_count') + 1):
+        return
+    try:
+        with transaction.atomic():
+            create()
+    except IntegrityError:
+        queryset.update(posts_count=F('posts_count') + 1)
+
+
+def post_added(group_id, author_id, pub_date):
+    stats = GroupStats.objects.filter(group_id=group_id)
+    _increment(stats, lambda: GroupStats.objects.create(
+        group_id=group_id, posts_count=1, last_post_at=pub_date))
+    stats.filter(
+        Q(last_post_at__lt=pub_date) | Q(last_post_at__isnull=True)
+    ).update(last_post_at=pub_date)
+    authors = GroupAuthorStats.objects.filter(
+        group_id=group_id, author_id=author_id)
+    _increment(authors, lambda: GroupAuthorStats.objects.create(
+        group_id=group_id, author_id=author_id, posts_count=1))
+
+
+def post_removed(group_id, author_id, pub_date):
+    stats = GroupStats.objects.filter(group_id=group_id)
+    stats.filter(posts_count__gt=0).update(
+        posts_count=F('posts_count') - 1)
+    authors = GroupAuthorStats.objects.filter(
+        group_id=group_id, author_id=author_id)
+    authors.filter(posts_count__lte=1).delete()
+    authors.update(posts_count=F('posts_count') - 1)
+    # Время последнего поста ищется заново, только если удалён он сам.
+    if stats.filter(last_post_at__lte=pub_date).exists():
+        rebuild([group_id])
+
+
+def _aggregate(group_ids):
+    """Строки постов групп со всех баз, где лежат посты."""
+    for alias in shard_aliases() or [DEFAULT_DB_ALIAS]:
+        posts = Post._base_manager.using(alias).filter(
+            group_id__in=group_ids).order_by()
+        yield from posts.values('group_id', 'author_id').annotate(
+            posts_count=Count('pk'), last_post_at=Max('pub_date'))
+
+
+def rebuild(group_ids):
+    """Пересчитывает сводки ``group_ids`` по таблице постов."""
+    group_ids = list(group_ids)
+    groups = {}
+    authors = []
+    for row in _aggregate(group_ids):
+        stats = groups.setdefault(row['group_id'], GroupStats(
+            group_id=row['group_id'], posts_count=0))
+        stats.posts_count += row['posts_count']
+        if (stats.last_post_at is None
+                or row['last_post_at'] > stats.last_post_at):
+            stats.last_post_at = row['last_post_at']
+        authors.append(GroupAuthorStats(
+            group_id=row['group_id'], author_id=row['author_id'],
+            posts_count=row['posts_count']))
+    with transaction.atomic():
+        GroupStats.objects.filter(group_id__in=group_ids).delete()
+        GroupAuthorStats.objects.filter(group_id__in=group_ids).delete()
+        GroupStats.objects.bulk_create(groups.values())
+        GroupAuthorStats.objects.bulk_create(authors)
+
+
+def top_authors(group_ids, limit):
+    """Самые активные авторы каждой из ``group_ids``, одним запросом."""
+    top = {group_id: [] for group_id in group_ids}
+    rows = GroupAuthorStats.objects.filter(
+        group_id__in=group_ids).select_related('author').order_by(
+            'group_id', '-posts_count')
+    for row in rows:
+        if len(top[row.group_id]) < limit:
+            top[row.group_id].append(row.author)
+    return top
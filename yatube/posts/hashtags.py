@@ -0,0 +1,87 @@
+"""Хештеги постов.
+
+При сохранении поста хештеги из текста (``markup.extract_hashtags``)
+записываются в ``Tag`` и ``PostTag``. ``PostTag`` хранит дату поста и
+индексирован по ``(tag, -pub_date, -post_id)``, поэтому лента тега
+читает индекс по курсору, а не ищет по тексту постов. ``Tag.posts_count``
+меняется на разницу тегов при каждом сохранении и удалении поста,
+популярные теги берутся по индексу на этом поле. Хештеги комментариев
+не индексируются и ссылками не становятся (см. ``posts.markup``).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from .markup import extract_hashtags
+from .models import PostTag, Tag
+
+
+def _change_counts(amounts):
+    """Меняет ``posts_count`` тегов на ``{tag_id: приращение}``."""
+    groups = {}
+    for tag_id, amount in amounts.items():
+        groups.setdefault(amount, []).append(tag_id)
+    for amount, tag_ids in groups.items():
+        Tag.objects.filter(pk__in=tag_ids).update(
+            posts_count=F('posts_count') + amount)
+
+
+def _get_or_create(names):
+    Tag.objects.bulk_create(
+        [Tag(name=name) for name in names], ignore_conflicts=True)
+    return list(Tag.objects.filter(name__in=names))
+
+
+def sync_post(post):
+    """Приводит теги поста к тегам его текста.
+
+    Теги поста читаются в той же транзакции, что их меняет, а счётчики
+    меняются только на действительно добавленные и удалённые строки
+    ``PostTag``: одновременные сохранения поста их не сбивают.
+
+    Возвращает имена всех тегов поста, прежних и новых, и признак того,
+    что число постов у тегов изменилось.
+    """
+    names = extract_hashtags(post.text)
+    with transaction.atomic():
+        current = dict(PostTag.objects.filter(
+            post_id=post.pk).values_list('tag__name', 'tag_id'))
+        added = names - current.keys()
+        removed = current.keys() - names
+        if removed:
+            tag_ids = [current[name] for name in removed]
+            PostTag.objects.filter(
+                post_id=post.pk, tag_id__in=tag_ids).delete()
+            _change_counts(dict.fromkeys(tag_ids, -1))
+        if added:
+            tags = _get_or_create(added)
+            # Строки, уже записанные другим сохранением, уже посчитаны.
+            existing = set(PostTag.objects.filter(
+                post_id=post.pk, tag__in=tags).values_list(
+                    'tag_id', flat=True))
+            tags = [tag for tag in tags if tag.pk not in existing]
+            PostTag.objects.bulk_create([
+                PostTag(tag=tag, post_id=post.pk, pub_date=post.pub_date)
+                for tag in tags])
+            _change_counts(dict.fromkeys([tag.pk for tag in tags], 1))
+    return names | current.keys(), bool(added or removed)
+
+
+def remove_posts(post_ids):
+    """Убирает посты из лент тегов и возвращает имена этих тегов."""
+    with transaction.atomic():
+        rows = list(PostTag.objects.filter(
+            post_id__in=post_ids).values_list('tag_id', 'tag__name'))
+        if not rows:
+            return set()
+        PostTag.objects.filter(post_id__in=post_ids).delete()
+        _change_counts({
+            tag_id: -amount for tag_id, amount in Counter(
+                tag_id for tag_id, _ in rows).items()})
+    return {name for _, name in rows}
+
+
+def post_tag_names(post_ids):
+    return set(PostTag.objects.filter(post_id__in=post_ids).values_list(
+        'tag__name', flat=True))
@@ -0,0 +1,88 @@
+"""Лайки постов.
+
+Число лайков поста разложено по ``LIKE_COUNTER_SLOTS`` строкам
+``LikeCounter``: лайк меняет случайную из них, поэтому одновременные
+лайки популярного поста не ждут блокировку одной строки. Для показа
+строки суммируются, сумма кешируется до следующего лайка поста или на
+``LIKES_CACHE_TIMEOUT`` секунд. Лайки и счётчики лежат на шарде поста.
+"""
+import random
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from core.sharding import shard_for_author
+from posts.const import LIKE_COUNTER_SLOTS, LIKES_CACHE_TIMEOUT
+
+from .models import Like, LikeCounter
+
+LIKES_CACHE_PREFIX = 'likes'
+
+
+def _count_key(post_id):
+    return f'{LIKES_CACHE_PREFIX}:{post_id}'
+
+
+def _change_counter(post, using, delta):
+    slot = random.randrange(LIKE_COUNTER_SLOTS)
+    counters = LikeCounter.objects.using(using).filter(post=post, slot=slot)
+    if counters.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic(using=using):
+            LikeCounter.objects.using(using).create(
+                post=post, slot=slot, count=delta)
+    except IntegrityError:
+        counters.update(count=F('count') + delta)
+
+
+def like(user, post):
+    """Ставит лайк; False, если он уже стоял."""
+    using = shard_for_author(post.author_id)
+    try:
+        with transaction.atomic(using=using):
+            Like.objects.using(using).create(user=user, post=post)
+            _change_counter(post, using, 1)
+    except IntegrityError:
+        return False
+    cache.delete(_count_key(post.pk))
+    return True
+
+
+def unlike(user, post):
+    """Снимает лайк; False, если его не было."""
+    using = shard_for_author(post.author_id)
+    with transaction.atomic(using=using):
+        deleted, _ = Like.objects.using(using).filter(
+            user=user, post=post).delete()
+        if deleted:
+            _change_counter(post, using, -1)
+    cache.delete(_count_key(post.pk))
+    return bool(deleted)
+
+
+def like_counts(post_ids):
+    """Число лайков каждого из ``post_ids`` одним запросом на промахи."""
+    keys = {_count_key(pk): pk for pk in post_ids}
+    counts = {keys[key]: count
+              for key, count in cache.get_many(keys).items()}
+    missing = [pk for pk in keys.values() if pk not in counts]
+    if missing:
+        loaded = dict.fromkeys(missing, 0)
+        loaded.update(LikeCounter.objects.filter(
+            post_id__in=missing).order_by().values('post_id').annotate(
+                total=Sum('count')).values_list('post_id', 'total'))
+        cache.set_many({_count_key(pk): count
+                        for pk, count in loaded.items()},
+                       LIKES_CACHE_TIMEOUT)
+        counts.update(loaded)
+    return counts
+
+
+def liked_posts(user, post_ids):
+    """Те из ``post_ids``, которые лайкнул ``user``."""
+    if not user.is_authenticated or not post_ids:
+        return set()
+    return set(Like.objects.filter(
+        user=user, post_id__in=post_ids).values_list('post_id', flat=True))
@@ -0,0 +1,176 @@
+import heapq
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection
+from sorl.thumbnail import delete as delete_image
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from core.models import StoredFile
+from core.sharding import shard_aliases
+from posts.const import IMAGE_UPLOAD_DIR
+from posts.models import Post
+
+CHUNK_SIZE = 100000
+DELETE_BATCH_SIZE = 500
+
+
+def sorted_stream(names, chunk_size=CHUNK_SIZE):
+    """Сортирует поток имён кусками во временных файлах.
+
+    В памяти одновременно не больше ``chunk_size`` имён, куски
+    сливаются через ``heapq.merge``. Повторы отбрасываются.
+    """
+    with ExitStack() as stack:
+        chunks = []
+        names = iter(names)
+        while True:
+            chunk = sorted(islice(names, chunk_size))
+            if not chunk:
+                break
+            chunk_file = stack.enter_context(tempfile.TemporaryFile('w+'))
+            chunk_file.writelines(f'{name}\n' for name in chunk)
+            chunk_file.seek(0)
+            chunks.append(line.rstrip('\n') for line in chunk_file)
+        previous = None
+        for name in heapq.merge(*chunks):
+            if name != previous:
+                yield name
+            previous = name
+
+
+def walk_files(root, directory):
+    """Имена всех файлов каталога ``directory`` относительно ``root``."""
+    for path, _, filenames in os.walk(os.path.join(root, directory)):
+        relative = os.path.relpath(path, root).replace(os.sep, '/')
+        for filename in filenames:
+            yield f'{relative}/{filename}'
+
+
+def unreferenced(files, references):
+    """Имена из ``files``, которых нет в ``references``.
+
+    Оба потока отсортированы, поэтому хватает одного прохода.
+    """
+    reference = next(references, None)
+    for name in files:
+        while reference is not None and reference < name:
+            reference = next(references, None)
+        if name != reference:
+            yield name
+
+
+def close_connection(func):
+    def wrapper(*args):
+        try:
+            return func(*args)
+        finally:
+            connection.close()
+    return wrapper
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов и миниатюры, на которые ничего не '
+            'ссылается. Каталоги и ссылки сравниваются потоково, по '
+            'отсортированным кускам.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено.')
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Не трогать файлы моложе этого срока: '
+                                 'их пост может быть ещё не сохранён.')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        self.cutoff = time.time() - options['grace_hours'] * 3600
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        with ThreadPoolExecutor(options['workers']) as pool:
+            images = self.collect(
+                pool, storage, IMAGE_UPLOAD_DIR, self.image_names(),
+                self.delete_images)
+            thumbnails = self.collect(
+                pool, default_storage,
+                thumbnail_settings.THUMBNAIL_PREFIX.strip('/'),
+                self.thumbnail_names(), self.delete_thumbnails)
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} картинок: {images}, миниатюр: {thumbnails}'))
+
+    def image_names(self):
+        aliases = dict.fromkeys([DEFAULT_DB_ALIAS, *shard_aliases()])
+        for alias in aliases:
+            yield from Post._base_manager.using(alias).exclude(
+                image='').values_list('image', flat=True).iterator()
+
+    def thumbnail_names(self):
+        # Миниатюры исходников, которые ещё лежат в хранилище. Записи
+        # sorl об удалённых исходниках остаются, и по ним миниатюры
+        # держались бы вечно.
+        prefix = add_prefix('', 'thumbnails')
+        lists = KVStore.objects.filter(
+            key__startswith=prefix).values_list('key', 'value').iterator()
+        for key, value in lists:
+            source = KVStore.objects.filter(
+                key=add_prefix(key[len(prefix):])
+            ).values_list('value', flat=True).first()
+            if source is None or not deserialize_image_file(source).exists():
+                continue
+            values = KVStore.objects.filter(
+                key__in=[add_prefix(thumbnail)
+                         for thumbnail in deserialize(value)]
+            ).values_list('value', flat=True)
+            for thumbnail in values:
+                yield deserialize_image_file(thumbnail).name
+
+    def collect(self, pool, storage, directory, references, delete):
+        files = sorted_stream(walk_files(storage.location, directory))
+        orphans = (
+            name for name in unreferenced(files, sorted_stream(references))
+            if self.expired(storage, name)
+        )
+        deleted = 0
+        futures = []
+        while True:
+            batch = list(islice(orphans, DELETE_BATCH_SIZE))
+            if not batch:
+                break
+            deleted += len(batch)
+            if self.verbosity > 1 or self.dry_run:
+                for name in batch:
+                    self.stdout.write(name)
+            if not self.dry_run:
+                futures.append(pool.submit(delete, storage, batch))
+        for future in futures:
+            future.result()
+        return deleted
+
+    def expired(self, storage, name):
+        try:
+            return os.path.getmtime(storage.path(name)) < self.cutoff
+        except FileNotFoundError:
+            # Файл уже удалил кто-то другой.
+            return False
+
+    @close_connection
+    def delete_images(self, storage, names):
+        StoredFile.objects.filter(name__in=names).delete()
+        for name in names:
+            delete_image(ImageFile(name, storage))
+
+    @close_connection
+    def delete_thumbnails(self, storage, names):
+        for name in names:
+            storage.delete(name)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from core.models import StoredFile
+from core.page_cache import invalidate_page_tags
+from posts.const import IMAGE_UPLOAD_DIR
+from posts.models import Post
+from posts.moderation import page_tags
+from posts.signals import bulk_changes
+
+
+def hashed_path(name):
+    """``posts/ab/cd/<имя>`` по хешу имени.
+
+    Имена в общем каталоге уникальны, а путь нужен один и тот же при
+    повторном запуске, поэтому здесь хешируется имя.
+    """
+    filename = os.path.basename(name)
+    digest = hashlib.md5(filename.encode()).hexdigest()
+    return f'{IMAGE_UPLOAD_DIR}/{digest[:2]}/{digest[2:4]}/{filename}'
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки из общего каталога posts/ в каталоги по '
+            'хешу имени и обновляет пути в постах. Прерванный перенос '
+            'продолжается с того же места при повторном запуске.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, что нужно перенести.')
+
+    def handle(self, *args, **options):
+        # Ещё не перенесённые картинки лежат прямо в posts/.
+        pending = Post.objects.filter(
+            image__regex=rf'^{IMAGE_UPLOAD_DIR}/[^/]+$').only('pk', 'image')
+        if options['dry_run']:
+            self.stdout.write(f'Нужно перенести картинок: {pending.count()}')
+            return
+        moved = failed = 0
+        last_pk = 0
+        with ThreadPoolExecutor(options['workers']) as pool:
+            while True:
+                batch = list(pending.filter(pk__gt=last_pk).order_by('pk')[
+                    :options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                names = [post.image.name for post in batch]
+                new_names = list(pool.map(self.move_file, names))
+                changes = {post.pk: (post.image.name, new_name)
+                           for post, new_name in zip(batch, new_names)
+                           if new_name}
+                self.save_paths(changes)
+                moved += len(changes)
+                failed += len(batch) - len(changes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено картинок: {moved}, ошибок: {failed}'))
+
+    def move_file(self, name):
+        """Переносит файл и возвращает новое имя или None при ошибке."""
+        target = hashed_path(name)
+        try:
+            if default_storage.exists(name):
+                # Остаток прерванного переноса: копия могла не дописаться.
+                if (default_storage.exists(target)
+                        and default_storage.size(target)
+                        != default_storage.size(name)):
+                    default_storage.delete(target)
+                if not default_storage.exists(target):
+                    with default_storage.open(name) as source:
+                        saved = default_storage.save(target, source)
+                    if saved != target:
+                        default_storage.delete(saved)
+                        raise OSError(f'{target} уже занят')
+                default_storage.delete(name)
+            elif not default_storage.exists(target):
+                raise FileNotFoundError(name)
+        except OSError as error:
+            self.stderr.write(f'{name}: {error}')
+            return None
+        # sorl помнит миниатюры по имени и классу хранилища поля.
+        delete_thumbnails(
+            ImageFile(name, Post._meta.get_field('image').storage),
+            delete_file=False)
+        return target
+
+    def save_paths(self, changes):
+        if not changes:
+            return
+        with bulk_changes():
+            with transaction.atomic():
+                for pk, (old_name, new_name) in changes.items():
+                    Post.objects.filter(pk=pk).update(image=new_name)
+                    StoredFile.objects.filter(name=old_name).update(
+                        name=new_name)
+            invalidate_page_tags(*page_tags(list(changes)))
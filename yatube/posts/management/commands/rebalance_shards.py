@@ -0,0 +1,78 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from core.sharding import shard_aliases, shard_for_author
+from posts.models import Comment, Post
+from posts.sharding import move_posts, move_rows
+from posts.signals import bulk_changes
+
+
+class Command(BaseCommand):
+    help = ('Переносит посты с комментариями и лайками на шарды их '
+            'авторов после изменения POST_SHARDS, в том числе из основной '
+            'БД.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, что нужно перенести.')
+
+    def handle(self, *args, **options):
+        shards = shard_aliases()
+        if not shards:
+            self.stdout.write('Шарды не настроены, переносить нечего.')
+            return
+        moved = Counter()
+        # Страницы не меняются, сбрасывать кеш по каждому посту не нужно.
+        with bulk_changes():
+            for source in [DEFAULT_DB_ALIAS, *shards]:
+                moved.update(self.rebalance(
+                    source, options['batch_size'], options['dry_run']))
+        verb = 'Нужно перенести' if options['dry_run'] else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} постов: {moved["posts"]}, '
+            f'комментариев: {moved["comments"]}'))
+
+    def misplaced(self, queryset, source):
+        """Ключи строк ``queryset``, лежащих не на своём шарде."""
+        rows = queryset.order_by().values_list('pk', 'author_id')
+        targets = {}
+        for pk, author_id in rows.iterator():
+            target = shard_for_author(author_id)
+            if target != source:
+                targets.setdefault(target, []).append(pk)
+        return targets
+
+    def rebalance(self, source, batch_size, dry_run):
+        moved = Counter()
+        post_targets = self.misplaced(
+            Post._base_manager.using(source), source)
+        # Комментарии без поста лежат на шарде своего автора.
+        comment_targets = self.misplaced(
+            Comment._base_manager.using(source).filter(post__isnull=True),
+            source)
+        for target, pks in post_targets.items():
+            for start in range(0, len(pks), batch_size):
+                batch = pks[start:start + batch_size]
+                moved.update(self.move_posts(source, target, batch, dry_run))
+        for target, pks in comment_targets.items():
+            for start in range(0, len(pks), batch_size):
+                batch = pks[start:start + batch_size]
+                moved['comments'] += self.move(
+                    Comment, source, target, batch, dry_run)
+        return moved
+
+    def move_posts(self, source, target, pks, dry_run):
+        if dry_run:
+            comments = Comment._base_manager.using(source).filter(
+                post_id__in=pks).count()
+        else:
+            comments = move_posts(source, target, pks)
+        return {'posts': len(pks), 'comments': comments}
+
+    def move(self, model, source, target, pks, dry_run):
+        if not dry_run:
+            move_rows(model, source, target, pks)
+        return len(pks)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.group_stats import rebuild
+from posts.models import Group
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сводки каталога групп по таблице постов, '
+            'например после переноса постов в обход сигналов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        group_ids = list(Group.objects.values_list('pk', flat=True))
+        size = options['batch_size']
+        for start in range(0, len(group_ids), size):
+            rebuild(group_ids[start:start + size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано групп: {len(group_ids)}'))
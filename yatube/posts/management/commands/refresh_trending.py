@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.const import TRENDING_SIZE
+from posts.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает список популярных постов по затухающим '
+            'рейтингам. Запускается по расписанию, например раз в минуту.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=TRENDING_SIZE)
+
+    def handle(self, *args, **options):
+        ranked = refresh_trending(options['size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярных постов: {ranked}'))
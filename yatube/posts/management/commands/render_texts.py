@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.page_cache import invalidate_page_tags
+from posts import hashtags
+from posts.markup import RENDERER_VERSION
+from posts.models import Comment, Post
+from posts.moderation import page_tags
+from posts.signals import bulk_changes
+
+
+class Command(BaseCommand):
+    help = ('Заново размечает тексты постов и комментариев, размеченные '
+            'старой версией рендерера, и обновляет начала и теги постов. '
+            'Прерванный запуск продолжается с того же места при повторном.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true',
+                            help='Разметить все тексты, а не только старые.')
+
+    def handle(self, *args, **options):
+        for model, fields in ((Post, ['pk', 'text', 'pub_date']),
+                              (Comment, ['pk', 'text', 'post_id'])):
+            pending = model.objects.only(*fields)
+            if not options['all']:
+                pending = pending.filter(
+                    text_html_version__lt=RENDERER_VERSION)
+            rendered = self.render(pending, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: {rendered}'))
+
+    def render(self, pending, batch_size):
+        rendered = 0
+        last_pk = 0
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk).order_by('pk')[
+                :batch_size])
+            if not batch:
+                return rendered
+            last_pk = batch[-1].pk
+            for obj in batch:
+                obj.render_text()
+            self.save(batch)
+            rendered += len(batch)
+
+    def save(self, batch):
+        model = type(batch[0])
+        with bulk_changes():
+            with transaction.atomic():
+                for obj in batch:
+                    model.objects.filter(pk=obj.pk).update(**{
+                        field: getattr(obj, field)
+                        for field in model.rendered_fields})
+            if model is Post:
+                for obj in batch:
+                    hashtags.sync_post(obj)
+                tags = page_tags([obj.pk for obj in batch]) | {'tags'}
+            else:
+                tags = {f'post:{obj.post_id}' for obj in batch
+                        if obj.post_id is not None}
+            invalidate_page_tags(*tags)
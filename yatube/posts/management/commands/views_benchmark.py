@@ -0,0 +1,107 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from core.counters import BufferedCounter
+from posts.const import VIEWS_BATCH_SIZE
+
+BENCHMARK_ALIAS = 'views_benchmark'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает запись просмотров одним UPDATE на просмотр и '
+            'пачками через BufferedCounter на временной базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hits', type=int, default=20000)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=4)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            connections.databases[BENCHMARK_ALIAS] = {
+                'ENGINE': 'core.db.sqlite3',
+                'NAME': os.path.join(directory, 'benchmark.sqlite3'),
+                'OPTIONS': dict(
+                    settings.DATABASES['default'].get('OPTIONS', {})),
+            }
+            try:
+                self.run_benchmark(options)
+            finally:
+                connections[BENCHMARK_ALIAS].close()
+                del connections.databases[BENCHMARK_ALIAS]
+
+    def run_benchmark(self, options):
+        with connections[BENCHMARK_ALIAS].cursor() as cursor:
+            cursor.execute('CREATE TABLE benchmark '
+                           '(id INTEGER PRIMARY KEY, views INTEGER)')
+            cursor.executemany(
+                'INSERT INTO benchmark (views) VALUES (0)',
+                [()] * options['posts'])
+        # Просмотры распределены неравномерно: популярные посты чаще.
+        hits = [min(int(random.paretovariate(1.2)), options['posts'])
+                for _ in range(options['hits'])]
+
+        seconds = self.run_threads(hits, options['threads'], self.update)
+        self.report('UPDATE на просмотр', options['hits'], seconds)
+
+        counter = BufferedCounter(
+            self.write, interval=3600, max_pending=len(hits) + 1)
+        seconds = self.run_threads(hits, options['threads'], counter.add)
+        started = time.perf_counter()
+        counter.flush()
+        flush = time.perf_counter() - started
+        self.report('BufferedCounter', options['hits'], seconds + flush)
+        self.stdout.write(
+            f'  сброс {len(set(hits))} постов: {flush * 1000:.1f} мс')
+
+    def report(self, label, hits, seconds):
+        with connections[BENCHMARK_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT sum(views) FROM benchmark')
+            total, = cursor.fetchone()
+            cursor.execute('UPDATE benchmark SET views = 0')
+        self.stdout.write(
+            f'{label}: {hits / seconds:.0f} просмотров/с, '
+            f'записано {total} из {hits}')
+
+    def run_threads(self, hits, count, record):
+        def work(chunk):
+            try:
+                for post_id in chunk:
+                    record(post_id)
+            finally:
+                connections[BENCHMARK_ALIAS].close()
+
+        threads = [threading.Thread(target=work, args=(hits[i::count],))
+                   for i in range(count)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    def update(self, post_id):
+        with connections[BENCHMARK_ALIAS].cursor() as cursor:
+            cursor.execute(
+                'UPDATE benchmark SET views = views + 1 WHERE id = %s',
+                [post_id])
+
+    def write(self, groups):
+        # Те же запросы, что в posts.counters.save_post_views.
+        with transaction.atomic(using=BENCHMARK_ALIAS):
+            with connections[BENCHMARK_ALIAS].cursor() as cursor:
+                for amount, pks in groups.items():
+                    for start in range(0, len(pks), VIEWS_BATCH_SIZE):
+                        batch = pks[start:start + VIEWS_BATCH_SIZE]
+                        cursor.execute(
+                            'UPDATE benchmark SET views = views + %s '
+                            'WHERE id IN ({})'.format(
+                                ', '.join(['%s'] * len(batch))),
+                            [amount, *batch])
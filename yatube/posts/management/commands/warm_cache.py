@@ -0,0 +1,136 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from core.cache_backends import LRUCache
+from core.images import resize
+from posts.const import POST_IMAGE_CROP, POST_IMAGE_SIZE, POSTS_LIMITER
+from posts.models import Group, Post, User
+
+FETCH_TIMEOUT = 30
+
+
+def close_connection(func):
+    def wrapper(*args):
+        try:
+            return func(*args)
+        finally:
+            connection.close()
+    return wrapper
+
+
+class Command(BaseCommand):
+    help = ('Прогревает кеш страниц и миниатюры: первые страницы ленты, '
+            'самые активные группы и самые популярные профили.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=3,
+                            help='Сколько первых страниц ленты прогреть.')
+        parser.add_argument('--groups', type=int, default=10,
+                            help='Сколько самых активных групп прогреть.')
+        parser.add_argument('--profiles', type=int, default=10,
+                            help='Сколько самых популярных профилей '
+                                 'прогреть.')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--base-url', default='http://localhost',
+                            help='Адрес сайта, под которым страницы '
+                                 'попадут в кеш.')
+        parser.add_argument('--in-process', action='store_true',
+                            help='Рендерить страницы в этом процессе, а '
+                                 'не запрашивать у запущенного сервера. '
+                                 'Имеет смысл только с общим кешем.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        urls, posts = self.collect_targets(
+            options['pages'], options['groups'], options['profiles'])
+        base_url = urlsplit(options['base_url'])
+        if options['in_process']:
+            if isinstance(cache, (LocMemCache, LRUCache)):
+                self.stderr.write(
+                    'Кеш хранится в памяти процесса: прогретые страницы '
+                    'пропадут вместе с командой.')
+            warm_page = self.render_page
+        else:
+            warm_page = self.fetch_page
+        with ThreadPoolExecutor(options['workers']) as pool:
+            thumbnails = sum(pool.map(self.make_thumbnail, posts))
+            pages = list(pool.map(
+                warm_page, [base_url] * len(urls), urls))
+        self.stdout.write(self.style.SUCCESS(
+            f'Прогрето страниц: {sum(pages)} из {len(urls)}, '
+            f'миниатюр: {thumbnails}, '
+            f'за {time.monotonic() - started:.2f} с'))
+
+    def collect_targets(self, pages, groups, profiles):
+        """Адреса страниц для прогрева и посты, которые на них попадут."""
+        post_lists = []
+        index_pages = -(-Post.objects.count() // POSTS_LIMITER)
+        # Первая страница кешируется по адресу без ?page=1.
+        urls = [reverse('posts:index')] + [
+            f'{reverse("posts:index")}?page={page}'
+            for page in range(2, min(pages, index_pages) + 1)]
+        post_lists.append(Post.objects.all()[:pages * POSTS_LIMITER])
+        top_groups = Group.objects.annotate(
+            posts_count=Count('posts')).order_by('-posts_count')[:groups]
+        for group in top_groups:
+            urls.append(reverse('posts:group_list', args=(group.slug,)))
+            post_lists.append(group.posts.all()[:POSTS_LIMITER])
+        top_authors = User.objects.annotate(
+            followers_count=Count('following')
+        ).order_by('-followers_count')[:profiles]
+        for author in top_authors:
+            urls.append(reverse('posts:profile', args=(author.username,)))
+            post_lists.append(author.posts.all()[:POSTS_LIMITER])
+        posts = {post.pk: post
+                 for post_list in post_lists
+                 for post in post_list.only('pk', 'image')
+                 if post.image}
+        return urls, list(posts.values())
+
+    @close_connection
+    def make_thumbnail(self, post):
+        try:
+            # Тот же вариант, что запрашивают шаблоны через resized_url.
+            resize(post.image.name, *POST_IMAGE_SIZE, POST_IMAGE_CROP, 'jpeg')
+        except Exception as error:
+            self.stderr.write(f'Миниатюра {post.image}: {error}')
+            return False
+        return True
+
+    @close_connection
+    def render_page(self, base_url, url):
+        request = RequestFactory().get(
+            url,
+            secure=base_url.scheme == 'https',
+            HTTP_HOST=base_url.netloc,
+        )
+        request.user = AnonymousUser()
+        request.resolver_match = resolve(request.path_info)
+        view, args, kwargs = request.resolver_match
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception as error:
+            self.stderr.write(f'{url}: {error}')
+            return False
+        return response.status_code == 200
+
+    def fetch_page(self, base_url, url):
+        try:
+            response = requests.get(
+                f'{base_url.geturl().rstrip("/")}{url}',
+                timeout=FETCH_TIMEOUT)
+        except requests.RequestException as error:
+            self.stderr.write(f'{url}: {error}')
+            return False
+        return response.status_code == 200
@@ -0,0 +1,109 @@
+"""Разметка текста постов и комментариев.
+
+Текст размечается один раз при сохранении, HTML хранится рядом с ним в
+``text_html`` вместе с ``RENDERER_VERSION``, и шаблоны выводят его без
+разбора. После изменения правил версию нужно увеличить и запустить
+``render_texts``: команда перерисует тексты старых версий.
+
+Поддерживается небольшое подмножество markdown: абзацы, переносы
+строк, ``**жирный**``, ``*курсив*``, ```код```, ссылки ``[текст](url)``
+и голые http(s)-адреса, а также @упоминания существующих пользователей
+и #хештеги. Хештеги становятся ссылками только в постах: ленты тегов
+собираются из постов, комментарии в них не попадают. Всё, что не
+разметка, экранируется, поэтому в HTML попадают только теги, которые
+ставит сам рендерер.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils.html import escape, format_html
+
+RENDERER_VERSION = 4
+HASHTAG_MAX_LENGTH = 100
+
+PARAGRAPH_RE = re.compile(r'\n[ \t]*\n+')
+MENTION = r'(?<![\w@])@(?P<mention>\w(?:[\w.+-]*\w)?)'
+INLINE_RE = re.compile('|'.join((
+    r'`(?P<code>[^`\n]+)`',
+    r'\[(?P<label>[^\]\n]+)\]\((?P<href>https?://[^\s)]+)\)',
+    r'(?P<url>https?://[^\s<>"]*[^\s<>".,:;!?)\]\'])',
+    r'\*\*(?P<bold>\S(?:.*?\S)?)\*\*',
+    r'\*(?P<italic>\S(?:.*?\S)?)\*',
+    MENTION,
+    rf'(?<![\w&#])#(?P<hashtag>\w{{1,{HASHTAG_MAX_LENGTH}}})(?!\w)',
+)))
+
+
+def _link(href, label):
+    return format_html('<a href="{}" rel="nofollow">{}</a>', href, label)
+
+
+def _inline(text, users, hashtags):
+    parts = []
+    position = 0
+    for match in INLINE_RE.finditer(text):
+        kind = match.lastgroup
+        value = match.group(kind)
+        if (kind == 'mention' and value not in users
+                or kind == 'hashtag' and not hashtags):
+            continue
+        parts.append(escape(text[position:match.start()]))
+        position = match.end()
+        if kind == 'code':
+            parts.append(format_html('<code>{}</code>', value))
+        elif kind == 'label':
+            parts.append(_link(match.group('href'), value))
+        elif kind == 'url':
+            parts.append(_link(value, value))
+        elif kind in ('bold', 'italic'):
+            tag = 'strong' if kind == 'bold' else 'em'
+            parts.append(
+                f'<{tag}>{_inline(value, users, hashtags)}</{tag}>')
+        elif kind == 'mention':
+            parts.append(format_html(
+                '<a href="{}">@{}</a>',
+                reverse('posts:profile', args=[value]), value))
+        else:
+            parts.append(format_html(
+                '<a class="hashtag" href="{}">#{}</a>',
+                reverse('posts:tag_posts', args=[normalize_tag(value)]),
+                value))
+    parts.append(escape(text[position:]))
+    return ''.join(parts)
+
+
+def normalize_tag(name):
+    return name.casefold()
+
+
+def _hashtags(text):
+    for match in INLINE_RE.finditer(text):
+        if match.lastgroup == 'hashtag':
+            yield normalize_tag(match.group('hashtag'))
+        elif match.lastgroup in ('bold', 'italic'):
+            yield from _hashtags(match.group(match.lastgroup))
+
+
+def extract_hashtags(text):
+    """Нормализованные хештеги, которые ``render`` сделает ссылками."""
+    return {name for line in text.splitlines() for name in _hashtags(line)}
+
+
+def render(text, hashtags=True):
+    """HTML для ``text``: абзацы ``<p>``, разметка внутри строк.
+
+    С ``hashtags=False`` хештеги остаются текстом.
+    """
+    text = text.replace('\r\n', '\n').strip()
+    if not text:
+        return ''
+    names = set(re.findall(MENTION, text))
+    users = set(get_user_model().objects.filter(
+        username__in=names).values_list('username', flat=True)
+    ) if names else set()
+    return ''.join(
+        '<p>{}</p>'.format('<br>'.join(
+            _inline(line, users, hashtags)
+            for line in paragraph.split('\n')))
+        for paragraph in PARAGRAPH_RE.split(text))
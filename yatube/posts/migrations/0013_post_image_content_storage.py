@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-19 11:07
+
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+import posts.models
+
+
+def count_image_references(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    if db_alias != 'default':
+        return
+    Post = apps.get_model('posts', 'Post')
+    StoredFile = apps.get_model('core', 'StoredFile')
+    rows = Post.objects.using(db_alias).exclude(image='').values(
+        'image').annotate(references=Count('pk')).order_by()
+    StoredFile.objects.using(db_alias).bulk_create(
+        StoredFile(name=row['image'], references=row['references'])
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_storedfile'),
+        ('posts', '0012_post_image_hashed_path'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to=posts.models.post_image_path, verbose_name='Картинка'),
+        ),
+        migrations.RunPython(
+            count_image_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-19 15:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max
+
+
+def fill_group_stats(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    if db_alias != 'default':
+        return
+    Post = apps.get_model('posts', 'Post')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    GroupAuthorStats = apps.get_model('posts', 'GroupAuthorStats')
+    posts = Post.objects.using(db_alias).filter(
+        group__isnull=False).order_by()
+    GroupStats.objects.using(db_alias).bulk_create(
+        GroupStats(group_id=row['group'], posts_count=row['posts_count'],
+                   last_post_at=row['last_post_at'])
+        for row in posts.values('group').annotate(
+            posts_count=Count('pk'), last_post_at=Max('pub_date'))
+    )
+    GroupAuthorStats.objects.using(db_alias).bulk_create(
+        GroupAuthorStats(group_id=row['group'], author_id=row['author'],
+                         posts_count=row['posts_count'])
+        for row in posts.values('group', 'author').annotate(
+            posts_count=Count('pk'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0016_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group', verbose_name='Группа')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('last_post_at', models.DateTimeField(db_index=True, null=True, verbose_name='Последний пост')),
+            ],
+            options={
+                'verbose_name': 'Сводка по группе',
+                'verbose_name_plural': 'Сводки по группам',
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupAuthorStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_stats', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='author_stats', to='posts.Group', verbose_name='Группа')),
+            ],
+            options={
+                'verbose_name': 'Автор в группе',
+                'verbose_name_plural': 'Авторы в группах',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='groupauthorstats',
+            index=models.Index(fields=['group', '-posts_count'], name='group_top_authors'),
+        ),
+        migrations.AddConstraint(
+            model_name='groupauthorstats',
+            constraint=models.UniqueConstraint(fields=('group', 'author'), name='unique_group_author'),
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.16 on 2026-10-19 16:40
+
+from django.db import migrations, models
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncMonth
+
+
+def fill_archive_months(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    if db_alias != 'default':
+        return
+    Post = apps.get_model('posts', 'Post')
+    ArchiveMonth = apps.get_model('posts', 'ArchiveMonth')
+    posts = Post.objects.using(db_alias).order_by().annotate(
+        month=TruncMonth('pub_date', output_field=DateField()))
+    months = []
+    for field, prefix in ((None, 'site'), ('group', 'group:'),
+                          ('author', 'author:')):
+        fields = [field, 'month'] if field else ['month']
+        rows = posts.values(*fields).annotate(posts_count=Count('pk'))
+        if field == 'group':
+            rows = rows.filter(group__isnull=False)
+        months.extend(
+            ArchiveMonth(scope=f'{prefix}{row[field]}' if field else prefix,
+                         month=row['month'], posts_count=row['posts_count'])
+            for row in rows)
+    ArchiveMonth.objects.using(db_alias).bulk_create(months)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_group_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveMonth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=50, verbose_name='Раздел')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+            ],
+            options={
+                'verbose_name': 'Месяц архива',
+                'verbose_name_plural': 'Месяцы архива',
+                'ordering': ('-month',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='archivemonth',
+            constraint=models.UniqueConstraint(fields=('scope', 'month'), name='unique_archive_month'),
+        ),
+        migrations.RunPython(fill_archive_months, migrations.RunPython.noop),
+    ]
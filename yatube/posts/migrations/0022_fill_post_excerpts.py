@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-19 21:30
+
+from django.db import migrations
+from django.template.defaultfilters import linebreaksbr
+from django.utils.html import format_html
+from django.utils.text import Truncator
+
+from posts.const import EXCERPT_LENGTH
+
+BATCH_SIZE = 500
+
+
+def fill_post_excerpts(apps, schema_editor):
+    # Посты лежат и на шардах, поэтому заполняется каждая база.
+    db_alias = schema_editor.connection.alias
+    Post = apps.get_model('posts', 'Post')
+    pending = Post.objects.using(db_alias).filter(excerpt_html='').only(
+        'pk', 'text', 'text_html', 'text_html_version').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(pending.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        for post in batch:
+            html = post.text_html if post.text_html_version else format_html(
+                '<p>{}</p>', linebreaksbr(post.text, autoescape=True))
+            post.excerpt_html = Truncator(html).chars(
+                EXCERPT_LENGTH, html=True)
+            post.has_more = post.excerpt_html != html
+        Post.objects.using(db_alias).bulk_update(
+            batch, ['excerpt_html', 'has_more'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_post_excerpts, migrations.RunPython.noop),
+    ]
@@ -1,22 +1,86 @@
+import os
+import uuid
+
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.template.defaultfilters import linebreaksbr
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
 
+from core.managers import CachingManager
 from core.models import CreatedModel
-from posts.const import MODEL_STR_TEXT
+from core.sharding import ShardedManager
+from core.storage import ContentAddressedStorage
+from posts.const import EXCERPT_LENGTH, IMAGE_UPLOAD_DIR, MODEL_STR_TEXT
+
+from . import markup
 
 User = get_user_model()
 
 
+def post_image_path(instance, filename):
+    """Путь картинки: ``posts/ab/cd/<uuid4><расширение>``.
+
+    Каталог берётся из случайного uuid4, а не из имени файла: иначе
+    частые имена вроде ``image.jpg`` собирались бы в одном каталоге.
+    Хранилище всё равно переименует загрузку по содержимому, в том же
+    каталоге ``posts/``.
+    """
+    name = uuid.uuid4().hex
+    extension = os.path.splitext(filename)[1].lower()
+    return f'{IMAGE_UPLOAD_DIR}/{name[:2]}/{name[2:4]}/{name}{extension}'
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
 
+    objects = CachingManager()
+
     def __str__(self):
         return self.title
 
 
-class Post(CreatedModel):
+class RenderedTextModel(CreatedModel):
+    """Абстрактная модель. Хранит HTML поля ``text``, см. ``posts.markup``.
+    """
+    text_html = models.TextField('HTML текста', blank=True, editable=False)
+    text_html_version = models.PositiveSmallIntegerField(
+        'Версия разметки', default=0, editable=False)
+
+    rendered_fields = ('text_html', 'text_html_version')
+    # Ссылки на ленты тегов, см. posts.markup.
+    render_hashtags = False
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            self.render_text()
+            if update_fields is not None:
+                kwargs['update_fields'] = {
+                    *update_fields, *self.rendered_fields}
+        super().save(*args, **kwargs)
+
+    def render_text(self):
+        self.text_html = markup.render(
+            self.text, hashtags=self.render_hashtags)
+        self.text_html_version = markup.RENDERER_VERSION
+
+    @property
+    def html(self):
+        """Размеченный текст; до первой разметки — экранированный."""
+        if self.text_html_version:
+            return mark_safe(self.text_html)
+        return format_html(
+            '<p>{}</p>', linebreaksbr(self.text, autoescape=True))
+
+
+class Post(RenderedTextModel):
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
@@ -38,9 +102,27 @@ class Post(CreatedModel):
     )
     image = models.ImageField(
         'Картинка',
-        upload_to='posts/',
+        upload_to=post_image_path,
+        storage=ContentAddressedStorage(),
         blank=True,
     )
+    views = models.PositiveIntegerField(
+        'Просмотры',
+        default=0,
+        editable=False,
+    )
+    excerpt_html = models.TextField(
+        'HTML начала текста', blank=True, editable=False)
+    has_more = models.BooleanField(
+        'Текст длиннее начала', default=False, editable=False)
+
+    objects = ShardedManager()
+
+    # В списках постов текст не загружается, см. ``excerpt``.
+    list_deferred_fields = ('text', 'text_html')
+    rendered_fields = (
+        *RenderedTextModel.rendered_fields, 'excerpt_html', 'has_more')
+    render_hashtags = True
 
     class Meta:
         ordering = ('-pub_date',)
@@ -50,8 +132,25 @@ class Post(CreatedModel):
     def __str__(self):
         return self.text[:MODEL_STR_TEXT]
 
+    def render_text(self):
+        super().render_text()
+        self.excerpt_html = Truncator(self.text_html).chars(
+            EXCERPT_LENGTH, html=True)
+        self.has_more = self.excerpt_html != self.text_html
 
-class Comment(CreatedModel):
+    @property
+    def excerpt(self):
+        """Начало размеченного текста для списков постов.
+
+        Начало старых постов заполнила миграция ``0022``; если его всё
+        же нет, грузится весь текст.
+        """
+        if self.excerpt_html:
+            return mark_safe(self.excerpt_html)
+        return self.html
+
+
+class Comment(RenderedTextModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -71,6 +170,8 @@ class Comment(CreatedModel):
         help_text='Напишите комментарий',
     )
 
+    objects = ShardedManager()
+
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Комментарий'
@@ -92,6 +193,181 @@ class Follow(models.Model):
         related_name='following',
         verbose_name='Автор')
 
+    objects = CachingManager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+
+
+class Like(CreatedModel):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='likes',
+        verbose_name='Пользователь')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='likes',
+        verbose_name='Пост')
+
+    objects = ShardedManager()
+
+    class Meta:
+        verbose_name = 'Лайк'
+        verbose_name_plural = 'Лайки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_like'),
+        ]
+
+
+class LikeCounter(models.Model):
+    """Часть числа лайков поста, см. ``posts.likes``."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='like_counters',
+        verbose_name='Пост')
+    slot = models.PositiveSmallIntegerField('Номер строки')
+    count = models.IntegerField('Лайки', default=0)
+
+    objects = ShardedManager()
+
+    class Meta:
+        verbose_name = 'Счётчик лайков'
+        verbose_name_plural = 'Счётчики лайков'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('post', 'slot'), name='unique_like_counter_slot'),
+        ]
+
+
+class GroupStats(models.Model):
+    """Сводка по постам группы, см. ``posts.group_stats``."""
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Группа')
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    last_post_at = models.DateTimeField(
+        'Последний пост', null=True, db_index=True)
+
+    objects = CachingManager()
+
+    class Meta:
+        verbose_name = 'Сводка по группе'
+        verbose_name_plural = 'Сводки по группам'
+
+
+class GroupAuthorStats(models.Model):
+    """Число постов автора в группе."""
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='author_stats',
+        verbose_name='Группа')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='group_stats',
+        verbose_name='Автор')
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+
+    objects = CachingManager()
+
+    class Meta:
+        verbose_name = 'Автор в группе'
+        verbose_name_plural = 'Авторы в группах'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('group', 'author'), name='unique_group_author'),
+        ]
+        indexes = [
+            models.Index(fields=('group', '-posts_count'),
+                         name='group_top_authors'),
+        ]
+
+
+class ArchiveMonth(models.Model):
+    """Число постов за месяц в архиве, см. ``posts.archive``."""
+    scope = models.CharField('Раздел', max_length=50)
+    month = models.DateField('Месяц')
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+
+    objects = CachingManager()
+
+    class Meta:
+        ordering = ('-month',)
+        verbose_name = 'Месяц архива'
+        verbose_name_plural = 'Месяцы архива'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('scope', 'month'), name='unique_archive_month'),
+        ]
+
+
+class Tag(models.Model):
+    """Хештег, см. ``posts.hashtags``."""
+    name = models.CharField(
+        'Название', max_length=markup.HASHTAG_MAX_LENGTH, unique=True)
+    posts_count = models.PositiveIntegerField(
+        'Постов', default=0, db_index=True)
+
+    objects = CachingManager()
+
+    class Meta:
+        verbose_name = 'Тег'
+        verbose_name_plural = 'Теги'
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
+class PostTag(models.Model):
+    """Пост с тегом; дата поста повторена для ленты тега."""
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_tags',
+        verbose_name='Тег')
+    post_id = models.PositiveIntegerField('Пост', db_index=True)
+    pub_date = models.DateTimeField('Дата поста')
+
+    class Meta:
+        verbose_name = 'Тег поста'
+        verbose_name_plural = 'Теги постов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('tag', 'post_id'), name='unique_post_tag'),
+        ]
+        indexes = [
+            models.Index(fields=('tag', '-pub_date', '-post_id'),
+                         name='tag_feed'),
+        ]
+
+
+class PostScore(models.Model):
+    """Затухающий рейтинг поста, см. ``posts.trending``."""
+    post_id = models.PositiveIntegerField('Пост', primary_key=True)
+    score = models.FloatField('Рейтинг', default=0)
+    updated = models.FloatField('Время пересчёта')
+
+    class Meta:
+        verbose_name = 'Рейтинг поста'
+        verbose_name_plural = 'Рейтинги постов'
+
+
+class TrendingPost(models.Model):
+    """Место поста в последнем расчёте популярных."""
+    rank = models.PositiveSmallIntegerField('Место', primary_key=True)
+    post_id = models.PositiveIntegerField('Пост')
+    score = models.FloatField('Рейтинг')
+
+    class Meta:
+        ordering = ('rank',)
+        verbose_name = 'Популярный пост'
+        verbose_name_plural = 'Популярные посты'
@@ -0,0 +1,130 @@
+"""Массовые операции модерации.
+
+Посты меняются и удаляются пачками одним ``update()``/``delete()`` на
+пачку, без сохранения каждого объекта. Кеш страниц сбрасывается один раз
+по тегам всех затронутых страниц, сводки затронутых групп и месяцы
+архива пересчитываются один раз в конце. Картинки, на которые больше не
+ссылаются посты, хранилище удаляет в фоне после коммита
+(см. ``core.storage``).
+"""
+from django.db import transaction
+
+from core.page_cache import invalidate_page_tags
+from posts.const import MODERATION_BATCH_SIZE
+
+from . import archive, group_stats, hashtags
+from .models import Comment, Group, Post, User
+from .sharding import relocate_posts
+from .signals import bulk_changes
+
+
+def _batches(queryset):
+    pks = list(queryset.order_by().values_list('pk', flat=True))
+    for start in range(0, len(pks), MODERATION_BATCH_SIZE):
+        yield pks[start:start + MODERATION_BATCH_SIZE]
+
+
+def page_tags(post_ids):
+    """Теги страниц, на которых видны посты ``post_ids``."""
+    tags = {f'post:{pk}' for pk in post_ids}
+    # Без соединений: посты могут лежать на шардах, а пользователи и
+    # группы — в основной БД.
+    rows = set(Post.objects.filter(pk__in=post_ids).values_list(
+        'author_id', 'group_id'))
+    author_ids = {author_id for author_id, _ in rows}
+    group_ids = {group_id for _, group_id in rows if group_id}
+    tags.update(f'author:{username}' for username in User.objects.filter(
+        pk__in=author_ids).values_list('username', flat=True))
+    tags.update(f'group:{slug}' for slug in Group.objects.filter(
+        pk__in=group_ids).values_list('slug', flat=True))
+    tags.update(f'tag:{name}' for name in hashtags.post_tag_names(post_ids))
+    return tags
+
+
+def _owners(post_ids):
+    return set(Post.objects.filter(pk__in=post_ids).values_list(
+        'group_id', 'author_id', 'pub_date'))
+
+
+def _rebuild_stats(owners, deleted=False):
+    group_ids = {group_id for group_id, _, _ in owners} - {None}
+    group_stats.rebuild(group_ids)
+    if group_ids:
+        invalidate_page_tags('groups')
+    site_months = ({archive.month_of(pub_date) for _, _, pub_date in owners}
+                   if deleted else ())
+    archive.rebuild(
+        group_ids, {author_id for _, author_id, _ in owners}, site_months)
+    invalidate_page_tags('archive')
+
+
+def _update_posts(queryset, extra_tags=(), **changes):
+    changed = 0
+    tags = set(extra_tags)
+    owners = set()
+    with bulk_changes():
+        for batch in _batches(queryset):
+            with transaction.atomic():
+                tags |= page_tags(batch)
+                owners |= _owners(batch)
+                changed += Post.objects.filter(
+                    pk__in=batch).update(**changes)
+            if 'author' in changes:
+                relocate_posts(batch)
+            owners |= _owners(batch)
+        invalidate_page_tags(*tags)
+    _rebuild_stats(owners)
+    return changed
+
+
+def move_posts_to_group(queryset, group):
+    """Переносит посты в ``group`` (None — убирает из групп)."""
+    extra_tags = [f'group:{group.slug}'] if group else []
+    return _update_posts(queryset, extra_tags, group=group)
+
+
+def reassign_posts(queryset, author):
+    """Передаёт посты другому автору.
+
+    С шардами посты с комментариями и лайками переезжают на шард нового
+    автора.
+    """
+    return _update_posts(
+        queryset, [f'author:{author.username}'], author=author)
+
+
+def delete_posts(queryset):
+    """Удаляет посты с комментариями."""
+    deleted = 0
+    tags = set()
+    owners = set()
+    with bulk_changes():
+        for batch in _batches(queryset):
+            with transaction.atomic():
+                tags |= page_tags(batch)
+                owners |= _owners(batch)
+                if hashtags.remove_posts(batch):
+                    tags.add('tags')
+                deleted += Post.objects.filter(
+                    pk__in=batch).delete()[1].get(Post._meta.label, 0)
+        invalidate_page_tags(*tags)
+    _rebuild_stats(owners, deleted=True)
+    return deleted
+
+
+def purge_comments(authors):
+    """Удаляет все комментарии ``authors``."""
+    # Id считаются заранее: на шардах нет таблицы пользователей, и
+    # подзапрос по ``authors`` там ничего бы не нашёл.
+    comments = Comment.objects.filter(
+        author_id__in=list(authors.values_list('pk', flat=True)))
+    deleted = 0
+    tags = set()
+    with bulk_changes():
+        for batch in _batches(comments):
+            with transaction.atomic():
+                tags |= {f'post:{pk}' for pk in Comment.objects.filter(
+                    pk__in=batch).values_list('post_id', flat=True)}
+                deleted += Comment.objects.filter(pk__in=batch).delete()[0]
+        invalidate_page_tags(*tags)
+    return deleted
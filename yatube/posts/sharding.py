@@ -0,0 +1,82 @@
+from django.db import transaction
+
+from core.sharding import register, shard_aliases, shard_for_author
+
+from .models import Comment, Like, LikeCounter, Post
+from .signals import keep_image_references
+
+
+def comment_author_id(comment):
+    """Комментарии лежат на шарде автора поста."""
+    if comment.post_id is None:
+        return comment.author_id
+    if Comment.post.is_cached(comment):
+        return comment.post.author_id
+    return Post.objects.filter(pk=comment.post_id).values_list(
+        'author_id', flat=True).first()
+
+
+def post_author_id(obj):
+    """Лайки и счётчики лайков лежат на шарде автора поста."""
+    if type(obj).post.is_cached(obj):
+        return obj.post.author_id
+    return Post.objects.filter(pk=obj.post_id).values_list(
+        'author_id', flat=True).first()
+
+
+register(Post, lambda post: post.author_id)
+register(Comment, comment_author_id)
+register(Like, post_author_id)
+register(LikeCounter, post_author_id)
+
+
+def copy_rows(model, source, target, pks):
+    objs = list(model._base_manager.using(source).filter(pk__in=pks))
+    model._base_manager.using(target).bulk_create(
+        objs, ignore_conflicts=True)
+
+
+def move_rows(model, source, target, pks):
+    """Переносит строки ``model`` с шарда ``source`` на ``target``."""
+    with transaction.atomic(using=target):
+        copy_rows(model, source, target, pks)
+    with keep_image_references(), transaction.atomic(using=source):
+        model._base_manager.using(source).filter(pk__in=pks).delete()
+
+
+def move_posts(source, target, pks):
+    """Переносит посты с комментариями и лайками, см. ``rebalance_shards``.
+
+    Возвращает число перенесённых комментариев.
+    """
+    comment_pks = list(Comment._base_manager.using(source).filter(
+        post_id__in=pks).values_list('pk', flat=True))
+    # Сначала копия на новом шарде, потом удаление со старого:
+    # прерванный перенос безопасно повторить.
+    with transaction.atomic(using=target):
+        copy_rows(Post, source, target, pks)
+        copy_rows(Comment, source, target, comment_pks)
+        for model in (Like, LikeCounter):
+            copy_rows(model, source, target, list(
+                model._base_manager.using(source).filter(
+                    post_id__in=pks).values_list('pk', flat=True)))
+    with keep_image_references(), transaction.atomic(using=source):
+        Post._base_manager.using(source).filter(pk__in=pks).delete()
+    return len(comment_pks)
+
+
+def relocate_posts(pks):
+    """Переносит посты ``pks`` на шарды их нынешних авторов.
+
+    Нужно после смены автора: ``update()`` меняет ``author_id`` на месте.
+    """
+    for source in shard_aliases():
+        targets = {}
+        rows = Post._base_manager.using(source).filter(
+            pk__in=pks).values_list('pk', 'author_id')
+        for pk, author_id in rows:
+            target = shard_for_author(author_id)
+            if target != source:
+                targets.setdefault(target, []).append(pk)
+        for target, moved in targets.items():
+            move_posts(source, target, moved)
@@ -0,0 +1,210 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from core.cache_versions import deferred_invalidation
+from core.page_cache import invalidate_page_tags
+from core.storage import release, retain
+from posts.const import TRENDING_COMMENT_WEIGHT, TRENDING_LIKE_WEIGHT
+
+from . import archive, group_stats, hashtags
+from .models import Comment, Group, Like, Post
+from .trending import trending_events
+
+_bulk = threading.local()
+_NOT_LOADED = object()
+
+
+@contextmanager
+def bulk_changes():
+    """Отключает сброс кеша страниц по сигналам отдельных объектов.
+
+    Массовая операция сама сбрасывает теги всех затронутых страниц,
+    версии таблиц ORM меняются один раз на выходе.
+    """
+    _bulk.active = True
+    try:
+        with deferred_invalidation():
+            yield
+    finally:
+        _bulk.active = False
+
+
+def _in_bulk():
+    return getattr(_bulk, 'active', False)
+
+
+@contextmanager
+def keep_image_references():
+    """Удаление постов не снимает ссылок с их картинок.
+
+    Для переноса постов между шардами: копия ссылается на те же файлы,
+    а ``bulk_create`` копии ссылок не добавляет.
+    """
+    _bulk.keep_images = True
+    try:
+        yield
+    finally:
+        _bulk.keep_images = False
+
+
+@receiver(post_init, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    # Через __dict__, чтобы не загружать отложенные поля.
+    instance._initial_group_id = instance.__dict__.get('group_id')
+    instance._initial_author_id = instance.__dict__.get('author_id')
+    image = instance.__dict__.get('image', _NOT_LOADED)
+    instance._initial_image = getattr(image, 'name', image) or None
+
+
+@receiver(pre_save, sender=Post)
+def remember_image_upload(sender, instance, **kwargs):
+    # Ссылку на загружаемый файл берёт хранилище (см. core.storage).
+    instance._image_uploaded = (
+        bool(instance.image) and not instance.image._committed)
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, created, update_fields,
+                           **kwargs):
+    old_name = instance._initial_image
+    if old_name is _NOT_LOADED or (
+            update_fields and 'image' not in update_fields):
+        return
+    if created:
+        old_name = None
+    new_name = instance.image.name or None
+    if new_name == old_name:
+        if new_name and instance._image_uploaded:
+            # Загружена та же картинка: лишнюю ссылку взял ``_save``.
+            release(new_name, instance.image.storage)
+    else:
+        if new_name and not instance._image_uploaded:
+            retain(new_name)
+        if old_name:
+            release(old_name, instance.image.storage)
+    instance._initial_image = new_name
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    if instance.image and not getattr(_bulk, 'keep_images', False):
+        release(instance.image.name, instance.image.storage)
+
+
+@receiver(post_save, sender=Post)
+def update_archive(sender, instance, created, **kwargs):
+    # Раньше update_group_stats: тот запоминает нового автора.
+    if _in_bulk():
+        return
+    old = set() if created else set(archive.post_scopes(
+        instance._initial_group_id, instance._initial_author_id))
+    new = set(archive.post_scopes(instance.group_id, instance.author_id))
+    if old - new:
+        archive.post_removed(old - new, instance.pub_date)
+    if new - old:
+        archive.post_added(new - old, instance.pub_date)
+    # Карточки постов есть и на страницах архива сайта.
+    invalidate_page_tags('archive')
+
+
+@receiver(post_delete, sender=Post)
+def remove_from_archive(sender, instance, **kwargs):
+    if not _in_bulk():
+        archive.post_removed(archive.post_scopes(
+            instance._initial_group_id, instance._initial_author_id),
+            instance.pub_date)
+        invalidate_page_tags('archive')
+
+
+@receiver(post_save, sender=Post)
+def update_group_stats(sender, instance, created, **kwargs):
+    # Раньше invalidate_post_pages: тот запоминает новую группу.
+    if _in_bulk():
+        return
+    old = (instance._initial_group_id, instance._initial_author_id)
+    new = (instance.group_id, instance.author_id)
+    changed = False
+    if not created and old != new and old[0] is not None:
+        group_stats.post_removed(*old, instance.pub_date)
+        changed = True
+    if (created or old != new) and new[0] is not None:
+        group_stats.post_added(*new, instance.pub_date)
+        changed = True
+    if changed:
+        # Каталог групп показывает их сводки.
+        invalidate_page_tags('groups')
+    instance._initial_author_id = instance.author_id
+
+
+@receiver(post_delete, sender=Post)
+def remove_from_group_stats(sender, instance, **kwargs):
+    if not _in_bulk() and instance._initial_group_id is not None:
+        group_stats.post_removed(
+            instance._initial_group_id, instance._initial_author_id,
+            instance.pub_date)
+        invalidate_page_tags('groups')
+
+
+@receiver(post_save, sender=Post)
+def update_post_tags(sender, instance, update_fields, **kwargs):
+    if _in_bulk():
+        return
+    if update_fields and 'text' not in update_fields:
+        names = hashtags.post_tag_names([instance.pk])
+        changed = False
+    else:
+        names, changed = hashtags.sync_post(instance)
+    # Карточка поста есть и в лентах его тегов.
+    invalidate_page_tags(
+        *(f'tag:{name}' for name in names), *(['tags'] if changed else []))
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_tags(sender, instance, **kwargs):
+    if _in_bulk():
+        return
+    names = hashtags.remove_posts([instance.pk])
+    if names:
+        invalidate_page_tags(*(f'tag:{name}' for name in names), 'tags')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    if _in_bulk():
+        return
+    group_ids = {instance._initial_group_id, instance.group_id} - {None}
+    slugs = Group.objects.filter(
+        pk__in=group_ids).values_list('slug', flat=True)
+    invalidate_page_tags(
+        f'post:{instance.pk}',
+        f'author:{instance.author.username}',
+        *(f'group:{slug}' for slug in slugs),
+    )
+    instance._initial_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    if _in_bulk():
+        return
+    invalidate_page_tags(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    invalidate_page_tags(f'group:{instance.slug}', 'groups')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Like)
+def record_trending_event(sender, instance, created, **kwargs):
+    if created and instance.post_id is not None:
+        weight = (TRENDING_COMMENT_WEIGHT if sender is Comment
+                  else TRENDING_LIKE_WEIGHT)
+        trending_events.add(instance.post_id, weight)
@@ -0,0 +1,212 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import StoredFile
+from core.paginators import EstimatedCountPaginator
+from core.storage import delete_unreferenced
+from posts.models import Comment, Group, Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+User = get_user_model()
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def create_posts(self, count):
+        start = Post.objects.count()
+        for number in range(start, start + count):
+            Post.objects.create(
+                author=User.objects.create(username=f'author-{number}'),
+                group=Group.objects.create(
+                    title=f'Группа {number}', slug=f'group-{number}'),
+                text=f'Тестовый текст {number}',
+            )
+
+    def count_changelist_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Число запросов списка постов не зависит от числа строк."""
+        self.create_posts(1)
+        # Первый запрос кеширует пользователя сессии.
+        self.count_changelist_queries()
+        few_rows = self.count_changelist_queries()
+        self.create_posts(5)
+        self.assertEqual(self.count_changelist_queries(), few_rows)
+
+    def test_large_table_count_is_estimated(self):
+        """Для большой таблицы число постов оценивается без COUNT(*)."""
+        self.create_posts(2)
+        with mock.patch('core.paginators.ESTIMATE_THRESHOLD', 0):
+            paginator = EstimatedCountPaginator(Post.objects.all(), 10)
+            self.assertEqual(
+                paginator.count,
+                Post.objects.order_by('-pk').first().pk)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ModerationActionsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.author = User.objects.create(username='Tester')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.posts = [
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+            for number in range(3)
+        ]
+
+    def run_action(self, action, data=None, model='posts_post'):
+        return self.client.post(
+            reverse(f'admin:{model}_changelist'),
+            {
+                'action': action,
+                ACTION_CHECKBOX_NAME: [post.pk for post in self.posts],
+                'apply': '1',
+                **(data or {}),
+            },
+        )
+
+    def test_move_to_group_asks_for_group(self):
+        """Перенос в группу сначала показывает страницу подтверждения."""
+        response = self.client.post(
+            reverse('admin:posts_post_changelist'),
+            {
+                'action': 'move_to_group',
+                ACTION_CHECKBOX_NAME: [self.posts[0].pk],
+            },
+        )
+        self.assertTemplateUsed(response, 'admin/bulk_action.html')
+        self.assertIsNone(Post.objects.get(pk=self.posts[0].pk).group)
+
+    def test_move_to_group_resets_group_page(self):
+        """Перенос в группу меняет посты и сбрасывает кеш страницы группы."""
+        group_url = reverse('posts:group_list', args=(self.group.slug,))
+        self.assertNotContains(self.client.get(group_url), 'Пост 0')
+        self.run_action('move_to_group', {'group': self.group.pk})
+        self.assertEqual(self.group.posts.count(), len(self.posts))
+        self.assertContains(self.client.get(group_url), 'Пост 0')
+
+    def test_reassign_author(self):
+        """Смена автора передаёт посты другому пользователю."""
+        self.run_action('reassign_author', {'username': 'admin'})
+        self.assertEqual(self.admin.posts.count(), len(self.posts))
+
+    def test_delete_with_media_deletes_comments(self):
+        """Удаление постов удаляет и их комментарии."""
+        Comment.objects.create(
+            post=self.posts[0], author=self.author, text='Комментарий')
+        self.run_action('delete_with_media')
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+        self.assertFalse(Comment.objects.exists())
+
+    def test_identical_images_share_file(self):
+        """Одинаковые картинки хранятся одним файлом, пока на него есть
+        ссылки."""
+        for post in self.posts[:2]:
+            post.image = SimpleUploadedFile(
+                'pic.gif', SMALL_GIF, content_type='image/gif')
+            post.save()
+        name = self.posts[0].image.name
+        self.assertEqual(self.posts[1].image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+        self.posts[0].delete()
+        delete_unreferenced([name], self.posts[0].image.storage)
+        self.assertTrue(default_storage.exists(name))
+        self.posts[1].delete()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        delete_unreferenced([name], self.posts[1].image.storage)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_same_image_reuploaded_counted_once(self):
+        """Повторная загрузка той же картинки в пост не добавляет
+        ссылку."""
+        post = self.posts[0]
+        for _ in range(2):
+            post.image = SimpleUploadedFile(
+                'pic.gif', SMALL_GIF, content_type='image/gif')
+            post.save()
+        post = Post.objects.get(pk=post.pk)
+        post.image = SimpleUploadedFile(
+            'other.gif', SMALL_GIF, content_type='image/gif')
+        post.save()
+        name = post.image.name
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        post.delete()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_reupload_survives_pending_cleanup(self):
+        """Очистка, запущенная до сохранения владельца повторно
+        загруженного файла, файл не удаляет."""
+        post = self.posts[0]
+        post.image = SimpleUploadedFile(
+            'pic.gif', SMALL_GIF, content_type='image/gif')
+        post.save()
+        name = post.image.name
+        storage = post.image.storage
+        post.delete()
+        self.assertEqual(storage.save(name, ContentFile(SMALL_GIF)), name)
+        delete_unreferenced([name], storage)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+    def test_purge_user_comments(self):
+        """Действие над пользователями удаляет все их комментарии."""
+        for post in self.posts:
+            Comment.objects.create(
+                post=post, author=self.author, text='Комментарий')
+        self.client.post(
+            reverse('admin:auth_user_changelist'),
+            {
+                'action': 'purge_all_comments',
+                ACTION_CHECKBOX_NAME: [self.author.pk],
+                'apply': '1',
+            },
+        )
+        self.assertFalse(Comment.objects.filter(author=self.author).exists())
@@ -0,0 +1,218 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, TransactionTestCase, override_settings
+
+from core.images import resize
+from core.page_cache import page_cache_key
+from posts.management.commands.migrate_media_layout import hashed_path
+from posts.const import POST_IMAGE_CROP, POST_IMAGE_SIZE
+from posts.markup import RENDERER_VERSION
+from posts.models import Comment, Group, Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+User = get_user_model()
+
+
+class WarmCacheCommandTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Tester')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+        )
+        Post.objects.create(
+            author=self.author,
+            text='Тестовый текст',
+            group=self.group,
+        )
+
+    def test_warm_cache_fills_page_cache(self):
+        """Команда warm_cache кладёт в кеш ленту, группы и профили."""
+        out = StringIO()
+        call_command('warm_cache', workers=2, in_process=True, stdout=out,
+                     stderr=StringIO())
+        factory = RequestFactory(HTTP_HOST='localhost')
+        pages = {
+            '/': (),
+            '/group/test-slug/': ('group:test-slug',),
+            '/profile/Tester/': ('author:Tester',),
+        }
+        for url, tags in pages.items():
+            with self.subTest(url=url):
+                key = page_cache_key(factory.get(url), tags)
+                self.assertIsNotNone(cache.get(key))
+        self.assertIn('Прогрето страниц: 3 из 3', out.getvalue())
+
+    def test_warm_cache_makes_template_image_variant(self):
+        """Прогревается тот вариант картинки, что запрашивают шаблоны."""
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media_root):
+            post = Post.objects.create(
+                author=self.author, text='С картинкой',
+                image=SimpleUploadedFile('pic.gif', SMALL_GIF))
+            out = StringIO()
+            call_command('warm_cache', workers=2, in_process=True,
+                         stdout=out, stderr=StringIO())
+            self.assertIn('миниатюр: 1', out.getvalue())
+            with mock.patch('core.images._make') as make:
+                resize(post.image.name, *POST_IMAGE_SIZE, POST_IMAGE_CROP,
+                       'jpeg')
+            make.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MigrateMediaLayoutCommandTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='Tester')
+        self.posts = []
+        for number in range(3):
+            name = default_storage.save(
+                f'posts/pic{number}.gif', ContentFile(b'GIF89a'))
+            self.posts.append(Post.objects.create(
+                author=author, text='Текст', image=name))
+
+    def test_files_moved_to_hashed_directories(self):
+        """Картинки переезжают в каталоги по хешу, пути в постах меняются."""
+        out = StringIO()
+        call_command('migrate_media_layout', batch_size=2, workers=2,
+                     stdout=out)
+        self.assertIn('Перенесено картинок: 3, ошибок: 0', out.getvalue())
+        for post in self.posts:
+            with self.subTest(image=post.image.name):
+                new_name = hashed_path(post.image.name)
+                post.refresh_from_db()
+                self.assertEqual(post.image.name, new_name)
+                self.assertTrue(default_storage.exists(new_name))
+        self.assertEqual(default_storage.listdir('posts')[1], [])
+
+    def test_interrupted_move_is_resumed(self):
+        """Повторный запуск доделывает перенос, начатый до сбоя."""
+        post = self.posts[0]
+        new_name = hashed_path(post.image.name)
+        default_storage.save(new_name, ContentFile(b'GIF'))
+        call_command('migrate_media_layout', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, new_name)
+        self.assertEqual(default_storage.size(new_name), len(b'GIF89a'))
+        out = StringIO()
+        call_command('migrate_media_layout', stdout=out)
+        self.assertIn('Перенесено картинок: 0', out.getvalue())
+
+    def test_thumbnails_of_moved_files_deleted(self):
+        """Миниатюры по старому пути удаляются вместе с переносом."""
+        name = self.posts[0].image.name
+        default_storage.delete(name)
+        default_storage.save(name, ContentFile(SMALL_GIF))
+        thumbnail = resize(name, *POST_IMAGE_SIZE, POST_IMAGE_CROP, 'jpeg')
+        self.assertTrue(default_storage.exists(thumbnail))
+        call_command('migrate_media_layout', stdout=StringIO())
+        self.assertFalse(default_storage.exists(thumbnail))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GcMediaCommandTest(TransactionTestCase):
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='Tester')
+        self.post = Post.objects.create(
+            author=author, text='Текст',
+            image=SimpleUploadedFile('used.gif', b'GIF89a used'))
+        self.orphan = default_storage.save(
+            'posts/ab/cd/orphan.gif', ContentFile(b'GIF89a orphan'))
+        self.fresh = default_storage.save(
+            'posts/ab/cd/fresh.gif', ContentFile(b'GIF89a fresh'))
+        old = time.time() - 48 * 3600
+        for name in (self.post.image.name, self.orphan):
+            os.utime(default_storage.path(name), (old, old))
+
+    def test_unreferenced_old_files_deleted(self):
+        """Удаляются только старые файлы, на которые нет ссылок."""
+        out = StringIO()
+        call_command('gc_media', workers=2, stdout=out)
+        self.assertIn('Удалено картинок: 1', out.getvalue())
+        self.assertFalse(default_storage.exists(self.orphan))
+        self.assertTrue(default_storage.exists(self.fresh))
+        self.assertTrue(default_storage.exists(self.post.image.name))
+
+    def test_dry_run_keeps_files(self):
+        """Пробный запуск показывает файлы, но не удаляет их."""
+        out = StringIO()
+        call_command('gc_media', dry_run=True, stdout=out)
+        self.assertIn(self.orphan, out.getvalue())
+        self.assertIn('Будет удалено картинок: 1', out.getvalue())
+        self.assertTrue(default_storage.exists(self.orphan))
+
+    def test_thumbnails_of_lost_sources_deleted(self):
+        """Миниатюры пропавших исходников удаляются, живые остаются."""
+        author = User.objects.get(username='Tester')
+        lost, kept = (
+            Post.objects.create(
+                author=author, text='Текст',
+                image=SimpleUploadedFile(name, SMALL_GIF + name.encode()))
+            for name in ('lost.gif', 'kept.gif'))
+        thumbnails = [
+            resize(post.image.name, *POST_IMAGE_SIZE, POST_IMAGE_CROP,
+                   'jpeg')
+            for post in (lost, kept)]
+        os.remove(default_storage.path(lost.image.name))
+        call_command('gc_media', grace_hours=0, stdout=StringIO())
+        self.assertFalse(default_storage.exists(thumbnails[0]))
+        self.assertTrue(default_storage.exists(thumbnails[1]))
+
+
+class RenderTextsCommandTest(TransactionTestCase):
+    def test_old_versions_rerendered(self):
+        """Команда размечает тексты старой версии и не трогает новые."""
+        author = User.objects.create(username='Tester')
+        post = Post.objects.create(author=author, text='*Старый*')
+        fresh = Post.objects.create(author=author, text='*Новый*')
+        comment = Comment.objects.create(
+            post=post, author=author, text='**Комментарий**')
+        Post.objects.filter(pk=post.pk).update(
+            text_html='', excerpt_html='', text_html_version=0)
+        Comment.objects.filter(pk=comment.pk).update(text_html_version=0)
+        Post.objects.filter(pk=fresh.pk).update(text_html='<p>Как есть</p>')
+        out = StringIO()
+        call_command('render_texts', stdout=out)
+        self.assertIn('Посты: 1', out.getvalue())
+        self.assertIn('Комментарии: 1', out.getvalue())
+        post.refresh_from_db()
+        comment.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(post.text_html, '<p><em>Старый</em></p>')
+        self.assertEqual(post.excerpt_html, post.text_html)
+        self.assertEqual(post.text_html_version, RENDERER_VERSION)
+        self.assertEqual(comment.text_html_version, RENDERER_VERSION)
+        self.assertEqual(fresh.text_html, '<p>Как есть</p>')
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -38,6 +39,8 @@ class PostFormsTests(TestCase):
             content=picture,
             content_type='image/jpg'
         )
+        digest = hashlib.sha256(picture).hexdigest()
+        cls.image_name = f'posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
         cls.post = Post.objects.create(
             text='Тестовый текст',
             author=cls.user,
@@ -73,7 +76,7 @@ class PostFormsTests(TestCase):
             Post.objects.filter(
                 text='Текст для теста',
                 group=self.group.id,
-                image='posts/pic.jpg'
+                image=self.image_name
             ).exists()
         )
 
@@ -116,7 +119,7 @@ class PostFormsTests(TestCase):
             Post.objects.filter(
                 text='Текст для теста',
                 group=self.group.id,
-                image='posts/pic.jpg'
+                image=self.image_name
             ).exists()
         )
 
@@ -1,6 +1,7 @@
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 
+from ..markup import RENDERER_VERSION
 from ..models import Group, Post
 
 User = get_user_model()
@@ -56,3 +57,31 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected)
+
+
+class RenderedTextTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def test_text_rendered_on_save(self):
+        """Текст поста размечается при сохранении, HTML экранируется."""
+        post = Post.objects.create(
+            author=self.user,
+            text='**Жирный** и *курсив* <script>\n@auth @nobody #тег\n\n'
+                 'https://example.com/a_b. `<b>`',
+        )
+        self.assertEqual(post.text_html_version, RENDERER_VERSION)
+        self.assertHTMLEqual(
+            post.text_html,
+            '<p><strong>Жирный</strong> и <em>курсив</em> &lt;script&gt;'
+            '<br><a href="/profile/auth/">@auth</a> @nobody '
+            '<a class="hashtag" href="/tags/%D1%82%D0%B5%D0%B3/">#тег</a></p>'
+            '<p><a href="https://example.com/a_b" rel="nofollow">'
+            'https://example.com/a_b</a>. <code>&lt;b&gt;</code></p>',
+        )
+        post.text = 'Новый текст'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '<p>Новый текст</p>')
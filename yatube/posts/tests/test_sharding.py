@@ -0,0 +1,211 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.models import StoredFile
+from core.paginators import CursorPaginator
+from core.sharding import shard_for_author
+from core.storage import delete_unreferenced
+from posts.likes import like, like_counts
+from posts.models import Comment, Group, Like, Post
+from posts.moderation import purge_comments, reassign_posts
+from posts.signals import keep_image_references
+
+SHARDS = ['shard1', 'shard2']
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+User = get_user_model()
+
+
+@override_settings(POST_SHARDS=SHARDS)
+class ShardingTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        for alias in SHARDS:
+            connections.databases[alias] = {
+                'ENGINE': 'core.db.sqlite3',
+                'NAME': f'{cls.directory}/{alias}.sqlite3',
+                'OPTIONS': {'pragmas': {'foreign_keys': 'OFF'}},
+            }
+            call_command('migrate', database=alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.authors = [User.objects.create(username=f'author{number}')
+                        for number in range(4)]
+        self.posts = [
+            Post.objects.create(
+                author=self.authors[number % 4], group=self.group,
+                text=f'Пост {number}')
+            for number in range(12)
+        ]
+
+    def tearDown(self):
+        for alias in SHARDS:
+            Post._base_manager.using(alias).all().delete()
+
+    def test_posts_placed_on_author_shard(self):
+        """Посты лежат на шарде автора, ключи не повторяются."""
+        for post in self.posts:
+            self.assertEqual(post._state.db, shard_for_author(post.author_id))
+        self.assertEqual(
+            len({post.pk for post in self.posts}), len(self.posts))
+        self.assertFalse(Post._base_manager.exists())
+
+    def test_fan_out_merges_by_pub_date(self):
+        """Запрос без шарда сливает строки всех шардов по сортировке."""
+        self.assertEqual(
+            list(Post.objects.select_related('author', 'group')),
+            self.posts[::-1])
+        self.assertEqual(Post.objects.count(), len(self.posts))
+        self.assertEqual(list(Post.objects.all()[2:4]), self.posts[-3:-5:-1])
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk),
+                         self.posts[0])
+
+    def test_likes_stored_on_post_shard(self):
+        """Лайки и их счётчики лежат на шарде поста."""
+        post = self.posts[0]
+        for reader in self.authors:
+            self.assertTrue(like(reader, post))
+        self.assertFalse(like(self.authors[0], post))
+        shard = shard_for_author(post.author_id)
+        self.assertEqual(Like._base_manager.using(shard).count(), 4)
+        self.assertEqual(
+            like_counts([post.pk, self.posts[1].pk]),
+            {post.pk: 4, self.posts[1].pk: 0})
+
+    def test_related_manager_uses_author_shard(self):
+        """Посты автора читаются только с его шарда."""
+        author = self.authors[0]
+        with self.assertNumQueries(1, using=shard_for_author(author.pk)):
+            self.assertEqual(author.posts.count(), 3)
+
+    def test_cursor_paginator_walks_all_posts(self):
+        """Курсорная пагинация проходит все посты без повторов."""
+        paginator = CursorPaginator(Post.objects.all(), 5)
+        page = paginator.get_page(None)
+        seen = list(page)
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen.extend(page)
+        self.assertEqual(seen, self.posts[::-1])
+
+    def test_pages_show_sharded_posts(self):
+        """Главная, группа и пост работают с постами на шардах."""
+        client = Client()
+        response = client.get(reverse('posts:index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         self.posts[:-11:-1])
+        response = client.get(
+            reverse('posts:index'),
+            {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(list(response.context['page_obj']),
+                         self.posts[1::-1])
+        response = client.get(
+            reverse('posts:group_list', args=(self.group.slug,)))
+        self.assertEqual(response.context['posts_count'](), len(self.posts))
+        post = self.posts[0]
+        Comment.objects.create(post=post, author=self.authors[1],
+                               text='Комментарий')
+        response = client.get(reverse('posts:post_detail', args=(post.pk,)))
+        self.assertContains(response, 'Комментарий')
+
+    def test_rebalance_moves_misplaced_posts(self):
+        """Команда переносит пост с комментариями на шард автора."""
+        post = self.posts[0]
+        comment = Comment.objects.create(
+            post=post, author=self.authors[1], text='Комментарий')
+        home = post._state.db
+        other = next(alias for alias in SHARDS if alias != home)
+        Post._base_manager.using(other).bulk_create([post])
+        Comment._base_manager.using(other).bulk_create([comment])
+        Post._base_manager.using(home).filter(pk=post.pk).delete()
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('постов: 1, комментариев: 1', out.getvalue())
+        self.assertTrue(
+            Comment._base_manager.using(home).filter(pk=comment.pk).exists())
+        self.assertFalse(
+            Post._base_manager.using(other).filter(pk=post.pk).exists())
+
+    def test_rebalance_keeps_image_references(self):
+        """Перенос поста не снимает ссылку с его картинки."""
+        media_root = tempfile.mkdtemp(dir=self.directory)
+        with self.settings(MEDIA_ROOT=media_root):
+            post = self.posts[0]
+            post.image = SimpleUploadedFile(
+                'pic.gif', SMALL_GIF, content_type='image/gif')
+            post.save()
+            name = post.image.name
+            home = post._state.db
+            other = next(alias for alias in SHARDS if alias != home)
+            Post._base_manager.using(other).bulk_create([post])
+            with keep_image_references():
+                Post._base_manager.using(home).filter(pk=post.pk).delete()
+            call_command('rebalance_shards', stdout=StringIO())
+            self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+            delete_unreferenced([name], post.image.storage)
+            self.assertTrue(post.image.storage.exists(name))
+
+    def test_reassigned_posts_moved_to_new_author_shard(self):
+        """Пост, переданный другому автору, переезжает на его шард."""
+        post = self.posts[0]
+        home = shard_for_author(post.author_id)
+        # Шард зависит от id, поэтому автора подбираем, а не берём готового.
+        new_author = User.objects.create(username='heir')
+        while shard_for_author(new_author.pk) == home:
+            new_author.delete()
+            new_author = User.objects.create(username='heir')
+        comment = Comment.objects.create(
+            post=post, author=self.authors[1], text='Комментарий')
+        like(self.authors[2], post)
+        reassign_posts(Post.objects.filter(pk=post.pk), new_author)
+        target = shard_for_author(new_author.pk)
+        self.assertIn(post, list(new_author.posts.all()))
+        for model, pk in ((Post, post.pk), (Comment, comment.pk)):
+            with self.subTest(model=model):
+                self.assertTrue(model._base_manager.using(target).filter(
+                    pk=pk).exists())
+                self.assertFalse(model._base_manager.using(home).filter(
+                    pk=pk).exists())
+        self.assertEqual(like_counts([post.pk]), {post.pk: 1})
+
+    def test_purge_comments_on_shards(self):
+        """Комментарии пользователя удаляются со всех шардов."""
+        commenter = self.authors[1]
+        for post in self.posts:
+            Comment.objects.create(
+                post=post, author=commenter, text='Комментарий')
+        Comment.objects.create(
+            post=self.posts[0], author=self.authors[2], text='Чужой')
+        deleted = purge_comments(User.objects.filter(pk=commenter.pk))
+        self.assertEqual(deleted, len(self.posts))
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)), ['Чужой'])
@@ -1,16 +1,39 @@
 import shutil
 import tempfile
+from datetime import date, datetime
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
 from django import forms
+from django.apps import apps as global_apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import escape
 
-from posts.const import POSTS_LIMITER
-from posts.models import Follow, Group, Post
+from core.counters import discard_all
+from core.images import resized_url
+from posts import archive, hashtags
+from posts.const import (EXCERPT_LENGTH, POST_IMAGE_CROP, POST_IMAGE_SIZE,
+                         POSTS_LIMITER, TRENDING_HALF_LIFE)
+from posts.counters import post_views
+from posts.likes import like_counts
+from posts.models import (ArchiveMonth, Comment, Follow, Group,
+                          GroupAuthorStats, GroupStats, Like, Post,
+                          PostScore, PostTag, Tag)
+from posts.moderation import delete_posts, move_posts_to_group
+from posts.trending import trending_events
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 PAGINATOR_POSTS = 11
@@ -119,6 +142,17 @@ class PostViewsTests(TestCase):
                 ))
                 self.assertTemplateUsed(response, template)
 
+    def uncached_responses(self, url):
+        """
+        Ответы авторизованному и неавторизованному пользователю,
+        отрендеренные без кеша страниц.
+        """
+        responses = []
+        for client in (self.authorized_client, self.guest_client):
+            cache.clear()
+            responses.append(client.get(url))
+        return responses
+
     def post_context_checker(self, post):
         with self.subTest(post=post):
             self.assertEqual(post.text, self.post.text,
@@ -132,6 +166,16 @@ class PostViewsTests(TestCase):
             self.assertEqual(post.image, self.post.image,
                              'Изображение не совпадет с ожидаемым!')
 
+    def test_pages_show_resized_image(self):
+        """Лента и страница поста выводят картинку по подписанной
+        ссылке."""
+        url = escape(resized_url(
+            self.post.image.name, *POST_IMAGE_SIZE, POST_IMAGE_CROP))
+        for page in (reverse('posts:index'),
+                     reverse('posts:post_detail', args=(self.post.pk,))):
+            with self.subTest(page=page):
+                self.assertContains(self.guest_client.get(page), url)
+
     def test_index_page_show_correct_context_for_authorized_client(self):
         """
         Шаблон index сформирован с правильным контекстом
@@ -152,14 +196,8 @@ class PostViewsTests(TestCase):
 
     def test_groups_posts_show_correct_context(self):
         """Шаблон group_list сформирован с правильным контекстом."""
-        responses = [
-            self.authorized_client.get(
-                reverse('posts:group_list',
-                        kwargs={'slug': self.group.slug})),
-            self.guest_client.get(
-                reverse('posts:group_list',
-                        kwargs={'slug': self.group.slug}))
-        ]
+        responses = self.uncached_responses(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}))
         for response in responses:
             with self.subTest(response=response):
                 context_objects = [
@@ -176,14 +214,8 @@ class PostViewsTests(TestCase):
 
     def test_profile_show_correct_context(self):
         """Шаблон profile сформирован с правильным контекстом."""
-        responses = [
-            self.authorized_client.get(
-                reverse('posts:profile',
-                        kwargs={'username': self.post.author})),
-            self.guest_client.get(
-                reverse('posts:profile',
-                        kwargs={'username': self.post.author}))
-        ]
+        responses = self.uncached_responses(
+            reverse('posts:profile', kwargs={'username': self.post.author}))
         for response in responses:
             with self.subTest(response=response):
                 context_objects = [
@@ -200,13 +232,8 @@ class PostViewsTests(TestCase):
 
     def test_post_detail_show_correct_context(self):
         """Шаблон post_detail сформирован с правильным контекстом."""
-        responses = [
-            self.authorized_client.get(reverse('posts:post_detail',
-                                               kwargs={'post_id': self.post.id}
-                                               )),
-            self.guest_client.get(reverse('posts:post_detail',
-                                          kwargs={'post_id': self.post.id}))
-        ]
+        responses = self.uncached_responses(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
         for response in responses:
             with self.subTest(response=response):
                 context_objects = [
@@ -266,17 +293,49 @@ class PostViewsTests(TestCase):
         post = Post.objects.create(
             text='Test cache text',
             author=self.user)
-        content_add = self.authorized_client.get(
+        content_add = self.guest_client.get(
             reverse('posts:index')).content
         post.delete()
-        content_delete = self.authorized_client.get(
+        content_delete = self.guest_client.get(
             reverse('posts:index')).content
         self.assertEqual(content_add, content_delete)
         cache.clear()
-        content_cache_clear = self.authorized_client.get(
+        content_cache_clear = self.guest_client.get(
             reverse('posts:index')).content
         self.assertNotEqual(content_add, content_cache_clear)
 
+    def test_cache_index_page_shared_with_authorized_client(self):
+        """
+        Авторизованный пользователь получает закешированную страницу
+        со своей шапкой.
+        """
+        post = Post.objects.create(
+            text='Test cache text',
+            author=self.user)
+        self.guest_client.get(reverse('posts:index'))
+        post.delete()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Test cache text')
+        self.assertContains(response, reverse('users:logout'))
+        self.assertNotContains(response, reverse('users:signup'))
+
+    def test_post_detail_cache_reset_on_comment(self):
+        """Новый комментарий сбрасывает кеш страницы поста."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.guest_client.get(url)
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': 'Свежий комментарий'})
+        self.assertContains(self.guest_client.get(url), 'Свежий комментарий')
+
+    def test_post_controls_rendered_per_user(self):
+        """Кнопки управления постом видит только автор."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        edit_url = reverse('posts:post_edit',
+                           kwargs={'post_id': self.post.id})
+        self.assertNotContains(self.guest_client.get(url), edit_url)
+        self.assertContains(self.authorized_client.get(url), edit_url)
+
 
 class FollowViewTest(TestCase):
     @classmethod
@@ -342,6 +401,342 @@ class PaginatorViewsTest(TestCase):
                 author=cls.user,
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_contains_ten_records(self):
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(len(response.context['page_obj']), POSTS_LIMITER)
+
+
+class PostViewCounterTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        # Просмотры из других тестов, ключи постов повторяются.
+        post_views.flush()
+        self.post = Post.objects.create(
+            author=User.objects.create(username='Tester'),
+            text='Тестовый текст')
+        self.url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.id})
+
+    def test_views_counted_including_cached_pages(self):
+        """Просмотры из кеша страниц тоже считаются и пишутся пачкой."""
+        for _ in range(3):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.client.get(reverse('posts:post_detail',
+                                kwargs={'post_id': self.post.id + 1}))
+        post_views.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 3)
+
+    def test_discarded_views_not_written(self):
+        """Отброшенные просмотры в БД не пишутся."""
+        self.client.get(self.url)
+        discard_all()
+        post_views.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 0)
+
+
+class LikeViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Reader')
+        author = User.objects.create(username='Tester')
+        cls.posts = [Post.objects.create(author=author, text=f'Пост {n}')
+                     for n in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_like_once_and_unlike(self):
+        """Повторный лайк не считается, снятый лайк вычитается."""
+        post = self.posts[0]
+        like_url = reverse('posts:post_like', kwargs={'post_id': post.pk})
+        index = reverse('posts:index')
+        response = self.client.post(f'{like_url}?next={index}')
+        self.assertRedirects(response, index)
+        self.client.post(like_url)
+        self.assertEqual(like_counts([post.pk]), {post.pk: 1})
+        self.assertEqual(Like.objects.filter(post=post).count(), 1)
+        self.client.post(
+            reverse('posts:post_unlike', kwargs={'post_id': post.pk}))
+        self.assertEqual(like_counts([post.pk]), {post.pk: 0})
+
+    def test_like_not_changed_by_get(self):
+        """GET-запрос, например от предзагрузки, лайк не ставит."""
+        post = self.posts[0]
+        response = self.client.get(
+            reverse('posts:post_like', kwargs={'post_id': post.pk}))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(like_counts([post.pk]), {post.pk: 0})
+
+    def test_like_buttons_loaded_in_one_query(self):
+        """Лайки читателя для всех карточек страницы — один запрос."""
+        self.client.post(
+            reverse('posts:post_like', kwargs={'post_id': self.posts[1].pk}))
+        self.client.get(reverse('posts:index'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('posts:index'))
+        like_queries = [query for query in context.captured_queries
+                        if '"posts_like"' in query['sql']]
+        self.assertEqual(len(like_queries), 1)
+        self.assertContains(response, '&#9829; 1')
+        self.assertContains(response, '&#9825; 0', count=2)
+        self.assertContains(response, 'csrfmiddlewaretoken', count=3)
+
+
+class TrendingViewsTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        trending_events.flush()
+        author = User.objects.create(username='Tester')
+        self.posts = [Post.objects.create(author=author, text=f'Пост {n}')
+                      for n in range(3)]
+
+    def test_trending_ranked_by_decayed_score(self):
+        """Популярные упорядочены по рейтингу, старые события весят меньше."""
+        old, liked, viewed = self.posts
+        trending_events.add(old.pk, 100)
+        trending_events.flush()
+        PostScore.objects.filter(post_id=old.pk).update(
+            updated=F('updated') - 20 * TRENDING_HALF_LIFE)
+        Like.objects.create(user=old.author, post=liked)
+        trending_events.add(viewed.pk, 1)
+        trending_events.flush()
+        call_command('refresh_trending', stdout=StringIO())
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [liked, viewed])
+
+
+class GroupIndexViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Author')
+        self.other = User.objects.create(username='Other')
+        self.quiet = Group.objects.create(title='Тихая', slug='quiet')
+        self.busy = Group.objects.create(title='Активная', slug='busy')
+        Group.objects.create(title='Пустая', slug='empty')
+        Post.objects.create(author=self.author, text='Старый',
+                            group=self.quiet)
+        for text in ('Первый', 'Второй'):
+            Post.objects.create(author=self.author, text=text,
+                                group=self.busy)
+        self.post = Post.objects.create(author=self.other, text='Третий',
+                                        group=self.busy)
+
+    def test_stats_follow_post_changes(self):
+        """Сводки групп правятся при создании, переносе и удалении поста."""
+        self.assertEqual(GroupStats.objects.get(group=self.busy).posts_count,
+                         3)
+        self.post.group = self.quiet
+        self.post.save()
+        self.assertEqual(GroupStats.objects.get(group=self.busy).posts_count,
+                         2)
+        stats = GroupStats.objects.get(group=self.quiet)
+        self.assertEqual(stats.posts_count, 2)
+        self.assertEqual(stats.last_post_at, self.post.pub_date)
+        self.post.delete()
+        stats = GroupStats.objects.get(group=self.quiet)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertLess(stats.last_post_at, self.post.pub_date)
+        self.assertFalse(GroupAuthorStats.objects.filter(
+            author=self.other).exists())
+
+    def test_group_index_refreshed_after_post_changes(self):
+        """Новый пост и массовый перенос обновляют кешированный
+        каталог групп."""
+        url = reverse('posts:group_index')
+        self.assertNotContains(self.client.get(url), 'Постов: 2')
+        Post.objects.create(author=self.other, text='Новый',
+                            group=self.quiet)
+        self.assertContains(self.client.get(url), 'Постов: 2')
+        move_posts_to_group(Post.objects.filter(group=self.busy), self.quiet)
+        self.assertContains(self.client.get(url), 'Постов: 5')
+
+    def test_group_index_sorted_by_activity(self):
+        """Каталог групп упорядочен по активности и показывает авторов."""
+        response = self.client.get(reverse('posts:group_index'))
+        groups = list(response.context['page_obj'])
+        self.assertEqual([group.slug for group in groups],
+                         ['busy', 'quiet', 'empty'])
+        self.assertEqual(groups[0].top_authors, [self.author, self.other])
+        self.assertEqual(groups[0].stats.posts_count, 3)
+        response = self.client.get(
+            reverse('posts:group_index_sorted', args=['title']))
+        self.assertEqual(
+            [group.slug for group in response.context['page_obj']],
+            ['busy', 'empty', 'quiet'])
+        response = self.client.get(
+            reverse('posts:group_index_sorted', args=['unknown']))
+        self.assertEqual(response.status_code, 404)
+
+
+class ArchiveViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Author')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.posts = [Post.objects.create(author=self.author, text=text,
+                                          group=self.group)
+                      for text in ('Старый', 'Новый')]
+
+    def counts(self):
+        return dict(ArchiveMonth.objects.values_list('scope', 'posts_count'))
+
+    def test_months_follow_post_changes(self):
+        """Месяцы архива правятся при создании, переносе и удалении."""
+        scopes = [archive.SITE_SCOPE, archive.group_scope(self.group.pk),
+                  archive.author_scope(self.author.pk)]
+        self.assertEqual(self.counts(), dict.fromkeys(scopes, 2))
+        old, new = self.posts
+        old.group = None
+        old.save()
+        self.assertEqual(self.counts()[scopes[1]], 1)
+        new.delete()
+        self.assertEqual(self.counts(),
+                         {scopes[0]: 1, scopes[2]: 1})
+
+    def test_site_archive_refreshed_after_post_changes(self):
+        """Новый и удалённые посты обновляют кешированный архив сайта."""
+        month = archive.month_of(self.posts[0].pub_date)
+        url = reverse('posts:archive_month', args=[month.year, month.month])
+        self.assertNotContains(self.client.get(url), 'Свежий')
+        Post.objects.create(author=self.author, text='Свежий')
+        self.assertContains(self.client.get(url), 'Свежий')
+        delete_posts(Post.objects.filter(text='Свежий'))
+        self.assertNotContains(self.client.get(url), 'Свежий')
+
+    def test_month_page_shows_posts_of_month(self):
+        """Страница месяца показывает только посты этого месяца."""
+        old, new = self.posts
+        Post.objects.filter(pk=old.pk).update(pub_date=timezone.make_aware(
+            datetime(2023, 3, 15)))
+        archive.rebuild([self.group.pk], [self.author.pk],
+                        [date(2023, 3, 1), archive.month_of(new.pub_date)])
+        pages = (
+            reverse('posts:archive_month', args=[2023, 3]),
+            reverse('posts:group_archive_month', args=['group', 2023, 3]),
+            reverse('posts:profile_archive_month',
+                    args=['Author', 2023, 3]),
+        )
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(list(response.context['page_obj']), [old])
+                months = response.context['months']
+                self.assertEqual(
+                    [(bucket.month, bucket.posts_count) for bucket in months],
+                    [(archive.month_of(new.pub_date), 1),
+                     (date(2023, 3, 1), 1)])
+                self.assertEqual(response.context['newer'], months[0])
+        response = self.client.get(reverse('posts:archive'))
+        self.assertContains(response, pages[0])
+        response = self.client.get(
+            reverse('posts:archive_month', args=[2023, 13]))
+        self.assertEqual(response.status_code, 404)
+
+
+class TagViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Author')
+        self.posts = [
+            Post.objects.create(author=self.author, text=f'Пост {n} #Django')
+            for n in range(POSTS_LIMITER + 2)]
+        self.other = Post.objects.create(
+            author=self.author, text='#python и **#django**')
+
+    def test_tag_counts_follow_post_changes(self):
+        """Число постов тега меняется при правке и удалении поста."""
+        self.assertEqual(Tag.objects.get(name='django').posts_count,
+                         POSTS_LIMITER + 3)
+        self.other.text = 'Без тегов'
+        self.other.save()
+        self.posts[0].delete()
+        counts = dict(Tag.objects.values_list('name', 'posts_count'))
+        self.assertEqual(counts, {'django': POSTS_LIMITER + 1, 'python': 0})
+        response = self.client.get(reverse('posts:tag_index'))
+        self.assertEqual(list(response.context['tags']),
+                         [Tag.objects.get(name='django')])
+
+    def test_tag_counted_once_when_row_already_written(self):
+        """Строка тега, записанная одновременным сохранением поста, не
+        считается повторно."""
+        post = self.posts[0]
+        get_or_create = hashtags._get_or_create
+
+        def concurrent_save(names):
+            tags = get_or_create(names)
+            for tag in tags:
+                PostTag.objects.create(
+                    tag=tag, post_id=post.pk, pub_date=post.pub_date)
+                Tag.objects.filter(pk=tag.pk).update(posts_count=1)
+            return tags
+
+        post.text += ' #новый'
+        with mock.patch('posts.hashtags._get_or_create', concurrent_save):
+            post.save()
+        self.assertEqual(Tag.objects.get(name='новый').posts_count, 1)
+
+    def test_comment_hashtags_not_linked(self):
+        """Хештеги комментариев не ведут в ленты тегов."""
+        comment = Comment.objects.create(
+            post=self.other, author=self.author, text='#только_тут')
+        self.assertEqual(comment.text_html, '<p>#только_тут</p>')
+        self.assertFalse(Tag.objects.filter(name='только_тут').exists())
+
+    def test_tag_feed_uses_cursor(self):
+        """Лента тега идёт от новых постов к старым страницами по курсору."""
+        url = reverse('posts:tag_posts', args=['DJANGO'])
+        response = self.client.get(url)
+        first = list(response.context['page_obj'])
+        self.assertEqual(first, [self.other, *self.posts[::-1]][
+            :POSTS_LIMITER])
+        cursor = response.context['page_obj'].next_cursor
+        response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual(list(response.context['page_obj']),
+                         self.posts[2::-1])
+        self.assertContains(
+            self.client.get(reverse('posts:tag_posts', args=['python'])),
+            'href="/tags/django/"')
+
+
+class PostExcerptViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='Author')
+        self.ending = 'Конец длинного поста'
+        self.long = Post.objects.create(
+            author=author, text='Слово ' * EXCERPT_LENGTH + self.ending)
+        self.short = Post.objects.create(author=author, text='Короткий')
+
+    def test_lists_show_excerpt_without_text(self):
+        """В списке только начало поста, весь текст — на его странице."""
+        response = self.client.get(reverse('posts:index'))
+        for post in response.context['page_obj']:
+            self.assertTrue({'text', 'text_html'}
+                            <= post.get_deferred_fields())
+        self.assertNotContains(response, self.ending)
+        self.assertContains(response, 'подробная информация', count=2)
+        self.assertContains(response, 'читать дальше', count=1)
+        self.assertContains(response, 'Короткий')
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.long.pk]))
+        self.assertContains(response, self.ending)
+
+    def test_migration_fills_missing_excerpts(self):
+        """Миграция заполняет начало постов, сохранённых без него."""
+        expected = self.long.excerpt_html
+        Post.objects.filter(pk=self.long.pk).update(
+            excerpt_html='', has_more=False)
+        migration = import_module('posts.migrations.0022_fill_post_excerpts')
+        migration.fill_post_excerpts(
+            global_apps, SimpleNamespace(connection=connection))
+        self.long.refresh_from_db()
+        self.assertEqual(self.long.excerpt_html, expected)
+        self.assertTrue(self.long.has_more)
@@ -0,0 +1,66 @@
+"""Популярные посты.
+
+У поста есть затухающий рейтинг ``PostScore``: каждое событие
+(просмотр, лайк, комментарий) добавляет свой вес, а накопленное
+уменьшается вдвое каждые ``TRENDING_HALF_LIFE`` секунд. События копит
+``BufferedCounter`` и раз в несколько секунд применяет пачкой: один
+``UPDATE`` сначала уменьшает рейтинг на время, прошедшее с прошлого
+пересчёта, а потом прибавляет веса. Таблицы комментариев, лайков и
+просмотров для этого не читаются.
+
+Команда ``refresh_trending`` (по расписанию, раз в минуту) записывает
+первые ``TRENDING_SIZE`` постов в ``TrendingPost``, страница популярных
+читает их по первичному ключу — месту в рейтинге.
+"""
+import time
+
+from django.db import close_old_connections, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Power
+
+from core.counters import BufferedCounter
+from core.page_cache import invalidate_page_tags
+from posts.const import (TRENDING_HALF_LIFE, TRENDING_MIN_SCORE,
+                         TRENDING_SIZE, VIEWS_BATCH_SIZE)
+
+from .models import PostScore, TrendingPost
+
+
+def decayed_score(now):
+    """Выражение рейтинга, затухшего к моменту ``now``."""
+    return F('score') * Power(
+        Value(0.5), (Value(now) - F('updated')) / Value(TRENDING_HALF_LIFE),
+        output_field=FloatField())
+
+
+def save_scores(groups):
+    close_old_connections()
+    now = time.time()
+    with transaction.atomic():
+        for weight, pks in groups.items():
+            for start in range(0, len(pks), VIEWS_BATCH_SIZE):
+                batch = pks[start:start + VIEWS_BATCH_SIZE]
+                PostScore.objects.bulk_create(
+                    [PostScore(post_id=pk, updated=now) for pk in batch],
+                    ignore_conflicts=True)
+                PostScore.objects.filter(post_id__in=batch).update(
+                    score=decayed_score(now) + weight, updated=now)
+
+
+trending_events = BufferedCounter(save_scores)
+
+
+def refresh_trending(size=TRENDING_SIZE):
+    """Пересчитывает список популярных, забывая затухшие рейтинги."""
+    now = time.time()
+    scores = PostScore.objects.annotate(current=decayed_score(now))
+    top = list(scores.filter(current__gte=TRENDING_MIN_SCORE).order_by(
+        '-current').values_list('post_id', 'current')[:size])
+    with transaction.atomic():
+        scores.filter(current__lt=TRENDING_MIN_SCORE).delete()
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create(
+            TrendingPost(rank=rank, post_id=post_id, score=score)
+            for rank, (post_id, score) in enumerate(top, start=1))
+    invalidate_page_tags('trending')
+    return len(top)
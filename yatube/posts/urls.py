@@ -9,14 +9,58 @@ urlpatterns = [
          views.index,
          name='index'
          ),
+    path('trending/',
+         views.trending,
+         name='trending'
+         ),
+    path('groups/',
+         views.group_index,
+         name='group_index'
+         ),
+    path('groups/<slug:sort>/',
+         views.group_index,
+         name='group_index_sorted'
+         ),
+    path('archive/',
+         views.site_archive,
+         name='archive'
+         ),
+    path('archive/<int:year>/<int:month>/',
+         views.site_archive,
+         name='archive_month'
+         ),
     path('group/<slug:slug>/',
          views.groups_posts,
          name='group_list'
          ),
+    path('group/<slug:slug>/archive/',
+         views.group_archive,
+         name='group_archive'
+         ),
+    path('group/<slug:slug>/archive/<int:year>/<int:month>/',
+         views.group_archive,
+         name='group_archive_month'
+         ),
+    path('tags/',
+         views.tag_index,
+         name='tag_index'
+         ),
+    path('tags/<str:name>/',
+         views.tag_posts,
+         name='tag_posts'
+         ),
     path('profile/<str:username>/',
          views.profile,
          name='profile'
          ),
+    path('profile/<str:username>/archive/',
+         views.profile_archive,
+         name='profile_archive'
+         ),
+    path('profile/<str:username>/archive/<int:year>/<int:month>/',
+         views.profile_archive,
+         name='profile_archive_month'
+         ),
     path('posts/<int:post_id>/',
          views.post_detail,
          name='post_detail'
@@ -37,6 +81,14 @@ urlpatterns = [
          views.add_comment,
          name='add_comment'
          ),
+    path('posts/<int:post_id>/like/',
+         views.post_like,
+         name='post_like'
+         ),
+    path('posts/<int:post_id>/unlike/',
+         views.post_unlike,
+         name='post_unlike'
+         ),
     path('follow/',
          views.follow_index,
          name='follow_index'
@@ -1,33 +1,101 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db.models import F
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
+from django.utils.http import is_safe_url
+from django.views.decorators.http import require_POST
 
-from posts.const import POSTS_LIMITER
+from core.managers import cached_queryset
+from core.page_cache import cache_page_swr, deferred_fragments
+from core.paginators import CursorPaginator
+from core.routers import replica_reads
+from core.sharding import shard_aliases
+from core.write_queue import run_write, unavailable_on_timeout
+from posts.const import (GROUP_TOP_AUTHORS, GROUPS_PER_PAGE,
+                         PAGE_CACHE_TIMEOUT, POPULAR_TAGS, POSTS_LIMITER)
 
+from . import archive
+from .counters import count_views
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .group_stats import top_authors
+from .likes import like, unlike
+from .markup import normalize_tag
+from .models import Follow, Group, Post, Tag, TrendingPost, User
 
 
-def paginator(request, post_list):
+def paginator(request, post_list, count=None):
+    if shard_aliases():
+        return CursorPaginator(post_list, POSTS_LIMITER).get_page(
+            request.GET.get('cursor'))
     paginator = Paginator(post_list, POSTS_LIMITER)
+    if count is not None:
+        paginator.count = count
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
 
 
-@cache_page(20)
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT)
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.select_related('author', 'group').defer(
+        *Post.list_deferred_fields).cached()
     context = {
         'page_obj': paginator(request, post_list)
     }
     return render(request, 'posts/index.html', context)
 
 
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT, tags=lambda request: ['trending'])
+def trending(request):
+    ranked = list(TrendingPost.objects.values_list('post_id', flat=True))
+    posts = Post.objects.select_related('author', 'group').defer(
+        *Post.list_deferred_fields).in_bulk(ranked)
+    post_list = [posts[pk] for pk in ranked if pk in posts]
+    context = {
+        'page_obj': Paginator(post_list, POSTS_LIMITER).get_page(
+            request.GET.get('page')),
+    }
+    return render(request, 'posts/trending.html', context)
+
+
+GROUP_ORDERINGS = {
+    'activity': (F('stats__last_post_at').desc(nulls_last=True), 'title'),
+    'posts': (F('stats__posts_count').desc(nulls_last=True), 'title'),
+    'title': ('title',),
+}
+
+
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT, tags=lambda request, **kwargs: ['groups'])
+def group_index(request, sort='activity'):
+    if sort not in GROUP_ORDERINGS:
+        raise Http404
+    groups = Group.objects.select_related('stats').order_by(
+        *GROUP_ORDERINGS[sort]).cached()
+    page_obj = Paginator(groups, GROUPS_PER_PAGE).get_page(
+        request.GET.get('page'))
+    authors = top_authors([group.pk for group in page_obj],
+                          GROUP_TOP_AUTHORS)
+    for group in page_obj:
+        group.top_authors = authors[group.pk]
+    context = {
+        'page_obj': page_obj,
+        'sort': sort,
+    }
+    return render(request, 'posts/group_index.html', context)
+
+
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT,
+                tags=lambda request, slug: [f'group:{slug}'])
 def groups_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
+    group = get_object_or_404(Group.objects.cached(), slug=slug)
     title = group.title
-    post_list = group.posts.all()
+    post_list = group.posts.select_related('author').defer(
+        *Post.list_deferred_fields).cached()
     context = {
         'title': title,
         'group': group,
@@ -37,9 +105,13 @@ def groups_posts(request, slug):
     return render(request, "posts/group_list.html", context)
 
 
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT,
+                tags=lambda request, username: [f'author:{username}'])
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.select_related('group')
+    author = get_object_or_404(cached_queryset(User), username=username)
+    post_list = author.posts.select_related('group').defer(
+        *Post.list_deferred_fields).cached()
     following = request.user.is_authenticated
     if following:
         following = author.following.filter(user=request.user).exists()
@@ -52,6 +124,106 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+def archive_page(request, scope, post_list, url_name, url_args,
+                 year=None, month=None, **context):
+    """Месяцы раздела со ссылками и, если выбран месяц, его посты."""
+    months = archive.months(scope)
+    for bucket in months:
+        bucket.url = reverse(url_name, args=[
+            *url_args, bucket.month.year, bucket.month.month])
+    context['months'] = months
+    if year is not None:
+        selected = archive.month_or_none(year, month)
+        if selected is None:
+            raise Http404
+        start, end = archive.month_range(selected)
+        buckets = {bucket.month: bucket for bucket in months}
+        newer = [bucket for bucket in months if bucket.month > selected]
+        older = [bucket for bucket in months if bucket.month < selected]
+        context.update({
+            'month': selected,
+            'newer': newer[-1] if newer else None,
+            'older': older[0] if older else None,
+            'page_obj': paginator(
+                request,
+                post_list.filter(pub_date__gte=start, pub_date__lt=end),
+                getattr(buckets.get(selected), 'posts_count', 0)),
+        })
+    return render(request, 'posts/archive.html', context)
+
+
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT,
+                tags=lambda request, **kwargs: ['archive'])
+def site_archive(request, year=None, month=None):
+    post_list = Post.objects.select_related('author', 'group').defer(
+        *Post.list_deferred_fields).cached()
+    return archive_page(
+        request, archive.SITE_SCOPE, post_list, 'posts:archive_month', [],
+        year, month, title='Архив')
+
+
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT,
+                tags=lambda request, slug, **kwargs: [f'group:{slug}'])
+def group_archive(request, slug, year=None, month=None):
+    group = get_object_or_404(Group.objects.cached(), slug=slug)
+    post_list = group.posts.select_related('author').defer(
+        *Post.list_deferred_fields).cached()
+    return archive_page(
+        request, archive.group_scope(group.pk), post_list,
+        'posts:group_archive_month', [slug], year, month,
+        title=f'Архив группы {group.title}', group=group)
+
+
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT,
+                tags=lambda request, username, **kwargs: [
+                    f'author:{username}'])
+def profile_archive(request, username, year=None, month=None):
+    author = get_object_or_404(cached_queryset(User), username=username)
+    post_list = author.posts.select_related('group').defer(
+        *Post.list_deferred_fields).cached()
+    return archive_page(
+        request, archive.author_scope(author.pk), post_list,
+        'posts:profile_archive_month', [username], year, month,
+        title=f'Архив {author.get_full_name() or author.username}',
+        author=author)
+
+
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT, tags=lambda request: ['tags'])
+def tag_index(request):
+    context = {
+        'tags': Tag.objects.filter(posts_count__gt=0).order_by(
+            '-posts_count', 'name').cached()[:POPULAR_TAGS],
+    }
+    return render(request, 'posts/tag_index.html', context)
+
+
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT,
+                tags=lambda request, name: [f'tag:{normalize_tag(name)}'])
+def tag_posts(request, name):
+    tag = get_object_or_404(Tag.objects.cached(), name=normalize_tag(name))
+    page_obj = CursorPaginator(
+        tag.post_tags.all(), POSTS_LIMITER, ordering=('-pub_date', '-post_id')
+    ).get_page(request.GET.get('cursor'))
+    post_ids = [row.post_id for row in page_obj]
+    posts = Post.objects.select_related('author', 'group').defer(
+        *Post.list_deferred_fields).in_bulk(post_ids)
+    page_obj.object_list = [posts[pk] for pk in post_ids if pk in posts]
+    context = {
+        'tag': tag,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/tag_posts.html', context)
+
+
+@count_views
+@replica_reads
+@cache_page_swr(PAGE_CACHE_TIMEOUT,
+                tags=lambda request, post_id: [f'post:{post_id}'])
 def post_detail(request, post_id):
     post = get_object_or_404(
         Post.objects.select_related('author', 'group'), pk=post_id)
@@ -113,6 +285,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@unavailable_on_timeout
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -120,14 +293,44 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        run_write(comment.save)
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def _back_to_page(request, post_id):
+    next_url = request.GET.get('next')
+    if is_safe_url(next_url, allowed_hosts={request.get_host()},
+                   require_https=request.is_secure()):
+        return redirect(next_url)
+    return redirect('posts:post_detail', post_id=post_id)
+
+
+@require_POST
+@login_required
+@unavailable_on_timeout
+def post_like(request, post_id):
+    post = get_object_or_404(Post, pk=post_id)
+    run_write(like, request.user, post)
+    return _back_to_page(request, post_id)
+
+
+@require_POST
+@login_required
+@unavailable_on_timeout
+def post_unlike(request, post_id):
+    post = get_object_or_404(Post, pk=post_id)
+    run_write(unlike, request.user, post)
+    return _back_to_page(request, post_id)
+
+
 @login_required
+@deferred_fragments
 def follow_index(request):
-    author_list = request.user.follower.values('author')
-    post_list = Post.objects.filter(author__in=author_list)
+    # Подписки хранятся в основной БД, посты могут быть на шардах.
+    author_list = list(request.user.follower.values_list(
+        'author', flat=True))
+    post_list = Post.objects.filter(author__in=author_list).defer(
+        *Post.list_deferred_fields)
     context = {
         'page_obj': paginator(request, post_list),
     }
@@ -135,15 +338,18 @@ def follow_index(request):
 
 
 @login_required
+@unavailable_on_timeout
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        run_write(Follow.objects.get_or_create,
+                  user=request.user, author=author)
     return redirect('posts:profile', author)
 
 
 @login_required
+@unavailable_on_timeout
 def profile_unfollow(request, username):
-    Follow.objects.filter(
-        user=request.user, author__username=username).delete()
+    run_write(Follow.objects.filter(
+        user=request.user, author__username=username).delete)
     return redirect('posts:profile', username)
@@ -0,0 +1,26 @@
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+
+from core.admin import BulkActionMixin
+from posts.moderation import purge_comments
+
+User = get_user_model()
+
+
+class UserAdmin(BulkActionMixin, BaseUserAdmin):
+    actions = ('purge_all_comments',)
+
+    def purge_all_comments(self, request, queryset):
+        _, response = self.confirm_bulk_action(
+            request, queryset, 'Удаление всех комментариев пользователей')
+        if response:
+            return response
+        deleted = purge_comments(queryset)
+        self.message_user(request, f'Удалено комментариев: {deleted}')
+    purge_all_comments.short_description = 'Удалить все комментарии'
+    purge_all_comments.allowed_permissions = ('change',)
+
+
+admin.site.unregister(User)
+admin.site.register(User, UserAdmin)
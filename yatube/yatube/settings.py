@@ -57,10 +57,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -97,11 +98,48 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'timeout': 20,
+        },
     }
 }
 
+# Read replicas are SQLite copies of db.sqlite3 kept up to date outside
+# Django. To add one:
+# DATABASES['replica1'] = {
+#     **DATABASES['default'],
+#     'NAME': os.path.join(BASE_DIR, 'replica1.sqlite3'),
+#     'TEST': {'MIRROR': 'default'},
+# }
+# and list its alias in REPLICA_DATABASES.
+REPLICA_DATABASES = []
+
+# Seconds a session keeps reading from the primary after a write.
+REPLICA_STICKY_SECONDS = 5
+
+# Replicas lagging behind the primary by more seconds are not used.
+REPLICA_MAX_LAG = 2
+
+# Post and comment shards. Rows are placed by author, see core.sharding.
+# A shard is a SQLite database migrated like default, without foreign
+# key checks since users and groups stay in default:
+# DATABASES['shard1'] = {
+#     'ENGINE': 'core.db.sqlite3',
+#     'NAME': os.path.join(BASE_DIR, 'shard1.sqlite3'),
+#     'OPTIONS': {'pragmas': {'foreign_keys': 'OFF'}},
+# }
+# and list its alias in POST_SHARDS. Run rebalance_shards after changing
+# the list.
+POST_SHARDS = []
+
+DATABASE_ROUTERS = [
+    'core.routers.ShardRouter',
+    'core.routers.ReplicaRouter',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -151,12 +189,28 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# LRUCache keeps entries in process memory. To share one cache between
+# worker processes use 'core.cache_backends.SQLiteLRUCache' with
+# 'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3').
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.LRUCache',
+        'OPTIONS': {
+            'MAX_BYTES': 64 * 1024 * 1024,
+        },
     }
 }
+
+# Small writes (comments, follows) go through a single writer thread that
+# batches them into short transactions, see core.write_queue.
+WRITE_QUEUE_ENABLED = True
+
+# Sessions are read from the cache and written to the database in the
+# background, see core.sessions.
+SESSION_ENGINE = 'core.sessions'